@@ -0,0 +1,237 @@
+"""핫 패스 벤치마크
+
+    python bench/benchmark.py --rows 150 10000 1000000 --output results.json
+    python bench/benchmark.py --rows 10000 --baseline results.json --threshold 0.10
+
+결과는 JSON으로 저장하고, --baseline이 있으면 중앙값이 threshold보다 더 느려진
+항목을 표시하고 종료 코드 1을 돌려준다. 오류가 난 항목이 있어도 종료 코드는 1이다.
+"""
+from __future__ import annotations
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Optional,
+)
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import synthetic  # noqa: E402
+from cascade import CascadeHyperparameter  # noqa: E402
+from model import (  # noqa: E402
+    CD,
+    ED,
+    MD,
+    SD,
+    CountingDealingPartition,
+    Hyperparameter,
+    SampleReader,
+    ShufflingSamplePartition,
+    TrainingData,
+)
+
+
+Case = tuple[str, int, Callable[[], object]]
+
+
+def blocked_distances(algorithm: Any, queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+    """질의마다 가장 가까운 거리, distances()를 학습 행 묶음으로 나눠 불러
+    중간 배열이 Hyperparameter.block_budget개 거리를 넘지 않게 한다."""
+    step = max(1, Hyperparameter.block_budget // max(len(queries), 1))
+    nearest = np.full(len(queries), np.inf)
+    for start in range(0, len(training), step):
+        block = algorithm.distances(queries, training[start : start + step])
+        np.minimum(nearest, block.min(axis=1), out=nearest)
+    return nearest
+
+
+def timed(function: Callable[[], object], repeat: int) -> list[float]:
+    """한 번 예열한 뒤 repeat번 잰다."""
+    function()
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def cases(rows: int, workdir: Path, seed: int) -> list[Case]:
+    """rows 크기의 합성 데이터로 (이름, 처리 항목 수, 함수) 목록을 만든다."""
+    source = synthetic.write_csv(workdir / f"iris-{rows}.csv", rows, seed)
+    training_data = TrainingData(f"synthetic-{rows}")
+    training_data.load_csv(source)
+    queries = training_data.testing.features[:256]
+    sample = training_data.testing[0]
+    found: list[Case] = [
+        ("ingest.load_csv", rows, lambda: TrainingData("ingest").load_csv(source)),
+        ("ingest.sample_iter", rows, lambda: sum(1 for _ in SampleReader(source).Sample_iter())),
+    ]
+    training = training_data.training
+    pairs = min(len(training), 10_000)
+    for algorithm in (ED(), MD(), CD(), SD()):
+        name = type(algorithm).__name__
+        found.append((
+            f"distance.{name}.batch",
+            len(queries) * len(training),
+            lambda a=algorithm: blocked_distances(a, queries, training.features),
+        ))
+        found.append((
+            f"distance.{name}.scalar",
+            pairs,
+            lambda a=algorithm: [a.distance(sample, training[n]) for n in range(pairs)],
+        ))
+        parameter = Hyperparameter(5, algorithm, training_data)
+        if algorithm.metric is not None:
+            # KD-트리와 블록 스캔을 따로 재서 Hyperparameter.index_thresholds의 교차점을 찾는다.
+            for path, threshold in (("tree", 0), ("scan", len(training) + 1)):
+                forced = Hyperparameter(5, algorithm, training_data)
+                forced.index_thresholds = {algorithm.metric: threshold}
+                found.append((
+                    f"index.{name}.{path}",
+                    len(queries),
+                    lambda p=forced: p.neighbors(queries),
+                ))
+        found.append((f"classify.{name}.one", 1, lambda p=parameter: p.classify(sample)))
+        found.append((f"classify.{name}.scalar", 1, lambda p=parameter: p.classify_scalar(sample)))
+        found.append((
+            f"classify.{name}.block",
+            len(queries),
+            lambda p=parameter: p.classify_many(queries),
+        ))
+        cascade = CascadeHyperparameter(5, algorithm, training_data)
+        found.append((
+            f"classify.{name}.cascade",
+            len(queries),
+            lambda p=cascade: p.classify_many(queries),
+        ))
+        found.append((
+            f"test.{name}",
+            len(training_data.testing),
+            lambda p=parameter: p.test(),
+        ))
+    dicts = synthetic.sample_dicts(min(rows, 100_000), seed)
+    found.append((
+        "partition.shuffling",
+        len(dicts),
+        lambda: list(ShufflingSamplePartition(dicts).training),
+    ))
+    found.append((
+        "partition.counting_dealing",
+        len(dicts),
+        lambda: list(CountingDealingPartition(dicts).training),
+    ))
+    found.extend(flask_cases(training_data, queries))
+    return found
+
+
+def flask_cases(training_data: TrainingData, queries: np.ndarray) -> list[Case]:
+    """Flask 테스트 클라이언트로 엔드포인트를 잰다. 앱은 처음 쓸 때 가져온다."""
+    clients: list[Any] = []
+    batch = queries.tolist()
+
+    def client() -> Any:
+        if not clients:
+            import classifier
+
+            classifier.app.config["IRIS_DATA"] = training_data
+            classifier.app.config["IRIS_MODEL"] = Hyperparameter(5, ED(), training_data)
+            clients.append(classifier.app.test_client())
+        return clients[0]
+
+    return [
+        ("flask.get_iris", 1, lambda: client().get("/iris/setosa").get_data()),
+        ("flask.classify_batch", len(batch), lambda: client().post("/iris/classify", json=batch).get_data()),
+    ]
+
+
+def run(sizes: list[int], repeat: int, seed: int, only: Optional[str]) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sizes:
+            try:
+                found = cases(rows, Path(workdir), seed)
+            except Exception:
+                results[f"setup@{rows}"] = {"error": traceback.format_exc(limit=1)}
+                continue
+            for name, items, function in found:
+                key = f"{name}@{rows}"
+                if only and only not in key:
+                    continue
+                try:
+                    times = timed(function, repeat)
+                except Exception as ex:
+                    results[key] = {"error": f"{type(ex).__name__}: {ex}"}
+                    print(f"{key:40} error: {type(ex).__name__}: {ex}", file=sys.stderr)
+                    continue
+                median = statistics.median(times)
+                results[key] = {
+                    "median": median,
+                    "min": min(times),
+                    "items": items,
+                    "items_per_second": items / median if median else None,
+                }
+                print(f"{key:40} {median * 1e3:10.3f} ms  {items / median if median else 0:14.0f}/s")
+    return {
+        "meta": {
+            "created": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """기준보다 threshold 넘게 느려진 항목"""
+    slower: list[str] = []
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if not before or "median" not in before or "median" not in result:
+            continue
+        ratio = result["median"] / before["median"]
+        if ratio > 1 + threshold:
+            slower.append(f"{key}: {before['median'] * 1e3:.3f} ms -> {result['median'] * 1e3:.3f} ms ({ratio:.2f}x)")
+    return slower
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[150, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="이름에 이 문자열이 들어간 항목만 실행")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10)
+    options = parser.parse_args(argv)
+    current = run(options.rows, options.repeat, options.seed, options.only)
+    if options.output:
+        options.output.write_text(json.dumps(current, indent=2))
+    failed = [key for key, result in current["results"].items() if "error" in result]
+    for key in failed:
+        print(f"FAILED {key}: {current['results'][key]['error']}")
+    slower: list[str] = []
+    if options.baseline:
+        slower = compare(current, json.loads(options.baseline.read_text()), options.threshold)
+        for line in slower:
+            print(f"SLOWER {line}")
+    return 1 if failed or slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
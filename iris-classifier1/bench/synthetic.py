@@ -0,0 +1,72 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import (
+    Iterator,
+)
+
+import numpy as np
+
+
+SPECIES = ("Iris-setosa", "Iris-versicolor", "Iris-virginica")
+
+# 원래 아이리스 데이터셋의 품종별 평균과 표준편차 (꽃받침 길이, 꽃받침 폭, 꽃잎 길이, 꽃잎 폭)
+MEANS = np.array([
+    [5.006, 3.428, 1.462, 0.246],
+    [5.936, 2.770, 4.260, 1.326],
+    [6.588, 2.974, 5.552, 2.026],
+])
+STDS = np.array([
+    [0.352, 0.379, 0.174, 0.105],
+    [0.516, 0.314, 0.470, 0.198],
+    [0.636, 0.322, 0.552, 0.275],
+])
+
+
+def generate(rows: int, seed: int = 42) -> tuple[np.ndarray, np.ndarray]:
+    """아이리스와 비슷한 (rows, 4) 측정값과 품종 코드, 같은 seed면 같은 결과"""
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, len(SPECIES), size=rows)
+    features = rng.normal(MEANS[codes], STDS[codes])
+    return np.maximum(features, 0.1).round(1), codes
+
+
+def csv_lines(rows: int, seed: int = 42, chunk: int = 100_000) -> Iterator[str]:
+    """generate()와 같은 데이터를 CSV 덩어리로 만든다."""
+    features, codes = generate(rows, seed)
+    names = np.array(SPECIES)
+    for start in range(0, rows, chunk):
+        text = np.char.add(
+            np.char.add(_format(features[start : start + chunk]), names[codes[start : start + chunk]]),
+            "\n",
+        )
+        yield "".join(text.tolist())
+
+
+def _format(block: np.ndarray) -> np.ndarray:
+    columns = [np.char.mod("%.1f", block[:, n]) for n in range(block.shape[1])]
+    joined = columns[0]
+    for column in columns[1:]:
+        joined = np.char.add(np.char.add(joined, ","), column)
+    return np.char.add(joined, ",")
+
+
+def write_csv(target: Path, rows: int, seed: int = 42) -> Path:
+    with target.open("w") as target_file:
+        for text in csv_lines(rows, seed):
+            target_file.write(text)
+    return target
+
+
+def sample_dicts(rows: int, seed: int = 42) -> list[dict[str, object]]:
+    """파티션 클래스에 넣을 SampleDict 목록"""
+    features, codes = generate(rows, seed)
+    return [
+        {
+            "sepal_length": row[0],
+            "sepal_width": row[1],
+            "petal_length": row[2],
+            "petal_width": row[3],
+            "species": SPECIES[code],
+        }
+        for row, code in zip(features.tolist(), codes.tolist())
+    ]
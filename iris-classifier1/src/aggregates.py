@@ -0,0 +1,135 @@
+from __future__ import annotations
+from typing import (
+    Any,
+    Optional,
+    Sequence,
+)
+
+import numpy as np
+
+
+class SpeciesAggregates:
+    """품종별 특성의 개수, 평균, 최솟값/최댓값, 분산
+
+    평균과 분산은 (개수, 평균, 편차 제곱합)으로 들고 있다가 새 행 묶음의 같은 값과
+    합친다(Welford/Chan 결합). 그래서 행을 더할 때 이미 센 행은 다시 읽지 않는다.
+    """
+
+    def __init__(self, features: int) -> None:
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros((0, features))
+        self.m2 = np.zeros((0, features))
+        self.minimum = np.full((0, features), np.inf)
+        self.maximum = np.full((0, features), -np.inf)
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    def _grow(self, species: int) -> None:
+        extra = species - len(self.count)
+        if extra <= 0:
+            return
+        features = self.mean.shape[1]
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros((extra, features))])
+        self.m2 = np.concatenate([self.m2, np.zeros((extra, features))])
+        self.minimum = np.concatenate([self.minimum, np.full((extra, features), np.inf)])
+        self.maximum = np.concatenate([self.maximum, np.full((extra, features), -np.inf)])
+
+    def _combine(
+        self,
+        code: int,
+        count: int,
+        mean: np.ndarray,
+        m2: np.ndarray,
+        minimum: np.ndarray,
+        maximum: np.ndarray,
+    ) -> None:
+        total = self.count[code] + count
+        delta = mean - self.mean[code]
+        self.mean[code] += delta * (count / total)
+        self.m2[code] += m2 + delta * delta * (self.count[code] * count / total)
+        self.count[code] = total
+        np.minimum(self.minimum[code], minimum, out=self.minimum[code])
+        np.maximum(self.maximum[code], maximum, out=self.maximum[code])
+
+    def add(self, values: np.ndarray, codes: np.ndarray) -> None:
+        """(n, features) 측정값과 품종 코드 묶음을 더한다."""
+        if not len(codes):
+            return
+        self._grow(int(codes.max()) + 1)
+        for code in np.unique(codes).tolist():
+            block = values[codes == code]
+            mean = block.mean(axis=0)
+            self._combine(
+                code,
+                len(block),
+                mean,
+                ((block - mean) ** 2).sum(axis=0),
+                block.min(axis=0),
+                block.max(axis=0),
+            )
+
+    def discard(self, value: np.ndarray, code: int) -> bool:
+        """값 하나를 뺀다. 그 값이 최솟값이나 최댓값이었으면 False, 그 품종은 다시 세어야 한다."""
+        count = self.count[code] - 1
+        if count == 0:
+            self.reset(code)
+            return True
+        mean = (self.mean[code] * self.count[code] - value) / count
+        self.m2[code] = np.maximum(self.m2[code] - (value - self.mean[code]) * (value - mean), 0.0)
+        self.mean[code] = mean
+        self.count[code] = count
+        return not ((value <= self.minimum[code]) | (value >= self.maximum[code])).any()
+
+    def reset(self, code: int) -> None:
+        self.count[code] = 0
+        self.mean[code] = self.m2[code] = 0.0
+        self.minimum[code] = np.inf
+        self.maximum[code] = -np.inf
+
+    def merged(self, other: "SpeciesAggregates") -> "SpeciesAggregates":
+        """두 집계를 합친 새 집계, 행을 다시 읽지 않는다."""
+        result = SpeciesAggregates(self.mean.shape[1])
+        result._grow(max(len(self), len(other)))
+        for source in (self, other):
+            for code in np.flatnonzero(source.count).tolist():
+                result._combine(
+                    code,
+                    int(source.count[code]),
+                    source.mean[code],
+                    source.m2[code],
+                    source.minimum[code],
+                    source.maximum[code],
+                )
+        return result
+
+    def variance(self) -> np.ndarray:
+        """표본 분산, 샘플이 둘 미만인 품종은 nan"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count[:, np.newaxis] > 1, self.m2 / (self.count[:, np.newaxis] - 1), np.nan)
+
+    def summary(self, names: Sequence[str], features: Sequence[str]) -> dict[str, Any]:
+        """JSON으로 보낼 품종 이름별 {count, features: {특성: {mean, min, max, variance}}}"""
+        variance = self.variance()
+
+        def number(value: float) -> Optional[float]:
+            return None if np.isnan(value) else float(value)
+
+        result: dict[str, Any] = {}
+        for code, name in enumerate(names[: len(self)]):
+            if not self.count[code]:
+                continue
+            result[name] = {
+                "count": int(self.count[code]),
+                "features": {
+                    feature: {
+                        "mean": float(self.mean[code, column]),
+                        "min": float(self.minimum[code, column]),
+                        "max": float(self.maximum[code, column]),
+                        "variance": number(variance[code, column]),
+                    }
+                    for column, feature in enumerate(features)
+                },
+            }
+        return result
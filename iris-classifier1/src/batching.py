@@ -0,0 +1,226 @@
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Optional,
+    Sequence,
+    Union,
+)
+
+import numpy as np
+
+from model import ED, Hyperparameter, InvalidSampleError, TrainingData, parse_measurements
+
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """단건 분류 요청을 대기열에 모아 한 번의 배치 거리 계산으로 처리한다.
+
+    첫 요청이 들어온 뒤 window초가 지나거나 max_batch개가 모이면 배치를 보낸다.
+    배치 분류가 실패하면 한 요청씩 다시 분류해 실패한 요청만 그 예외로 끝낸다.
+    stop()하면 아직 답하지 못한 요청은 모두 RuntimeError로 끝나고, 다시 start()할 수 있다.
+    """
+
+    def __init__(
+        self, parameter: Hyperparameter, window: float = 0.002, max_batch: int = 256
+    ) -> None:
+        self.parameter = parameter
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._queue: Optional[asyncio.Queue[tuple[list[float], asyncio.Future[str]]]] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._batch: list[tuple[list[float], asyncio.Future[str]]] = []
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        queue, self._queue = self._queue, None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pending = self._batch
+        self._batch = []
+        while queue is not None and not queue.empty():
+            pending.append(queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("MicroBatcher stopped"))
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def classify(self, measurements: Sequence[float]) -> str:
+        """한 샘플을 대기열에 넣고 자기 배치의 결과를 기다린다."""
+        if self._queue is None:
+            raise RuntimeError("MicroBatcher is not started")
+        future: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(measurements), future))
+        return await future
+
+    async def _collect(self) -> list[tuple[list[float], asyncio.Future[str]]]:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        # stop()이 모으던 요청도 끝낼 수 있게 self._batch에 바로 쌓는다.
+        batch = self._batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _classify_each(self, features: np.ndarray) -> list[Union[str, Exception]]:
+        """요청마다의 품종, 배치가 실패하면 한 행씩 다시 분류해 실패한 행은 예외로 둔다."""
+        try:
+            return list(self.parameter.classify_many(features))
+        except Exception:
+            pass
+        results: list[Union[str, Exception]] = []
+        for row in features:
+            try:
+                results.append(self.parameter.classify_many(row[np.newaxis])[0])
+            except Exception as ex:
+                results.append(ex)
+        return results
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            features = np.array([measurements for measurements, _ in batch])
+            try:
+                results = await loop.run_in_executor(self._executor, self._classify_each, features)
+            except Exception as ex:
+                self._batch = []
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(ex)
+                continue
+            self._batch = []
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, future), species in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(species, Exception):
+                    future.set_exception(species)
+                else:
+                    future.set_result(species)
+
+
+class BatchingApp:
+    """POST /iris/classify/one 요청을 MicroBatcher로 모아 처리하는 ASGI 앱"""
+
+    path = "/iris/classify/one"
+
+    def __init__(
+        self, batcher: MicroBatcher, training_data: Optional[TrainingData] = None
+    ) -> None:
+        self.batcher = batcher
+        # Hyperparameter는 약한 참조만 가지므로 데이터를 여기서 붙잡아 둔다.
+        self.training_data = training_data
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if scope["path"] != self.path:
+            await self._respond(send, 404, {"error": "not found"})
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, {"error": "method not allowed"})
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            measurements = parse_measurements(json.loads(body))
+        except ValueError as ex:
+            await self._respond(send, 400, {"error": str(ex)})
+            return
+        try:
+            species = await self.batcher.classify(measurements)
+        except InvalidSampleError as ex:
+            await self._respond(send, 400, {"error": str(ex)})
+            return
+        except Exception:
+            logger.exception("classifying %r failed", measurements)
+            await self._respond(send, 500, {"error": "classification failed"})
+            return
+        await self._respond(send, 200, {"species": species})
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _respond(send: Send, status: int, payload: dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_app(
+    source: Path, k: int = 5, window: float = 0.002, max_batch: int = 256
+) -> BatchingApp:
+    """이진 데이터셋을 열어 마이크로배칭 ASGI 앱을 만든다."""
+    training_data = TrainingData.open(source)
+    parameter = Hyperparameter(k, ED(), training_data)
+    return BatchingApp(MicroBatcher(parameter, window, max_batch), training_data)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(create_app(Path(sys.argv[1])), host="127.0.0.1", port=8000)
@@ -0,0 +1,227 @@
+from __future__ import annotations
+import itertools
+import time
+from typing import (
+    Optional,
+)
+
+import numpy as np
+
+from index import METRICS, supports
+import metrics
+from model import Distance, Hyperparameter, TrainingData, vote
+
+
+def _shift(mask: np.ndarray, offset: tuple[int, ...]) -> tuple[tuple[slice, ...], tuple[slice, ...]]:
+    """out[i + offset] = mask[i]가 되도록 잘라 낸 (대상, 원본) 조각"""
+    target = tuple(slice(max(0, s), n - max(0, -s)) for s, n in zip(offset, mask.shape))
+    source = tuple(slice(max(0, -s), n - max(0, s)) for s, n in zip(offset, mask.shape))
+    return target, source
+
+
+def _dilate(mask: np.ndarray, offsets: list[tuple[int, ...]]) -> np.ndarray:
+    grown = np.zeros_like(mask)
+    for offset in offsets:
+        if any(abs(s) >= n for s, n in zip(offset, mask.shape)):
+            continue
+        target, source = _shift(mask, offset)
+        grown[target] |= mask[source]
+    return grown
+
+
+class CellTable:
+    """학습 데이터를 한 변이 width인 격자 칸으로 나누고, 안의 어느 질의든 k개 이웃이
+    한 품종뿐임이 확실한 칸에 그 품종을 적어 둔 표
+
+    칸 c 안에 살아 있는 품종 A 샘플이 k개 이상 있으면, c 안의 질의에서 그 샘플들까지는
+    칸의 지름 D 이하다. 다른 품종 샘플이 있는 칸들이 모두 c와 D보다 멀리 떨어져 있으면
+    (두 칸 사이의 최소 거리 > D) k개 이웃은 모두 A이고, k-NN의 투표도 거리가 같은 샘플을
+    어떻게 고르든 A가 된다. 칸 사이 거리가 D 이하인 칸 모음은 칸 하나 두께의 상자와 거리 D
+    안의 정수 오프셋의 합이므로, 다른 품종 점유 격자를 그만큼 팽창시켜 빼면 된다.
+    삼각 부등식이 성립하는 거리(ED, MD, CD)에서만 쓸 수 있다.
+
+    만든 뒤에 더하거나 지운 샘플은 update()로 반영한다. 표가 틀리지 않게 인증을
+    지우기만 하므로, updates가 쌓이면 다시 만들어야 덮는 비율이 돌아온다.
+    """
+
+    max_cells = 1 << 20
+
+    def __init__(
+        self, points: np.ndarray, codes: np.ndarray, species: int, k: int, metric: str, width: float
+    ) -> None:
+        reduce = METRICS[metric]
+        points = points.astype(np.float64)
+        self.origin = points.min(axis=0)
+        extent = points.max(axis=0) - self.origin
+        cells = np.prod(np.floor(extent / width) + 1)
+        if cells > self.max_cells:
+            width *= (cells / self.max_cells) ** (1 / points.shape[1])
+        self.width = float(width)
+        self.k = k
+        self.rows = len(codes)
+        self.updates = 0
+        keys = self._keys(points)
+        self.shape = tuple((keys.max(axis=0) + 1).tolist())
+        size = int(np.prod(self.shape))
+        flat = np.ravel_multi_index(tuple(keys.T), self.shape)
+        counts = np.bincount(codes.astype(np.intp) * size + flat, minlength=species * size)
+        counts = counts.reshape(species, *self.shape)
+        # 칸 지름을 칸 단위로 잰 거리 안의 정수 오프셋, 여기에 칸 하나 두께를 더하면 너무 가까운 칸들이다.
+        diameter = float(reduce(np.ones(points.shape[1])))
+        radius = int(diameter)
+        # 샘플 하나가 인증에 영향을 주는 칸은 축마다 이만큼 안에 있다.
+        self.reach = radius + 1
+        box = list(itertools.product((-1, 0, 1), repeat=points.shape[1]))
+        candidates = np.array(list(itertools.product(range(-radius, radius + 1), repeat=points.shape[1])))
+        ball = [tuple(offset) for offset in candidates[reduce(candidates) <= diameter + 1e-9].tolist()]
+        occupied = counts > 0
+        near = np.stack([_dilate(_dilate(occupied[code], box), ball) for code in range(species)])
+        self.counts = counts
+        self.table = np.full(self.shape, -1, dtype=np.int8)
+        for code in range(species):
+            others = np.delete(near, code, axis=0).any(axis=0)
+            self.table[(counts[code] >= k) & ~others] = code
+        self.certified = int((self.table >= 0).sum())
+        # 학습 샘플 분포를 질의 분포 삼아, 인증된 칸에 든 샘플의 비율로 이 표의 쓸모를 잰다.
+        self.coverage = float(
+            sum(counts[code][self.table == code].sum() for code in range(species)) / len(codes)
+        )
+
+    def _keys(self, points: np.ndarray) -> np.ndarray:
+        return np.floor((points - self.origin) / self.width).astype(np.intp)
+
+    def update(self, point: np.ndarray, code: int, added: bool) -> None:
+        """학습 샘플 하나를 더하거나 지운 뒤에도 표가 k-NN과 같은 답을 내도록 고친다.
+
+        더하면 그 샘플 둘레 reach칸 안에서 다른 품종으로 인증된 칸을 지운다. 지우면
+        그 칸의 그 품종 샘플이 k개보다 적어졌을 때만 그 칸을 지운다. 다른 품종 샘플이
+        사라져 새로 인증할 수 있게 된 칸은 다시 만들 때까지 그대로 둔다.
+        """
+        self.updates += 1
+        key = self._keys(np.asarray(point, dtype=np.float64)[np.newaxis])[0]
+        cell = tuple(key.tolist())
+        inside = bool(((key >= 0) & (key < np.array(self.shape))).all()) and code < len(self.counts)
+        if added:
+            if inside:
+                self.counts[code][cell] += 1
+            window = tuple(slice(max(0, c - self.reach), max(0, c + self.reach + 1)) for c in cell)
+            block = self.table[window]
+            cleared = (block >= 0) & (block != code)
+            block[cleared] = -1
+            self.certified -= int(cleared.sum())
+        elif inside:
+            self.counts[code][cell] -= 1
+            if self.table[cell] == code and self.counts[code][cell] < self.k:
+                self.table[cell] = -1
+                self.certified -= 1
+
+    def lookup(self, queries: np.ndarray) -> np.ndarray:
+        """질의마다 확실한 품종 코드, 표에 없으면 -1"""
+        keys = self._keys(queries.astype(np.float64))
+        inside = ((keys >= 0) & (keys < np.array(self.shape))).all(axis=1)
+        codes = np.full(len(queries), -1, dtype=np.intp)
+        codes[inside] = self.table[tuple(keys[inside].T)]
+        return codes
+
+
+class CascadeHyperparameter(Hyperparameter):
+    """격자 칸 조회로 확실한 질의를 먼저 답하고, 나머지만 정확한 k-NN으로 넘기는 Hyperparameter
+
+    CellTable이 인증한 칸의 답은 k-NN의 답과 항상 같으므로 quality가 떨어지지 않는다.
+    test()는 이를 확인하려고 전체 k-NN도 돌려 baseline과 agreement를 남긴다.
+    stages에는 단계별로 답한 질의 수가 쌓인다. width는 측정값 단위(cm)의 칸 크기이고,
+    주지 않으면 widths 가운데 학습 샘플을 가장 많이 덮는 것을 고른다.
+    학습 데이터가 바뀌면 표를 고쳐 쓰고, 고친 횟수가 만들 때 행 수의 rebuild_fraction을
+    넘거나 TrainingData에 변경 기록이 모자랄 때만 다시 만든다.
+    """
+
+    widths = (0.1, 0.2, 0.4, 0.8)
+    rebuild_fraction = 0.1
+
+    def __init__(
+        self,
+        k: int,
+        algorithm: Distance,
+        training: TrainingData,
+        width: Optional[float] = None,
+    ) -> None:
+        super().__init__(k, algorithm, training)
+        self.width = width
+        self.stages = {"cell": 0, "knn": 0}
+        self.baseline: float
+        self.agreement: float
+        self._table: Optional[tuple[int, CellTable]] = None
+
+    def cells(self) -> Optional[CellTable]:
+        """학습 데이터 위의 칸 표"""
+        if not supports(self.algorithm.metric):
+            return None
+        training_data = self._training_data()
+        if self._table is not None and self._table[0] != training_data.version:
+            self._table = self._updated(training_data, *self._table)
+        if self._table is None:
+            training = training_data.training
+            features, codes = training.live_arrays()
+            if not len(codes):
+                return None
+            tables = (
+                CellTable(
+                    features,
+                    codes,
+                    len(training_data.species),
+                    min(self.k, len(codes)),
+                    str(self.algorithm.metric),
+                    width * (training.scale or 1),
+                )
+                for width in ((self.width,) if self.width is not None else self.widths)
+            )
+            self._table = (training_data.version, max(tables, key=lambda table: table.coverage))
+        return self._table[1]
+
+    def _updated(
+        self, training_data: TrainingData, version: int, table: CellTable
+    ) -> Optional[tuple[int, CellTable]]:
+        """version 이후의 변경을 반영한 표, 다시 만들어야 하면 None"""
+        changes = training_data.changes_since(version)
+        if changes is None or table.updates + len(changes) > self.rebuild_fraction * table.rows:
+            return None
+        training = training_data.training
+        for row, added in changes:
+            table.update(training.features[row], int(training.codes[row]), added)
+        return training_data.version, table
+
+    def classify_codes(self, queries: np.ndarray) -> np.ndarray:
+        table = self.cells()
+        if table is None:
+            codes = super().classify_codes(queries)
+            self._count(0, len(codes))
+            return codes
+        codes = table.lookup(self._training_data().training.encode(queries))
+        rest = np.flatnonzero(codes < 0)
+        if len(rest):
+            codes[rest] = super().classify_codes(queries[rest])
+        self._count(len(codes) - len(rest), len(rest))
+        return codes
+
+    def _count(self, cell: int, knn: int) -> None:
+        self.stages["cell"] += cell
+        self.stages["knn"] += knn
+        metrics.count(metrics.CASCADE_ANSWERS, cell, "cell")
+        metrics.count(metrics.CASCADE_ANSWERS, knn, "knn")
+
+    def test(self) -> None:
+        """캐스케이드로 테스트하고, 비교용 전체 k-NN의 quality(baseline)와 일치율을 남긴다.
+
+        elapsed에는 칸 표를 만드는 시간과 비교용 k-NN 시간이 들어가지 않는다.
+        """
+        training_data = self._training_data()
+        self.cells()
+        testing = training_data.testing
+        start = time.perf_counter()
+        testing.classification[:] = self.classify_codes(testing.features)
+        self.quality = float(np.mean(testing.matches()))
+        self.elapsed = time.perf_counter() - start
+        exact = vote(training_data.training.codes[self.neighbors(testing.features)], len(training_data.species))
+        rows = testing.live_rows()
+        self.baseline = float(np.mean(exact[rows] == testing.codes[rows]))
+        self.agreement = float(np.mean(exact[rows] == testing.classification[rows]))
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import bisect
+import re
+from typing import (
+    Generic,
+    Iterable,
+    Optional,
+    TypeVar,
+)
+
+
+Value = TypeVar("Value")
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def words(name: str) -> set[str]:
+    """검색 키로 쓸 소문자 단어들, "Iris-setosa"는 iris와 setosa"""
+    return {word.lower() for word in _WORD.findall(name)}
+
+
+class PrefixIndex(Generic[Value]):
+    """이름의 단어 앞부분으로 찾는 색인
+
+    (단어, 순번) 쌍을 정렬된 목록에 두고 이분 탐색하므로, 한 쪽을 찾는 데
+    드는 시간은 항목 수가 아니라 log(항목 수)와 쪽 크기에 비례한다.
+    항목은 prefix로 시작하는 자기 단어 중 정렬 순서로 첫 단어의 키에서만 나오므로,
+    여러 단어가 맞아도 쪽을 넘기며 한 번만 나온다.
+    """
+
+    def __init__(self, entries: Iterable[tuple[str, Value]] = ()) -> None:
+        self._names: list[str] = []
+        self._values: list[Value] = []
+        self._words: list[list[str]] = []
+        self._keys: list[tuple[str, int]] = []
+        for name, value in entries:
+            serial = self._store(name, value)
+            self._keys.extend((word, serial) for word in words(name))
+        self._keys.sort()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _store(self, name: str, value: Value) -> int:
+        self._names.append(name)
+        self._values.append(value)
+        self._words.append(sorted(words(name)))
+        return len(self._values) - 1
+
+    def add(self, name: str, value: Value) -> None:
+        serial = self._store(name, value)
+        for word in words(name):
+            bisect.insort(self._keys, (word, serial))
+
+    def _first(self, position: int, prefix: str) -> bool:
+        """position의 키가 그 항목에서 prefix로 시작하는 첫 단어인지"""
+        word, serial = self._keys[position]
+        return next(other for other in self._words[serial] if other.startswith(prefix)) == word
+
+    def search(
+        self, prefix: str, offset: int = 0, limit: int = 20
+    ) -> tuple[list[tuple[str, Value]], Optional[int]]:
+        """prefix로 시작하는 단어가 있는 항목 한 쪽과 다음 쪽의 offset (없으면 None)
+
+        offset은 앞 쪽이 돌려준 값을 그대로 넘기는 위치로, 항목 수가 아니다.
+        """
+        prefix = prefix.lower()
+        base = bisect.bisect_left(self._keys, (prefix, -1))
+        found: list[tuple[str, Value]] = []
+        position = base + offset
+        while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+            if self._first(position, prefix):
+                if len(found) == limit:
+                    return found, position - base
+                serial = self._keys[position][1]
+                found.append((self._names[serial], self._values[serial]))
+            position += 1
+        return found, None
@@ -1,9 +1,13 @@
 from __future__ import annotations
 import csv
+import json
+import threading
+import uuid
 from enum import Enum, auto
 from functools import wraps
 from pathlib import Path
 from typing import (
+    Any,
     cast,
     Optional,
     Callable,
@@ -15,18 +19,422 @@ from typing import (
     Mapping
 )
 
-from flask import Flask
+from flask import Flask, Response, current_app, g, jsonify, request
+import numpy as np
+
+import metrics
+from profiling import MODES, RequestProfiler
+
+from catalog import PrefixIndex
+from model import (
+    ED,
+    FEATURES,
+    Distance,
+    Hyperparameter,
+    PredictionCache,
+    Purpose,
+    TrainingData,
+    parse_measurements,
+)
+from users import PUBLIC_FIELDS, DuplicateUserError, UserStore
 
 app = Flask(__name__)
+app.config.setdefault("MAX_BATCH_SIZE", 10_000)
+app.config.setdefault("CLASSIFY_BLOCK_SIZE", 1_024)
+app.config.setdefault("PREDICTION_CACHE", PredictionCache())
+app.config.setdefault("PAGE_SIZE", 20)
+app.config.setdefault("MAX_PAGE_SIZE", 100)
+app.config.setdefault("LIST_PAGE_SIZE", 1_000)
+app.config.setdefault("MAX_LIST_PAGE_SIZE", 100_000)
+# prefork의 작업 프로세스들이 같은 사용자를 보도록 파일에 저장한다.
+app.config.setdefault("USER_DATABASE", "users.sqlite3")
+app.config.setdefault("USER_POOL_SIZE", 4)
+# off: 프로파일하지 않는다, header: X-Profile 머리글이 있는 요청만, all: 모든 요청
+app.config.setdefault("PROFILING", "off")
+app.config.setdefault("PROFILE_MODE", "sample")
+app.config.setdefault("PROFILE_DIRECTORY", "profiles")
+app.config.setdefault("PROFILE_MIN_INTERVAL", 10.0)
+app.config.setdefault("PROFILE_KEEP", 100)
+
+_user_store_lock = threading.Lock()
+_profiler_lock = threading.Lock()
+
+
+def load_model(source: Path, k: int = 5, algorithm: Optional[Distance] = None) -> Hyperparameter:
+    """이진 데이터셋을 열어 분류에 쓸 Hyperparameter를 앱에 등록한다."""
+    training_data = TrainingData.open(source)
+    parameter = Hyperparameter(k, algorithm or ED(), training_data)
+    _register(training_data, parameter)
+    return parameter
+
+
+def load_snapshot(source: Path, verify: bool = True) -> Hyperparameter:
+    """모델 스냅숏을 열어 저장된 Hyperparameter와 색인을 그대로 앱에 등록한다."""
+    training_data, parameter = TrainingData.open_model(source, verify)
+    _register(training_data, parameter)
+    return parameter
+
+
+def load(source: Path, k: int = 5, verify: bool = True) -> Hyperparameter:
+    """스냅숏이면 저장된 Hyperparameter를, 이진 데이터셋이면 k-NN(ED)을 앱에 등록한다."""
+    training_data, parameter = TrainingData.open_source(source, verify)
+    if parameter is None:
+        parameter = Hyperparameter(k, ED(), training_data)
+    _register(training_data, parameter)
+    return parameter
+
+
+def _register(training_data: TrainingData, parameter: Hyperparameter) -> None:
+    parameter.cache = app.config["PREDICTION_CACHE"]
+    app.config["IRIS_DATA"] = training_data
+    app.config["IRIS_MODEL"] = parameter
+    app.config["SPECIES_INDEX"] = PrefixIndex(
+        (name, code) for code, name in enumerate(training_data.species.names)
+    )
+
+
+def user_store() -> UserStore:
+    """이 프로세스의 사용자 저장소, SQLite 연결은 fork를 넘기면 안 되므로 처음 쓸 때 연다."""
+    store: Optional[UserStore] = current_app.config.get("USER_STORE")
+    if store is None:
+        with _user_store_lock:
+            store = current_app.config.get("USER_STORE")
+            if store is None:
+                store = current_app.config["USER_STORE"] = UserStore(
+                    current_app.config["USER_DATABASE"], current_app.config["USER_POOL_SIZE"]
+                )
+    return store
+
+
+def _page_size() -> int:
+    limit = request.args.get("limit", current_app.config["PAGE_SIZE"], type=int)
+    return max(1, min(limit, current_app.config["MAX_PAGE_SIZE"]))
+
+
+def _purpose(default: Optional[str] = None) -> Optional[Purpose]:
+    name = request.args.get("purpose", default)
+    if name is None:
+        return None
+    if name not in ("training", "testing"):
+        raise ValueError(f"purpose must be training or testing, not {name!r}")
+    return Purpose.Training if name == "training" else Purpose.Testing
+
+
+def _strings(body: dict[str, Any], fields: Sequence[str]) -> dict[str, str]:
+    """body의 fields 값들, 빠진 필드는 빈 문자열이고 문자열이 아니면 ValueError"""
+    values: dict[str, str] = {}
+    for field in fields:
+        value = body.get(field, "")
+        if not isinstance(value, str):
+            raise ValueError(f"{field} must be a string")
+        values[field] = value
+    return values
+
+
+def _cursor(text: Optional[str]) -> Optional[tuple[str, str]]:
+    """search_users가 next로 돌려준 [이름 키, 사용자 이름], 아니면 ValueError"""
+    if not text:
+        return None
+    try:
+        cursor = json.loads(text)
+    except ValueError:
+        cursor = None
+    if not (
+        isinstance(cursor, list) and len(cursor) == 2 and all(isinstance(part, str) for part in cursor)
+    ):
+        raise ValueError(f"invalid cursor {text!r}")
+    return cursor[0], cursor[1]
+
+
+def _caller() -> Optional[str]:
+    """HTTP Basic 인증이 맞으면 그 사용자 이름"""
+    credentials = request.authorization
+    if credentials is None or not credentials.username or credentials.password is None:
+        return None
+    if not user_store().authenticate(credentials.username, credentials.password):
+        return None
+    return credentials.username
+
+
+class _UnparsableLine(ValueError):
+    pass
+
+
+@app.before_request
+def _start_timer():
+    if metrics.enabled:
+        g.metrics_timer = metrics.timer(metrics.REQUEST_SECONDS, request.endpoint or "unknown")
+        g.metrics_timer.__enter__()
+
+
+@app.teardown_request
+def _stop_timer(exc):
+    timer = g.pop("metrics_timer", None)
+    if timer is not None:
+        timer.__exit__(None, None, None)
+
+
+def _profiler() -> RequestProfiler:
+    profiler: Optional[RequestProfiler] = current_app.config.get("PROFILER")
+    if profiler is None:
+        with _profiler_lock:
+            profiler = current_app.config.get("PROFILER")
+            if profiler is None:
+                profiler = current_app.config["PROFILER"] = RequestProfiler(
+                    Path(current_app.config["PROFILE_DIRECTORY"]),
+                    current_app.config["PROFILE_MIN_INTERVAL"],
+                    current_app.config["PROFILE_KEEP"],
+                )
+    return profiler
 
-@app.route('user/<user_name>')
+
+@app.before_request
+def _start_profile():
+    setting = current_app.config["PROFILING"]
+    if setting == "off":
+        return
+    mode = request.headers.get("X-Profile")
+    if setting == "header" and not mode:
+        return
+    if mode not in MODES:
+        mode = current_app.config["PROFILE_MODE"]
+    request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    session = _profiler().start(request_id, mode)
+    if session is not None:
+        g.profile = session
+
+
+@app.after_request
+def _attach_profile(response: Response) -> Response:
+    # 스트리밍 응답은 본문을 다 보낸 뒤에야 끝나므로, 프로파일도 응답이 닫힐 때 멈춘다.
+    session = g.pop("profile", None)
+    if session is not None:
+        response.headers["X-Profile-Id"] = session.target.name
+        response.call_on_close(session.finish)
+    return response
+
+
+@app.teardown_request
+def _stop_profile(exc):
+    session = g.pop("profile", None)
+    if session is not None:
+        session.finish()
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 텍스트 형식의 지표"""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _measurements(row: object) -> list[float]:
+    if isinstance(row, _UnparsableLine):
+        raise row
+    return parse_measurements(row)
+
+
+def _parse_line(line: str) -> object:
+    try:
+        return json.loads(line)
+    except ValueError as ex:
+        return _UnparsableLine(f"invalid JSON: {ex}")
+
+
+def _read_batch() -> list[object]:
+    if request.mimetype == "application/x-ndjson":
+        return [
+            _parse_line(line) for line in request.get_data(as_text=True).splitlines()
+            if line.strip()
+        ]
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise ValueError("expected a JSON array")
+    return rows
+
+@app.route('/user/<user_name>')
 def get_user(user_name):
-    return user_name
+    """사용자 이름과 이름, 본인으로 인증한 요청이면 email, role, interest도 준다."""
+    user = user_store().get(user_name)
+    if user is None:
+        return jsonify(error=f"no user {user_name!r}"), 404
+    if _caller() != user_name:
+        user = {field: user[field] for field in PUBLIC_FIELDS}
+    return jsonify(user)
+
+@app.route('/user', methods=['POST'])
+def add_user():
+    """JSON 본문의 username, password, name, email, role, interest로 사용자를 만든다."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error="expected a JSON object"), 400
+    try:
+        user_store().add(**_strings(body, ("username", "password", "name", "email", "role", "interest")))
+    except DuplicateUserError as ex:
+        return jsonify(error=str(ex)), 409
+    except ValueError as ex:
+        return jsonify(error=str(ex)), 400
+    return jsonify(username=body["username"]), 201
+
+@app.route('/login', methods=['POST'])
+def login():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error="expected a JSON object"), 400
+    try:
+        username, password = _strings(body, ("username", "password")).values()
+    except ValueError as ex:
+        return jsonify(error=str(ex)), 400
+    if not user_store().authenticate(username, password):
+        return jsonify(error="invalid username or password"), 401
+    return jsonify(username=username)
+
+@app.route('/users/search')
+def search_users():
+    """이름 앞부분으로 사용자를 찾는다. 다음 쪽은 응답의 next를 cursor로 넘긴다.
+
+    결과에는 공개 필드(사용자 이름, 이름)만 담는다.
+    """
+    try:
+        after = _cursor(request.args.get("cursor"))
+    except ValueError as ex:
+        return jsonify(error=str(ex)), 400
+    limit = _page_size()
+    found = user_store().search(request.args.get("q", ""), after, limit)
+    last = found[-1] if len(found) == limit else None
+    return jsonify(
+        results=[{field: user[field] for field in PUBLIC_FIELDS} for user in found],
+        next=json.dumps([last["name_key"], last["username"]]) if last else None,
+    )
+
+@app.route('/iris/search')
+def search_irises():
+    """품종 이름의 단어 앞부분으로 찾는다. 다음 쪽은 응답의 next를 offset으로 넘긴다."""
+    index: Optional[PrefixIndex[int]] = current_app.config.get("SPECIES_INDEX")
+    if index is None:
+        return jsonify(error="no model loaded"), 503
+    found, following = index.search(
+        request.args.get("q", ""), request.args.get("offset", 0, type=int), _page_size()
+    )
+    return jsonify(results=[{"species": name} for name, _ in found], next=following)
+
+@app.route('/iris/stats')
+def iris_statistics():
+    """품종별 네 특성의 개수, 평균, 최솟값/최댓값, 분산, purpose로 학습이나 테스트만 본다."""
+    training_data: Optional[TrainingData] = current_app.config.get("IRIS_DATA")
+    if training_data is None:
+        return jsonify(error="no model loaded"), 503
+    try:
+        purpose = _purpose()
+    except ValueError as ex:
+        return jsonify(error=str(ex)), 400
+    aggregates = training_data.statistics(purpose)
+    return jsonify(aggregates.summary(training_data.species.names, FEATURES))
+
+@app.route('/iris/list')
+def list_irises():
+    """측정값을 한 줄에 한 행씩 NDJSON으로 흘려보낸다.
+    
+    purpose(기본 training)와 species로 거르고 offset, limit으로 쪽을 나눈다.
+    다음 쪽이 있으면 그 offset을 X-Next-Offset 헤더로 알려 준다.
+    """
+    training_data: Optional[TrainingData] = current_app.config.get("IRIS_DATA")
+    if training_data is None:
+        return jsonify(error="no model loaded"), 503
+    try:
+        purpose = _purpose("training")
+    except ValueError as ex:
+        return jsonify(error=str(ex)), 400
+    store = training_data.training if purpose == Purpose.Training else training_data.testing
+    rows = store.live_rows()
+    species = request.args.get("species")
+    if species is not None:
+        code = training_data.species.find(species)
+        if code is None:
+            return jsonify(error=f"no species {species!r}"), 404
+        rows = rows[store.codes[rows] == code]
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = request.args.get("limit", current_app.config["LIST_PAGE_SIZE"], type=int)
+    limit = max(1, min(limit, current_app.config["MAX_LIST_PAGE_SIZE"]))
+    page = rows[offset : offset + limit]
+    names = training_data.species.names
+    block_size = current_app.config["CLASSIFY_BLOCK_SIZE"]
+    
+    def lines() -> Iterator[str]:
+        for start in range(0, len(page), block_size):
+            block = page[start : start + block_size]
+            values = store.decode(store.features[block]).tolist()
+            for row, measurements, code in zip(block.tolist(), values, store.codes[block].tolist()):
+                sample: dict[str, object] = {"row": row}
+                sample.update(zip(FEATURES, measurements))
+                sample["species"] = names[code]
+                yield json.dumps(sample) + "\n"
+                
+    response = Response(lines(), mimetype="application/x-ndjson")
+    if offset + limit < len(rows):
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return response
 
 @app.route('/iris/<iris_name>')
 def get_iris(iris_name):
     return iris_name
 
+@app.route('/iris/classify', methods=['POST'])
+def classify_irises():
+    """측정값 배열(JSON 또는 NDJSON)을 한꺼번에 분류해 순서대로 NDJSON으로 돌려준다."""
+    parameter: Optional[Hyperparameter] = current_app.config.get("IRIS_MODEL")
+    if parameter is None:
+        return jsonify(error="no model loaded"), 503
+    try:
+        rows = _read_batch()
+    except ValueError as ex:
+        return jsonify(error=f"invalid batch: {ex}"), 400
+    limit = current_app.config["MAX_BATCH_SIZE"]
+    if len(rows) > limit:
+        return jsonify(error=f"batch of {len(rows)} exceeds limit {limit}"), 413
+    block_size = current_app.config["CLASSIFY_BLOCK_SIZE"]
+    # 200을 보낸 뒤에는 응답을 되돌릴 수 없으므로 모든 행을 먼저 검사한다.
+    features: dict[int, list[float]] = {}
+    errors: dict[int, str] = {}
+    for n, row in enumerate(rows):
+        try:
+            features[n] = _measurements(row)
+        except ValueError as ex:
+            errors[n] = str(ex)
+    
+    def results() -> Iterator[str]:
+        for start in range(0, len(rows), block_size):
+            block = [n for n in range(start, min(start + block_size, len(rows))) if n in features]
+            species = _classify_block(parameter, block, [features[n] for n in block], errors)
+            for n in range(start, min(start + block_size, len(rows))):
+                if n in errors:
+                    yield json.dumps({"row": n, "error": errors[n]}) + "\n"
+                else:
+                    yield json.dumps({"row": n, "species": species[n]}) + "\n"
+                    
+    return Response(results(), mimetype="application/x-ndjson")
+
+
+def _classify_block(
+    parameter: Hyperparameter, numbers: list[int], features: list[list[float]], errors: dict[int, str]
+) -> dict[int, str]:
+    """행 번호별 품종, 블록 분류가 실패하면 한 행씩 다시 분류해 실패한 행만 errors에 남긴다."""
+    if not numbers:
+        return {}
+    try:
+        return dict(zip(numbers, parameter.classify_many(np.array(features))))
+    except Exception:
+        pass
+    species: dict[int, str] = {}
+    for n, row in zip(numbers, features):
+        try:
+            species[n] = parameter.classify_many(np.array([row]))[0]
+        except ValueError as ex:
+            errors[n] = str(ex)
+        except Exception:
+            app.logger.exception("classifying row %d failed", n)
+            errors[n] = "classification failed"
+    return species
+
 
 class actors:
     Botanist: "Botanist"
@@ -111,13 +519,6 @@ class Iris_classifier:
         print(f"Setting {self._name}'s State to {state!r}")
         self._state = state
         
-    def search(self, name: str) -> list["Iris"]:
-        matching_irises: list["Iris"] = []
-        for iris in self:
-            if name in iris.name:
-                matching_irises.append(iris)
-            return matching_irises
-        
 
 class InvalidSampleError(ValueError):
     """소스 데이터 파일이 유효하지 않은 데이터 표현을 가지고 있다."""
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import argparse
+import json
+import mmap
+import struct
+import sys
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Optional,
+)
+
+import numpy as np
+
+from model import TrainingData
+
+
+MAGIC = b"IRISDS\0\0"
+VERSION = 1
+ALIGN = 64
+PREFIX = struct.Struct("<8sII")
+
+ARRAYS = ("training_features", "training_codes", "testing_features", "testing_codes")
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+def encode_header(
+    header: dict[str, Any],
+    arrays: dict[str, np.ndarray],
+    prefix_size: int,
+    describe: Optional[Callable[[np.ndarray], dict[str, object]]] = None,
+) -> bytes:
+    """arrays의 오프셋, dtype, shape(와 describe가 더하는 필드)를 header["arrays"]에 채워 인코딩한다.
+
+    배열은 접두부와 헤더 뒤에 arrays 순서대로 64바이트 정렬해서 놓인다.
+    """
+    fields = {
+        name: {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            **(describe(array) if describe is not None else {}),
+        }
+        for name, array in arrays.items()
+    }
+    layout: dict[str, dict[str, object]] = {}
+    header["arrays"] = layout
+    # 오프셋은 헤더 길이에 따라 달라지므로 길이가 바뀌지 않을 때까지 다시 계산한다.
+    size = 0
+    while True:
+        offset = _aligned(prefix_size + size)
+        for name, array in arrays.items():
+            layout[name] = {"offset": offset, **fields[name]}
+            offset = _aligned(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        if len(encoded) == size:
+            return encoded
+        size = len(encoded)
+
+
+def write_arrays(
+    target: Path, prefix: bytes, encoded: bytes, header: dict[str, Any], arrays: dict[str, np.ndarray]
+) -> None:
+    """encode_header로 만든 헤더와 배열들을 target에 쓴다."""
+    with target.open("wb") as target_file:
+        target_file.write(prefix)
+        target_file.write(encoded)
+        for name, array in arrays.items():
+            target_file.seek(header["arrays"][name]["offset"])
+            target_file.write(array.tobytes())
+
+
+def save(training_data: TrainingData, target: Path) -> None:
+    """학습/테스트 배열을 버전이 붙은 이진 파일로 저장한다.
+
+    [접두부: 매직, 버전, 헤더 길이][JSON 헤더][64바이트 정렬된 배열들]
+    """
+    training_features, training_codes = training_data.training.live_arrays()
+    testing_features, testing_codes = training_data.testing.live_arrays()
+    arrays = {
+        name: np.ascontiguousarray(array)
+        for name, array in zip(ARRAYS, (training_features, training_codes, testing_features, testing_codes))
+    }
+    header: dict[str, Any] = {
+        "name": training_data.name,
+        "species": training_data.species.names,
+    }
+    encoded = encode_header(header, arrays, PREFIX.size)
+    write_arrays(target, PREFIX.pack(MAGIC, VERSION, len(encoded)), encoded, header, arrays)
+
+
+def open_dataset(source: Path) -> TrainingData:
+    """이진 파일을 mmap으로 열어 복사 없이 TrainingData로 감싼다."""
+    with source.open("rb") as source_file:
+        mapping = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, size = PREFIX.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{source}: not an iris dataset file")
+    if version != VERSION:
+        raise ValueError(f"{source}: unsupported dataset version {version}")
+    header = json.loads(mapping[PREFIX.size : PREFIX.size + size])
+    arrays: dict[str, np.ndarray] = {}
+    for name in ARRAYS:
+        spec = header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        arrays[name] = np.frombuffer(
+            mapping, dtype=dtype, count=int(np.prod(shape)), offset=spec["offset"]
+        ).reshape(shape)
+    return TrainingData.from_arrays(
+        header["name"],
+        header["species"],
+        (arrays["training_features"], arrays["training_codes"]),
+        (arrays["testing_features"], arrays["testing_codes"]),
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="CSV 측정값을 이진 데이터셋으로 변환한다.")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("target", type=Path)
+    precision = parser.add_mutually_exclusive_group()
+    precision.add_argument("--float32", action="store_true", help="특성을 float32로 저장")
+    precision.add_argument("--int16", action="store_true", help="학습 특성을 0.01 단위 고정 소수점으로 저장")
+    options = parser.parse_args(argv)
+    training_data = TrainingData(
+        options.source.stem,
+        np.float32 if options.float32 else np.int16 if options.int16 else np.float64,
+    )
+    report = training_data.load_csv(options.source)
+    for row, reason in report.rejected:
+        print(f"Row {row}: {reason}", file=sys.stderr)
+    save(training_data, options.target)
+    print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
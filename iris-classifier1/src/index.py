@@ -0,0 +1,414 @@
+from __future__ import annotations
+import heapq
+from typing import (
+    Any,
+    Callable,
+    Optional,
+)
+
+import numpy as np
+
+
+Reduce = Callable[[np.ndarray], np.ndarray]
+
+METRICS: dict[str, Reduce] = {
+    "euclidean": lambda d: np.sqrt((d * d).sum(axis=-1)),
+    "manhattan": lambda d: np.abs(d).sum(axis=-1),
+    "chebyshev": lambda d: np.abs(d).max(axis=-1),
+}
+
+
+def _widen(points: np.ndarray) -> np.ndarray:
+    """고정 소수점 정수는 제곱해도 넘치지 않도록 int32로 넓힌다."""
+    if np.issubdtype(points.dtype, np.integer) and points.dtype.itemsize < 4:
+        return points.astype(np.int32)
+    return points
+
+
+class KDTree:
+    """학습 특성 행렬 위의 KD-트리, 정확한 k-최근접 이웃 질의를 지원한다."""
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 32) -> None:
+        points = _widen(points)
+        self.leaf_size = leaf_size
+        self.evaluations = 0
+        self.order = np.arange(len(points))
+        starts: list[int] = []
+        ends: list[int] = []
+        lefts: list[int] = []
+        rights: list[int] = []
+        lowers: list[np.ndarray] = []
+        uppers: list[np.ndarray] = []
+        stack = [(-1, False, 0, len(points))]
+        while stack:
+            parent, is_right, start, end = stack.pop()
+            node = len(starts)
+            if parent >= 0:
+                (rights if is_right else lefts)[parent] = node
+            block = points[self.order[start:end]]
+            lower = block.min(axis=0) if end > start else np.zeros(points.shape[1])
+            upper = block.max(axis=0) if end > start else np.zeros(points.shape[1])
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            lowers.append(lower)
+            uppers.append(upper)
+            if end - start <= leaf_size:
+                continue
+            dim = int(np.argmax(upper - lower))
+            mid = (start + end) // 2
+            segment = self.order[start:end]
+            split = np.argpartition(points[segment, dim], mid - start)
+            self.order[start:end] = segment[split]
+            stack.append((node, True, mid, end))
+            stack.append((node, False, start, mid))
+        self.start = np.array(starts, dtype=np.intp)
+        self.end = np.array(ends, dtype=np.intp)
+        self.left = np.array(lefts, dtype=np.intp)
+        self.right = np.array(rights, dtype=np.intp)
+        self.lower = np.array(lowers).reshape(len(starts), -1)
+        self.upper = np.array(uppers).reshape(len(starts), -1)
+        self.points = points[self.order]
+
+    ARRAYS = ("order", "start", "end", "left", "right", "lower", "upper", "points")
+
+    @classmethod
+    def from_arrays(cls, leaf_size: int, arrays: dict[str, np.ndarray]) -> "KDTree":
+        """arrays()로 꺼낸 배열로 트리를 다시 만들지 않고 되살린다."""
+        tree = cls.__new__(cls)
+        tree.leaf_size = leaf_size
+        tree.evaluations = 0
+        for name in cls.ARRAYS:
+            setattr(tree, name, arrays[name])
+        return tree
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def query(
+        self, queries: np.ndarray, k: int, metric: str
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """질의마다 가까운 순서로 정렬된 (m, k) 거리와 인덱스"""
+        reduce = METRICS[metric]
+        k = min(k, len(self.points))
+        distances = np.empty((len(queries), k))
+        indices = np.empty((len(queries), k), dtype=np.intp)
+        for row, query in enumerate(queries):
+            distances[row], indices[row] = self._query_one(query, k, reduce)
+        return distances, indices
+
+    def _query_one(
+        self, query: np.ndarray, k: int, reduce: Reduce
+    ) -> tuple[np.ndarray, np.ndarray]:
+        best_distance = np.full(k, np.inf)
+        best_index = np.full(k, -1, dtype=np.intp)
+        worst = np.inf
+        pending: list[tuple[float, int]] = [(0.0, 0)]
+        while pending:
+            bound, node = heapq.heappop(pending)
+            if bound > worst:
+                break
+            left = self.left[node]
+            if left < 0:
+                start, end = self.start[node], self.end[node]
+                self.evaluations += int(end - start)
+                distance = np.concatenate(
+                    [best_distance, reduce(self.points[start:end] - query)]
+                )
+                index = np.concatenate([best_index, np.arange(start, end)])
+                # 거리가 같으면 원래 행 번호가 작은 쪽을 남겨 결과가 k에 따라 흔들리지 않게 한다.
+                keep = np.lexsort((self.order[index], distance))[:k]
+                best_distance, best_index = distance[keep], index[keep]
+                worst = best_distance[-1]
+                continue
+            children = np.array([left, self.right[node]])
+            gap = (
+                np.maximum(self.lower[children] - query, 0.0)
+                + np.maximum(query - self.upper[children], 0.0)
+            )
+            for child, child_bound in zip(children, reduce(gap)):
+                if child_bound <= worst:
+                    heapq.heappush(pending, (float(child_bound), int(child)))
+        return best_distance, self.order[best_index]
+
+
+class GridIndex:
+    """특성 공간을 균일한 격자로 나눈 근사 최근접 이웃 색인
+
+    질의마다 무게중심이 가까운 순서로 비어 있지 않은 칸 probes개만 전수
+    탐색한다. probes를 늘리면 재현율이 오르는 대신 느려진다. 고른 칸의 점이
+    k개보다 적으면 k개가 찰 때까지 다음 칸으로 넓힌다. cells(축마다 칸 수)를
+    주지 않으면 칸마다 평균 points_per_cell개가 들어가도록 고른다.
+    """
+
+    block_budget = 1_000_000
+    points_per_cell = 64
+
+    def __init__(
+        self, points: np.ndarray, ids: Optional[np.ndarray] = None, cells: Optional[int] = None
+    ) -> None:
+        if cells is None:
+            cells = int(round((len(points) / self.points_per_cell) ** (1 / points.shape[1])))
+        self.cells = cells = min(max(cells, 1), 32)
+        points = _widen(points)
+        self.evaluations = 0
+        lower = points.min(axis=0) if len(points) else np.zeros(points.shape[1])
+        upper = points.max(axis=0) if len(points) else np.zeros(points.shape[1])
+        width = np.where(upper > lower, (upper - lower) / cells, 1.0)
+        coords = np.clip(((points - lower) / width).astype(np.intp), 0, cells - 1)
+        keys = np.ravel_multi_index(coords.T, (cells,) * points.shape[1])
+        order = np.argsort(keys, kind="stable")
+        _, self.start, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.end = self.start + counts
+        self.points = points[order]
+        self.ids = (np.arange(len(points)) if ids is None else np.asarray(ids, dtype=np.intp))[order]
+        self.centroids = (
+            np.add.reduceat(self.points.astype(np.float64), self.start, axis=0)
+            / counts[:, np.newaxis]
+            if len(points) else np.zeros((0, points.shape[1]))
+        )
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def query(
+        self, queries: np.ndarray, k: int, metric: str, probes: int = 1
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """질의마다 가까운 순서로 정렬된 (m, k) 거리와 id, 정확한 답이라는 보장은 없다."""
+        reduce = METRICS[metric]
+        k = min(k, len(self.points))
+        n_cells = len(self.centroids)
+        probes = min(max(probes, 1), n_cells)
+        distances = np.empty((len(queries), k))
+        ids = np.empty((len(queries), k), dtype=np.intp)
+        step = max(1, self.block_budget // max(n_cells * queries.shape[1], 1))
+        for start in range(0, len(queries), step):
+            block = queries[start : start + step]
+            to_cells = reduce(block[:, np.newaxis, :] - self.centroids[np.newaxis, :, :])
+            chosen = np.argpartition(to_cells, probes - 1, axis=1)[:, :probes]
+            found_distance, found_id = self._scan(block, chosen, k, reduce)
+            keep = np.lexsort((found_id, found_distance))[:, :k]
+            distances[start : start + step] = np.take_along_axis(found_distance, keep, axis=1)
+            ids[start : start + step] = np.take_along_axis(found_id, keep, axis=1)
+            # 고른 칸의 점이 k개보다 적은 질의는 k개가 찰 때까지 다음 칸으로 넓힌다.
+            for row in np.flatnonzero(np.isinf(distances[start : start + step, -1])):
+                ranked = np.argsort(to_cells[row], kind="stable")
+                reach = np.searchsorted(np.cumsum(self.end[ranked] - self.start[ranked]), k) + 1
+                cells = ranked[np.newaxis, :reach]
+                found_distance, found_id = self._scan(block[row : row + 1], cells, k, reduce)
+                keep = np.lexsort((found_id[0], found_distance[0]))[:k]
+                distances[start + row], ids[start + row] = found_distance[0, keep], found_id[0, keep]
+        return distances, ids
+
+    def _scan(
+        self, queries: np.ndarray, chosen: np.ndarray, k: int, reduce: Reduce
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """칸마다 그 칸을 고른 질의를 모아 한 번에 거리를 구하고, 칸별 상위 k개를 모은다."""
+        probes = chosen.shape[1]
+        found_distance = np.full((len(queries), probes * k), np.inf)
+        found_id = np.full((len(queries), probes * k), -1, dtype=np.intp)
+        flat = chosen.ravel()
+        order = np.argsort(flat, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(flat[order])) + 1)
+        for group in groups:
+            cell = flat[group[0]]
+            points = self.points[self.start[cell] : self.end[cell]]
+            cell_ids = self.ids[self.start[cell] : self.end[cell]]
+            take = min(k, len(points))
+            step = max(1, self.block_budget // max(len(points) * queries.shape[1], 1))
+            for offset in range(0, len(group), step):
+                rows, slots = np.divmod(group[offset : offset + step], probes)
+                distance = reduce(queries[rows][:, np.newaxis, :] - points[np.newaxis, :, :])
+                self.evaluations += distance.size
+                nearest = np.argpartition(distance, take - 1, axis=1)[:, :take]
+                columns = slots[:, np.newaxis] * k + np.arange(take)
+                found_distance[rows[:, np.newaxis], columns] = np.take_along_axis(
+                    distance, nearest, axis=1
+                )
+                found_id[rows[:, np.newaxis], columns] = cell_ids[nearest]
+        return found_distance, found_id
+
+
+def recall(
+    queries: np.ndarray, points: np.ndarray, found: np.ndarray, exact: np.ndarray, metric: str
+) -> float:
+    """근사 탐색이 찾은 이웃 가운데 정확한 k번째 이웃보다 멀지 않은 것의 비율
+
+    행 번호 대신 거리로 비교하므로 거리가 같은 이웃끼리는 어느 쪽을 골라도 맞은 것으로 친다.
+    """
+    if exact.size == 0:
+        return 1.0
+    reduce = METRICS[metric]
+    queries = queries.astype(np.float64)
+    found_distance = reduce(queries[:, np.newaxis, :] - points[found])
+    worst = reduce(queries[:, np.newaxis, :] - points[exact]).max(axis=1, keepdims=True)
+    return float(np.mean(found_distance <= worst + 1e-12 * np.abs(worst)))
+
+
+def supports(metric: Optional[str]) -> bool:
+    """트리 색인으로 정확하게 질의할 수 있는 거리인지"""
+    return metric in METRICS
+
+
+class DynamicIndex:
+    """삽입과 삭제를 바로 반영하는 KD-트리 색인
+
+    트리를 만든 뒤 들어온 점은 보조 버퍼에서 전수 탐색하고, 지운 점은
+    표시만 해 둔다. 버퍼와 지운 점의 비율이 threshold를 넘거나 버퍼가
+    max_pending개를 넘으면 compact()로 트리를 다시 만든다. 점의 id는 호출하는 쪽(SampleStore의 행 번호)이 정한다.
+    """
+
+    def __init__(
+        self,
+        points: np.ndarray,
+        ids: Optional[np.ndarray] = None,
+        leaf_size: int = 32,
+        threshold: float = 0.25,
+        max_pending: int = 4_096,
+    ) -> None:
+        self.leaf_size = leaf_size
+        self.threshold = threshold
+        self.max_pending = max_pending
+        self.compactions = 0
+        self.pending_evaluations = 0
+        self._pending_ids: list[int] = []
+        self._pending_set: set[int] = set()
+        self._pending_points: list[np.ndarray] = []
+        self._deleted = np.zeros(0, dtype=bool)
+        self._evaluations_before = 0
+        self._build(points, np.arange(len(points)) if ids is None else ids)
+
+    @classmethod
+    def from_tree(cls, tree: KDTree, ids: np.ndarray, **options: Any) -> "DynamicIndex":
+        """이미 만든 트리(스냅숏에서 읽은 것 등)를 그대로 쓰는 색인"""
+        index = cls(np.zeros((0, tree.points.shape[1])), leaf_size=tree.leaf_size, **options)
+        index._use(tree, ids)
+        return index
+
+    @property
+    def tree(self) -> KDTree:
+        return self._tree
+
+    @property
+    def tree_ids(self) -> np.ndarray:
+        return self._tree_ids
+
+    def _build(self, points: np.ndarray, ids: np.ndarray) -> None:
+        self._use(KDTree(points, self.leaf_size), ids)
+
+    def _use(self, tree: KDTree, ids: np.ndarray) -> None:
+        if hasattr(self, "_tree"):
+            self._evaluations_before += self._tree.evaluations
+        self._tree = tree
+        self._tree_ids = np.asarray(ids, dtype=np.intp)
+        self._pending_ids.clear()
+        self._pending_set.clear()
+        self._pending_points.clear()
+        self._deleted_in_tree = 0
+        self._deleted_pending = 0
+        # 지운 표시는 트리를 다시 만들어도 남겨 둔다. 이미 지운 id를 또 지워도 세지 않기 위해서다.
+        if len(self._tree_ids):
+            self._grow(int(self._tree_ids.max()))
+            self._deleted[self._tree_ids] = False
+
+    def __len__(self) -> int:
+        return (
+            len(self._tree_ids) + len(self._pending_ids)
+            - self._deleted_in_tree - self._deleted_pending
+        )
+
+    @property
+    def evaluations(self) -> int:
+        """지금까지 계산한 점 사이 거리 수 (트리를 다시 만들어도 이어서 센다)"""
+        return self._evaluations_before + self._tree.evaluations + self.pending_evaluations
+
+    @property
+    def fragmentation(self) -> float:
+        """트리 밖에 있거나 지워진 점의 비율"""
+        stale = len(self._pending_ids) + self._deleted_in_tree
+        return stale / max(len(self._tree_ids), 1)
+
+    def _grow(self, id: int) -> None:
+        if id >= len(self._deleted):
+            deleted = np.zeros(max(id + 1, 2 * len(self._deleted)), dtype=bool)
+            deleted[: len(self._deleted)] = self._deleted
+            self._deleted = deleted
+
+    def insert(self, id: int, point: np.ndarray) -> None:
+        self._grow(id)
+        self._deleted[id] = False
+        self._pending_ids.append(id)
+        self._pending_set.add(id)
+        self._pending_points.append(np.asarray(point, dtype=self._tree.points.dtype))
+
+    def delete(self, id: int) -> None:
+        self._grow(id)
+        if self._deleted[id]:
+            return
+        self._deleted[id] = True
+        if id in self._pending_set:
+            self._deleted_pending += 1
+        else:
+            self._deleted_in_tree += 1
+
+    def needs_compaction(self) -> bool:
+        return (
+            self.fragmentation > self.threshold
+            or len(self._pending_ids) > self.max_pending
+        )
+
+    def compact(self, points: np.ndarray, ids: np.ndarray) -> None:
+        """살아 있는 점 전체(points, ids)로 트리를 다시 만든다."""
+        self._build(points, ids)
+        self.compactions += 1
+
+    def query(
+        self, queries: np.ndarray, k: int, metric: str
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """질의마다 가까운 순서로 정렬된 (m, k) 거리와 id"""
+        return self._merge(queries, k, metric, self._tree.query(queries, self._reach(k), metric))
+
+    def _reach(self, k: int) -> int:
+        """트리에서 찾을 이웃 수, 지운 점이 끼어 있어도 k개가 남게 넉넉히 찾는다."""
+        return min(k + self._deleted_in_tree, len(self._tree))
+
+    def _merge(
+        self, queries: np.ndarray, k: int, metric: str, found: tuple[np.ndarray, np.ndarray]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """트리에서 찾은 (거리, 트리 행)에서 지운 점을 빼고 보조 버퍼의 점을 더해 k개를 고른다."""
+        distances, rows = found
+        ids = self._tree_ids[rows]
+        distances = np.where(self._deleted[ids], np.inf, distances)
+        if self._pending_ids:
+            pending_ids = np.array(self._pending_ids, dtype=np.intp)
+            pending = np.array(self._pending_points)
+            extra = METRICS[metric](queries[:, np.newaxis, :] - pending[np.newaxis, :, :])
+            extra[:, self._deleted[pending_ids]] = np.inf
+            self.pending_evaluations += extra.size
+            distances = np.concatenate([distances, extra], axis=1)
+            ids = np.concatenate([ids, np.broadcast_to(pending_ids, extra.shape)], axis=1)
+        k = min(k, len(self))
+        ranked = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return (
+            np.take_along_axis(distances, ranked, axis=1),
+            np.take_along_axis(ids, ranked, axis=1),
+        )
+
+
+class DynamicGridIndex(DynamicIndex):
+    """삽입과 삭제를 바로 반영하는 격자 색인, 보조 버퍼와 지운 표시는 DynamicIndex와 같다."""
+
+    def _build(self, points: np.ndarray, ids: np.ndarray) -> None:
+        self._use(GridIndex(points), ids)
+
+    def query(
+        self, queries: np.ndarray, k: int, metric: str, probes: int = 1
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """질의마다 가까운 순서로 정렬된 (m, k) 거리와 id, 정확한 답이라는 보장은 없다."""
+        return self._merge(
+            queries, k, metric, self._tree.query(queries, self._reach(k), metric, probes)
+        )
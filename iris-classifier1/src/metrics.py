@@ -0,0 +1,225 @@
+from __future__ import annotations
+import bisect
+import os
+import threading
+import time
+from typing import (
+    cast,
+    Iterator,
+    Sequence,
+    Union,
+)
+
+
+# 꺼져 있으면 계측 지점은 이 플래그 하나만 확인하고 지나간다.
+enabled = os.environ.get("IRIS_METRICS", "") not in ("", "0")
+
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0,
+)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+
+class Timer:
+    """with 블록의 경과 시간을 히스토그램에 기록한다."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class Family:
+    """이름과 레이블 이름이 같은 지표들의 묶음"""
+
+    def __init__(
+        self, name: str, help: str, kind: str, labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        self._children: dict[tuple[str, ...], Metric] = {}
+
+    def labels(self, *values: str) -> Metric:
+        child = self._children.get(values)
+        if child is None:
+            if self.kind == "counter":
+                child = Counter()
+            elif self.kind == "gauge":
+                child = Gauge()
+            else:
+                child = Histogram(self.buckets)
+            child = self._children.setdefault(values, child)
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in sorted(self._children.items()):
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(child.buckets, child.counts):
+                    cumulative += count
+                    le = _labels(self.label_names, values, f'le="{bound}"')
+                    yield f"{self.name}_bucket{le} {cumulative}"
+                cumulative += child.counts[-1]
+                le = _labels(self.label_names, values, 'le="+Inf"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+                labels = _labels(self.label_names, values)
+                yield f"{self.name}_sum{labels} {_number(child.sum)}"
+                yield f"{self.name}_count{labels} {cumulative}"
+            else:
+                yield f"{self.name}{_labels(self.label_names, values)} {_number(child.value)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._families: dict[str, Family] = {}
+
+    def _family(self, name: str, help: str, kind: str, labels: Sequence[str]) -> Family:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = Family(name, help, kind, labels)
+        return family
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Family:
+        return self._family(name, help, "counter", labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Family:
+        return self._family(name, help, "gauge", labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = ()) -> Family:
+        return self._family(name, help, "histogram", labels)
+
+    def render(self) -> str:
+        """Prometheus 텍스트 형식 (0.0.4)"""
+        lines: list[str] = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "iris_request_seconds", "HTTP 요청 처리 시간", ("endpoint",)
+)
+LOAD_SECONDS = REGISTRY.histogram(
+    "iris_load_seconds", "학습 데이터 로드 시간", ("source",)
+)
+DISTANCE_SECONDS = REGISTRY.histogram(
+    "iris_distance_seconds", "거리 계산 시간", ("algorithm",)
+)
+NEIGHBOR_SECONDS = REGISTRY.histogram(
+    "iris_neighbor_selection_seconds", "k개 이웃 선택과 투표 시간"
+)
+QUERIES = REGISTRY.counter("iris_queries_total", "분류한 질의 수")
+DISTANCE_EVALUATIONS = REGISTRY.counter(
+    "iris_distance_evaluations_total", "질의와 학습 샘플 사이의 거리 계산 횟수"
+)
+CACHE = REGISTRY.counter("iris_cache_total", "예측 캐시 조회 결과", ("result",))
+SAMPLES = REGISTRY.gauge("iris_samples", "데이터셋 크기", ("purpose",))
+SHARD_SECONDS = REGISTRY.histogram(
+    "iris_shard_seconds", "샤드 하나가 한 배치에 답하는 데 걸린 시간", ("shard",)
+)
+SHARD_TIMEOUTS = REGISTRY.counter(
+    "iris_shard_timeouts_total", "제한 시간 안에 답하지 못한 샤드 요청 수", ("shard",)
+)
+CASCADE_ANSWERS = REGISTRY.counter(
+    "iris_cascade_answers_total", "캐스케이드 단계별로 답한 질의 수", ("stage",)
+)
+
+
+def observe_sizes(training: int, testing: int) -> None:
+    if enabled:
+        cast(Gauge, SAMPLES.labels("training")).set(training)
+        cast(Gauge, SAMPLES.labels("testing")).set(testing)
+
+
+def timer(family: Family, *labels: str) -> Union["Timer", "_NullTimer"]:
+    """켜져 있으면 Timer, 꺼져 있으면 아무 일도 하지 않는 컨텍스트"""
+    if not enabled:
+        return _NULL
+    return Timer(cast(Histogram, family.labels(*labels)))
+
+
+def count(family: Family, amount: float, *labels: str) -> None:
+    if enabled:
+        cast(Counter, family.labels(*labels)).inc(amount)
+
+
+def observe(family: Family, value: float, *labels: str) -> None:
+    if enabled:
+        cast(Histogram, family.labels(*labels)).observe(value)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+
+_NULL = _NullTimer()
@@ -1,73 +1,37 @@
 from __future__ import annotations
+import abc
 import collections
 import csv
 import datetime
 import enum
-from math import isclose
-from pathlib import path
+import heapq
+import io
+import threading
+import time
+from math import hypot, inf, isclose, isfinite, sqrt
+from pathlib import Path
 from typing import (
     cast,
     Any,
     Optional,
     overload,
-    dataclass,
     Union,
     Iterator,
     Iterable,
+    BinaryIO,
     Callable,
     Protocol,
+    Sequence,
+    TypedDict,
 )
 import weakref
 
-from model import Sample, SampleDict
+import numpy as np
 
-@dataclass
-class Sample:
-    sepal_length: float
-    sepal_width: float
-    petal_length: float
-    petal_width: float
-    
-@dataclass
-class KnownSample(Sample):
-    species: str
-
-@dataclass
-class TrainingKnownSample(KnownSample): 
-    pass
+from aggregates import SpeciesAggregates
+from index import DynamicGridIndex, DynamicIndex, recall, supports
+import metrics
 
-@dataclass
-class Hyperparameter:
-    """k 및 거리 계산 알고리듬이 있는 튜닝 매개변수 집합"""
-    
-    k: int
-    algorithm: Distance
-    data: weakref.ReferenceType["TrainingData"]
-    
-    def classify(self, sample: Sample) -> str:
-        """K-NN 알고리듬"""
-        
-@dataclass(frozen=True)
-class Sample:
-    sepal_length: float
-    sepal_width: float
-    petal_length: float
-    petal_width: float
-    
-@dataclass(frozen=True)
-class KnownSample(Sample):
-    species: str
-    
-@dataclass
-class TestingKnownSample:
-    sample: KnownSample
-    classification: Optional[str] = None
-    
-@dataclass(frozen=True)
-class TrainingKnownSample:
-    """분류할 수 없음."""
-    sample: KnownSample
-    
 
 class Sample:
     """Abstract superclass for all samples."""
@@ -116,93 +80,383 @@ class Sample:
     
     
 class Hyperparameter:
-    """하이퍼파라미터 값과 전체 품질"""
+    """하이퍼파라미터 값과 전체 품질
+    
+    probes를 주면 격자 색인으로 근사 탐색을 한다. 값이 클수록 재현율이 높고 느리다.
+    """
     
-    def __init__(self, k: int, training: "TrainingData") -> None:
+    block_budget = 1_000_000
+    # 질의 256개를 한 블록으로 찾을 때 KD-트리가 블록 스캔보다 빨라지는 학습 행 수.
+    # bench/benchmark.py의 index.*.tree와 index.*.scan 항목으로 잰 교차점이다.
+    index_thresholds = {"euclidean": 50_000, "manhattan": 10_000, "chebyshev": 4_000}
+    
+    def __init__(
+        self,
+        k: int,
+        algorithm: "Distance",
+        training: "TrainingData",
+        probes: Optional[int] = None,
+    ) -> None:
         self.k = k
+        self.algorithm = algorithm
         self.data: weakref.ReferenceType["TrainingData"] = weakref.ref(training)
+        self.probes = probes
         self.quality: float
+        self.recall: float = 1.0
+        self.elapsed: float
+        self.cache: Optional["PredictionCache"] = None
         
-    def test(self) -> None:
-        """잔체 테스트 스위트 실행"""
+    def _training_data(self) -> "TrainingData":
         training_data: Optional["TrainingData"] = self.data()
         if not training_data:
             raise RuntimeError("Broken Weak Reference")
-        pass_count, fail_count = 0, 0
-        for sample in training_data.testing:
-            sample.classification = self.classify(sample)
-            if sample.matches():
-                pass_count += 1
-            else:
-                fail_count += 1
-        self.quality = pass_count / (pass_count + fail_count)
+        return training_data
+    
+    @property
+    def approximate(self) -> bool:
+        return self.probes is not None and supports(self.algorithm.metric)
+    
+    def uses_index(self, rows: int) -> bool:
+        """살아 있는 학습 행이 rows개일 때 정확한 탐색에 KD-트리를 쓰는지"""
+        threshold = self.index_thresholds.get(cast(str, self.algorithm.metric))
+        return threshold is not None and rows >= threshold
         
+    def neighbors(
+        self, queries: np.ndarray, ordered: bool = False, exact: bool = False
+    ) -> np.ndarray:
+        """질의마다 가장 가까운 k개 학습 샘플의 인덱스, (m, k) 행렬
         
-class TrainingData:
-    """샘플을 로드하고 테스트하는 메서드를 가지며, 학습 및 테스트 데이터셋을 포함한다."""
+        ordered이면 각 행을 가까운 순서로 정렬한다. exact이면 probes가 있어도
+        정확하게 탐색한다.
+        """
+        training = self._training_data().training
+        if training.live == 0:
+            raise ValueError("No training samples")
+        k = min(self.k, training.live)
+        algorithm = type(self.algorithm).__name__
+        metrics.count(metrics.QUERIES, len(queries))
+        queries = training.encode(queries)
+        if self.approximate and not exact:
+            grid = self._training_data().grid_index()
+            evaluations = grid.evaluations
+            with metrics.timer(metrics.DISTANCE_SECONDS, algorithm):
+                nearest = grid.query(queries, k, self.algorithm.metric, cast(int, self.probes))[1]
+            metrics.count(metrics.DISTANCE_EVALUATIONS, grid.evaluations - evaluations)
+            return nearest
+        if self.uses_index(training.live):
+            index = self._training_data().index()
+            evaluations = index.evaluations
+            with metrics.timer(metrics.DISTANCE_SECONDS, algorithm):
+                nearest = index.query(queries, k, self.algorithm.metric)[1]
+            metrics.count(metrics.DISTANCE_EVALUATIONS, index.evaluations - evaluations)
+            return nearest
+        features = training.features
+        nearest = np.empty((len(queries), k), dtype=np.intp)
+        step = max(1, self.block_budget // len(features))
+        for start in range(0, len(queries), step):
+            with metrics.timer(metrics.DISTANCE_SECONDS, algorithm):
+                block = self.algorithm.distances(queries[start : start + step], features)
+                if training.removed is not None:
+                    block = np.where(training.removed, np.inf, block)
+            with metrics.timer(metrics.NEIGHBOR_SECONDS):
+                candidates = np.argpartition(block, k - 1, axis=1)[:, :k]
+                if ordered:
+                    distances = np.take_along_axis(block, candidates, axis=1)
+                    ranked = np.argsort(distances, axis=1, kind="stable")
+                    candidates = np.take_along_axis(candidates, ranked, axis=1)
+            nearest[start : start + step] = candidates
+        metrics.count(metrics.DISTANCE_EVALUATIONS, len(queries) * len(features))
+        return nearest
     
-    def __init__(self, name: str) -> None:
-        self.name = name
-        self.uploaded: datetime.datetime
-        self.tested: datetime.datetime
-        self.training: list[Sample] = []
-        self.testing: list[Sample] = []
-        self.tuning: list[Hyperparameter] = []
-          
-    def load(self, raw_data_source: Iterable[dict[str, str]]) -> None:
-        """원시 데이터 로드 및 분할"""
-        for n, row in enumerate(raw_data_source):
-            purpose = Purpose.Testing if n % 5 == 0 else Purpose.Training
-            sample = KnownSample(
-                sepal_length=float(row["sepal_length"]),
-                sepal_width=float(row["sepal_width"]),
-                petal_length=float(row["petal_length"]),
-                petal_width=float(row["petal_width"]),
-                species=row["species"],
+    def classify_codes(self, queries: np.ndarray) -> np.ndarray:
+        """질의 블록의 품종 코드"""
+        _, codes, names = self._training_data().training_arrays()
+        nearest = self.neighbors(queries)
+        with metrics.timer(metrics.NEIGHBOR_SECONDS):
+            return vote(codes[nearest], len(names))
+    
+    def classify_many(self, queries: np.ndarray) -> list[str]:
+        """K-NN 알고리듬, 질의 블록을 한 번에 분류한다."""
+        if self.cache is not None:
+            return self.cache.classify_many(self, queries)
+        names = self._training_data().training_arrays()[2]
+        return [names[c] for c in self.classify_codes(queries)]
+    
+    def classify(self, sample: Sample) -> str:
+        """K-NN 알고리듬"""
+        return self.classify_many(as_array([sample]))[0]
+    
+    def nearest(self, sample: Sample) -> list[tuple[float, int]]:
+        """배치로 묶을 수 없을 때 쓰는 한 샘플용 탐색, 가까운 순서의 (거리, 행) k개
+        
+        크기 k인 최대 힙에 지금까지의 k개를 두고, 거리는 힙의 k번째 거리를
+        넘는 순간 계산을 그만둔다. 거리가 같으면 행 번호가 작은 쪽이 남는다.
+        """
+        training = self._training_data().training
+        if training.live == 0:
+            raise ValueError("No training samples")
+        k = min(self.k, training.live)
+        partial_distance = self.algorithm.partial_distance
+        heap: list[tuple[float, int]] = []
+        bound = inf
+        for row in training.live_rows().tolist():
+            distance = partial_distance(sample, training[row], bound)
+            if len(heap) < k:
+                heapq.heappush(heap, (-distance, -row))
+                if len(heap) == k:
+                    bound = -heap[0][0]
+            elif distance < bound:
+                heapq.heapreplace(heap, (-distance, -row))
+                bound = -heap[0][0]
+        return sorted((-distance, -row) for distance, row in heap)
+    
+    def classify_scalar(self, sample: Sample) -> str:
+        """nearest()로 찾은 이웃의 다수결, classify()와 같은 답을 낸다."""
+        training_data = self._training_data()
+        rows = [row for _, row in self.nearest(sample)]
+        codes = training_data.training.codes[rows]
+        return training_data.species.names[vote(codes[np.newaxis], len(training_data.species))[0]]
+        
+    def test(self) -> None:
+        """잔체 테스트 스위트 실행
+        
+        근사 탐색이면 정확한 탐색과 비교한 이웃 재현율도 recall에 남긴다.
+        elapsed에는 비교용 정확한 탐색 시간이 들어가지 않는다.
+        """
+        start = time.perf_counter()
+        training_data = self._training_data()
+        testing = training_data.testing
+        nearest = self.neighbors(testing.features)
+        codes = training_data.training.codes
+        testing.classification[:] = vote(codes[nearest], len(training_data.species))
+        self.quality = float(np.mean(testing.matches()))
+        self.elapsed = time.perf_counter() - start
+        if self.approximate:
+            self.recall = recall(
+                training_data.training.encode(testing.features),
+                training_data.training.features,
+                nearest,
+                self.neighbors(testing.features, exact=True),
+                cast(str, self.algorithm.metric),
             )
-            if sample.purpose == Purpose.Testing:
-                self.testing.append(sample)
-            else:
-                self.training.append(sample)
-        self.uploaded = datetime.datetime.now(tz=datetime.datetime)
+            
+    def save(self, target: Path) -> None:
+        """학습 데이터, 이 값, 튜닝 기록, 색인을 모델 스냅숏 파일로 저장한다."""
+        from snapshot import save_model
         
-        {
-            "sepal_length": 5.1,
-            "sepal_width": 3.5,
-            "petal_length": 1.4,
-            "petal_width": 0.2,
-            "species": "Iris-setosa"
-        }
+        save_model(self, target)
         
-    def test(self, parameter: Hyperparameter) -> None:
-        """이 하이퍼파라미터 값으로 테스트한다."""
-        parameter.test()
-        self.tuning.append(parameter)
-        self.tested = datetime.datetime.now(tz=datetime.timezone.utc)
         
-    def classify(self, parameter: Hyperparameter, sample: Sample) -> Sample:
-        """샘플을 분류한다."""
-        Classification = parameter.classify(sample)
-        sample.classify(Classification)
-        return sample
+FEATURES = ("sepal_length", "sepal_width", "petal_length", "petal_width")
+
+
+def as_array(samples: Iterable[Sample]) -> np.ndarray:
+    """샘플들을 (n, 4) 특성 행렬로 변환한다."""
+    if isinstance(samples, SampleStore):
+        return samples.measurements()
+    return np.array(
+        [[getattr(s, name) for name in FEATURES] for s in samples],
+        dtype=np.float64,
+    ).reshape(-1, len(FEATURES))
+
+
+def parse_measurements(row: object) -> list[float]:
+    """JSON으로 받은 한 행(객체 또는 4개 값 배열)을 측정값 목록으로 바꾼다."""
+    if isinstance(row, dict):
+        values = [row.get(name) for name in FEATURES]
+    elif isinstance(row, (list, tuple)):
+        values = list(row)
+    else:
+        raise ValueError("expected an object or an array of measurements")
+    if len(values) != len(FEATURES) or not all(
+        isinstance(value, (int, float)) and not isinstance(value, bool) for value in values
+    ):
+        raise ValueError(f"expected numeric {', '.join(FEATURES)}")
+    measurements = [float(value) for value in values]
+    if not all(isfinite(value) for value in measurements):
+        raise ValueError("non-finite measurement")
+    return measurements
+
+
+def _header(line: bytes) -> bool:
+    """앞 네 열이 측정값 이름이면 머리글 (sepal_length, "Sepal.Length", SepalLength 모두 같다)
     
+    이름이 맞지 않는 첫 줄은 데이터 행으로 두어, 잘못된 행이면 거부되고 줄 번호가 남는다.
+    """
+    fields = line.decode(errors="replace").split(",")[: len(FEATURES)]
+    names = ["".join(c for c in field.lower() if c.isalpha()) for field in fields]
+    return names == [feature.replace("_", "") for feature in FEATURES]
+
+
+def line_chunks(
+    stream: BinaryIO, chunk_bytes: int, skip_header: bool = False
+) -> Iterator[tuple[int, bytes]]:
+    """줄 경계에서 자른 (첫 줄 번호, 바이트) 덩어리, skip_header이면 첫 줄이 머리글일 때 뺀다."""
+    line = 1
+    tail = b""
+    while True:
+        block = stream.read(chunk_bytes)
+        data = tail + block
+        if block:
+            cut = data.rfind(b"\n") + 1
+            data, tail = data[:cut], data[cut:]
+            if not data:
+                continue
+        if not data:
+            return
+        first = line
+        line += data.count(b"\n")
+        if skip_header:
+            skip_header = False
+            end = data.find(b"\n") + 1 or len(data)
+            if _header(data[:end]):
+                data, first = data[end:], first + 1
+        yield first, data
+        if not block:
+            return
+
+
+def parse_csv(
+    text: str, first_line: int, labelled: bool
+) -> tuple[np.ndarray, Optional[np.ndarray], np.ndarray, dict[int, str]]:
+    """CSV 덩어리의 (n, 4) 측정값, labelled이면 품종 이름 배열, 각 행의 줄 번호, 줄 번호별 거부 이유
     
+    앞 네 열이 측정값이고 labelled이면 다섯째 열이 품종이다. 뒤의 열과 빈 줄은 무시하고,
+    #으로 시작하는 줄도 주석이 아니라 잘못된 행으로 거부한다.
+    np.loadtxt로 한 번에 읽고, 실패하면 줄마다 다시 읽어 잘못된 줄만 뺀다.
+    """
+    columns = len(FEATURES) + labelled
+    lines = text.split("\n")
+    numbers = np.array(
+        [n for n, line in enumerate(lines, start=first_line) if line.strip()], dtype=np.int64
+    )
+    if not len(numbers):
+        return np.empty((0, len(FEATURES))), np.array([], dtype=str) if labelled else None, numbers, {}
+    try:
+        features = np.loadtxt(
+            io.StringIO(text), delimiter=",", comments=None, usecols=range(len(FEATURES)), ndmin=2
+        )
+        species = None
+        if labelled:
+            species = np.char.strip(np.loadtxt(
+                io.StringIO(text), delimiter=",", comments=None, usecols=len(FEATURES), dtype=str, ndmin=1
+            ))
+        if (
+            len(features) == len(numbers)
+            and np.isfinite(features).all()
+            and (species is None or (np.char.str_len(species) > 0).all())
+        ):
+            return features, species, numbers, {}
+    except ValueError:
+        pass
+    rows: list[list[float]] = []
+    names: list[str] = []
+    kept: list[int] = []
+    errors: dict[int, str] = {}
+    for n, line in enumerate(lines, start=first_line):
+        if not line.strip():
+            continue
+        fields = line.strip().split(",")
+        try:
+            if len(fields) < columns or (labelled and not fields[len(FEATURES)].strip()):
+                raise ValueError(f"expected {columns} fields")
+            values = [float(field) for field in fields[: len(FEATURES)]]
+            if not all(isfinite(value) for value in values):
+                raise ValueError("non-finite measurement")
+        except ValueError as ex:
+            errors[n] = str(ex)
+            continue
+        rows.append(values)
+        kept.append(n)
+        if labelled:
+            names.append(fields[len(FEATURES)].strip())
+    return (
+        np.array(rows, dtype=np.float64).reshape(-1, len(FEATURES)),
+        np.array(names, dtype=str) if labelled else None,
+        np.array(kept, dtype=np.int64),
+        errors,
+    )
+
+
+def vote(neighbor_codes: np.ndarray, n_species: int) -> np.ndarray:
+    """이웃의 품종 코드로 다수결, 동점이면 작은 코드가 이긴다."""
+    counts = (neighbor_codes[..., np.newaxis] == np.arange(n_species)).sum(axis=1)
+    return counts.argmax(axis=1)
+
+
 class Distance:
+    metric: Optional[str] = None
+
     def distance(self, s1: Sample, s2:Sample) -> float:
         pass
     
+    def partial_distance(self, s1: Sample, s2: Sample, bound: float) -> float:
+        """distance()와 같지만, 결과가 bound보다 크다는 것이 확실해지면 그만두고
+        bound보다 큰 값을 돌려준다."""
+        return self.distance(s1, s2)
+    
+    def distances(self, queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+        """(m, 4) 질의 블록과 (n, 4) 학습 데이터 사이의 (m, n) 거리 행렬"""
+        raise NotImplementedError
+    
+    def paired_distances(self, queries: np.ndarray, points: np.ndarray) -> np.ndarray:
+        """(m, 4) 질의마다 자기 (m, k, 4) 점들까지의 (m, k) 거리"""
+        raise NotImplementedError
+    
+    @staticmethod
+    def _paired(queries: np.ndarray, points: np.ndarray) -> np.ndarray:
+        return np.abs(
+            points.astype(np.float64) - queries.astype(np.float64)[:, np.newaxis, :]
+        )
+    
+    @staticmethod
+    def _differences(queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+        return np.abs(queries[:, np.newaxis, :] - training[np.newaxis, :, :])
+    
     
 class ED(Distance):
+    metric = "euclidean"
+    
     def distance(self, s1: Sample, s2: Sample) -> float:
-        return (
+        return hypot(
             s1.sepal_length - s2.sepal_length,
             s1.sepal_width - s2.sepal_width,
             s1.petal_length - s2.petal_length,
-            s2.petal_width - s2.petal_width,
+            s1.petal_width - s2.petal_width,
             )
+    
+    def partial_distance(self, s1: Sample, s2: Sample, bound: float) -> float:
+        limit = bound * bound
+        total = (s1.sepal_length - s2.sepal_length) ** 2
+        if total > limit:
+            return sqrt(total)
+        total += (s1.sepal_width - s2.sepal_width) ** 2
+        if total > limit:
+            return sqrt(total)
+        total += (s1.petal_length - s2.petal_length) ** 2
+        if total > limit:
+            return sqrt(total)
+        return sqrt(total + (s1.petal_width - s2.petal_width) ** 2)
+    
+    def distances(self, queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+        if np.issubdtype(training.dtype, np.integer):
+            # 고정 소수점 값은 정수라서 좌표가 2048 미만이면 제곱합이 2**24를 넘지 않고,
+            # float32 내적으로도 오차 없이 정확한 정수 거리 제곱이 나온다.
+            queries, training = queries.astype(np.float32), training.astype(np.float32)
+        squared = (
+            (queries ** 2).sum(axis=1)[:, np.newaxis]
+            + (training ** 2).sum(axis=1)[np.newaxis, :]
+            - 2 * queries @ training.T
+        )
+        return np.sqrt(np.maximum(squared, 0.0))
+    
+    def paired_distances(self, queries: np.ndarray, points: np.ndarray) -> np.ndarray:
+        return np.sqrt((self._paired(queries, points) ** 2).sum(axis=2))
         
 
 class MD(Distance):
+    metric = "manhattan"
+    
     def distance(self, s1: Sample, s2: Sample) -> float:
         return sum(
             [
@@ -212,9 +466,29 @@ class MD(Distance):
                 abs(s1.petal_width - s2.petal_width),               
             ]
         )
+    
+    def partial_distance(self, s1: Sample, s2: Sample, bound: float) -> float:
+        total = abs(s1.sepal_length - s2.sepal_length)
+        if total > bound:
+            return total
+        total += abs(s1.sepal_width - s2.sepal_width)
+        if total > bound:
+            return total
+        total += abs(s1.petal_length - s2.petal_length)
+        if total > bound:
+            return total
+        return total + abs(s1.petal_width - s2.petal_width)
+    
+    def distances(self, queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+        return self._differences(queries, training).sum(axis=2)
+    
+    def paired_distances(self, queries: np.ndarray, points: np.ndarray) -> np.ndarray:
+        return self._paired(queries, points).sum(axis=2)
         
         
 class CD(Distance):
+    metric = "chebyshev"
+    
     def distance(self, s1: Sample, s2: Sample) -> float:
         return max(
             [
@@ -225,6 +499,24 @@ class CD(Distance):
             ]
         )
     
+    def partial_distance(self, s1: Sample, s2: Sample, bound: float) -> float:
+        largest = abs(s1.sepal_length - s2.sepal_length)
+        if largest > bound:
+            return largest
+        largest = max(largest, abs(s1.sepal_width - s2.sepal_width))
+        if largest > bound:
+            return largest
+        largest = max(largest, abs(s1.petal_length - s2.petal_length))
+        if largest > bound:
+            return largest
+        return max(largest, abs(s1.petal_width - s2.petal_width))
+    
+    def distances(self, queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+        return self._differences(queries, training).max(axis=2)
+    
+    def paired_distances(self, queries: np.ndarray, points: np.ndarray) -> np.ndarray:
+        return self._paired(queries, points).max(axis=2)
+    
     
 class SD(Distance):
     def distance(self, s1: Sample, s2: Sample) -> float:
@@ -243,67 +535,301 @@ class SD(Distance):
                  s1.petal_width + s2.petal_width,
              ]
          )
-         
-         
-class TrainingKnownSample(KnownSample):
-    @classmethod
-    def from_dict(cls, row: dict[str, str]) -> "TrainingKnownSample":
-        return cast(TrainingKnownSample, super.from_dict(row))
     
-
-class KnownSample(Sample):
+    def partial_distance(self, s1: Sample, s2: Sample, bound: float) -> float:
+        # 분모는 측정값 합이라 먼저 구할 수 있고, 분자만 쌓아 가며 bound * 분모와 비교한다.
+        total = (
+            s1.sepal_length + s2.sepal_length + s1.sepal_width + s2.sepal_width
+            + s1.petal_length + s2.petal_length + s1.petal_width + s2.petal_width
+        )
+        limit = bound * total
+        difference = abs(s1.sepal_length - s2.sepal_length)
+        if difference > limit:
+            return difference / total
+        difference += abs(s1.sepal_width - s2.sepal_width)
+        if difference > limit:
+            return difference / total
+        difference += abs(s1.petal_length - s2.petal_length)
+        if difference > limit:
+            return difference / total
+        return (difference + abs(s1.petal_width - s2.petal_width)) / total
     
-    def __init__(
-        self, 
-        species: str,
-        sepal_length: float, 
-        sepal_width: float, 
-        petal_length: float, 
-        petal_width: float, 
-    ) -> None:
-        super().__init__(
-            sepal_length=sepal_length,
-            sepal_width=sepal_width,
-            petal_length=petal_length,
-            petal_width=petal_width,
+    def distances(self, queries: np.ndarray, training: np.ndarray) -> np.ndarray:
+        return self._differences(queries, training).sum(axis=2) / (
+            queries.sum(axis=1)[:, np.newaxis] + training.sum(axis=1)[np.newaxis, :]
         )
-        self.species = species
-        
-    def __repr__(self) -> str:
-        return (
-            f"{self.__class__.__name__}("
-            f"sepal_length={self.sepal_length},"
-            f"sepal_width={self.sepal_length},"
-            f"petal_length={self.petal_length},"
-            f"petal_width={self.petal_width},"
-            f"species={self.species!r},"
-            f")"
-            )
-        
-                
+    
+    def paired_distances(self, queries: np.ndarray, points: np.ndarray) -> np.ndarray:
+        return self._paired(queries, points).sum(axis=2) / (
+            queries.sum(axis=1)[:, np.newaxis] + points.sum(axis=2, dtype=np.float64)
+        )
+         
+         
 class TrainingData:
     
-    def __init__(self, name: str) -> None:
+    # changes_since()로 돌려줄 수 있는 최근 변경 수
+    journal_size = 4_096
+    
+    def __init__(self, name: str, dtype: type = np.float64) -> None:
+        """dtype은 학습 특성의 저장 형식, np.float32나 고정 소수점 np.int16을 고를 수 있다.
+        
+        테스트 특성은 질의로 쓰이므로 정수 형식이면 float64로 둔다.
+        """
         self.name = name
+        self.dtype = dtype
         self.uploaded: datetime.datetime
         self.tested: datetime.datetime
-        self.training: list[KnownSample] = []
-        self.testing: list[KnownSample] = []
+        self.species = SpeciesTable()
+        self.training = SampleStore(Purpose.Training, self.species, dtype)
+        self.testing = SampleStore(Purpose.Testing, self.species, self._testing_dtype)
         self.tuning: list[Hyperparameter] = []
+        self._index: Optional[DynamicIndex] = None
+        self._grid: Optional[DynamicGridIndex] = None
+        self.version = 0
+        self._changes: collections.deque[tuple[int, int, bool]] = collections.deque(
+            maxlen=self.journal_size
+        )
         
-    def load(self, raw_data_iter: Iterable[dict[str, str]]) -> None:
-        for n, row in enumerate(raw_data_iter):
-            try:
-                if n % 5 == 0:
-                    test = TestingKnownSample.from_dict(row)
-                    self.testing.append(test)
-                else:
-                    train = TrainingKnownSample.from_dict(row)
-                    self.training.append(train)
-            except InvalidSampleError as ex:
-                print(f"Row {n+1}: {ex}")
-                return
+    @classmethod
+    def from_arrays(
+        cls,
+        name: str,
+        species: list[str],
+        training: tuple[np.ndarray, np.ndarray],
+        testing: tuple[np.ndarray, np.ndarray],
+    ) -> "TrainingData":
+        """이미 만들어진 특성 배열과 품종 코드를 복사 없이 감싼다."""
+        training_data = cls(name, training[0].dtype.type)
+        training_data.species = SpeciesTable(species)
+        training_data.training = SampleStore.from_arrays(
+            Purpose.Training, training_data.species, *training
+        )
+        training_data.testing = SampleStore.from_arrays(
+            Purpose.Testing, training_data.species, *testing
+        )
+        return training_data
+    
+    @classmethod
+    def open(cls, source: Path) -> "TrainingData":
+        """이진 데이터셋 파일을 mmap으로 복사 없이 연다."""
+        from dataset import open_dataset
+        
+        with metrics.timer(metrics.LOAD_SECONDS, "binary"):
+            training_data = open_dataset(source)
+        metrics.observe_sizes(training_data.training.live, training_data.testing.live)
+        return training_data
+    
+    @classmethod
+    def open_model(
+        cls, source: Path, verify: bool = True
+    ) -> tuple["TrainingData", Hyperparameter]:
+        """모델 스냅숏을 mmap으로 열어 데이터와 저장했던 Hyperparameter를 되살린다."""
+        from snapshot import open_model
+        
+        with metrics.timer(metrics.LOAD_SECONDS, "snapshot"):
+            training_data, parameter = open_model(source, verify)
+        metrics.observe_sizes(training_data.training.live, training_data.testing.live)
+        return training_data, parameter
+    
+    @classmethod
+    def open_source(
+        cls, source: Path, verify: bool = True
+    ) -> tuple["TrainingData", Optional[Hyperparameter]]:
+        """매직을 보고 모델 스냅숏이나 이진 데이터셋을 연다. 데이터셋이면 Hyperparameter는 None"""
+        from snapshot import MAGIC
+        
+        with source.open("rb") as source_file:
+            magic = source_file.read(len(MAGIC))
+        if magic == MAGIC:
+            return cls.open_model(source, verify)
+        return cls.open(source), None
+    
+    @property
+    def _testing_dtype(self) -> type:
+        return self.dtype if np.issubdtype(self.dtype, np.floating) else np.float64
+    
+    def with_dtype(self, dtype: type) -> "TrainingData":
+        """학습 특성을 dtype 형식으로 옮긴 복사본, 테스트 쪽과 품종 표는 그대로 쓴다."""
+        training_data = TrainingData(self.name, dtype)
+        training_data.species = self.species
+        training_data.training = SampleStore(Purpose.Training, self.species, dtype)
+        features, codes = self.training.live_arrays()
+        training_data.training.extend_arrays(self.training.decode(features), codes)
+        training_data.testing = self.testing
+        return training_data
+    
+    def save(self, target: Path) -> None:
+        """학습/테스트 분할을 이진 데이터셋 파일로 저장한다."""
+        from dataset import save
+        
+        save(self, target)
+        
+    def _reset(self) -> None:
+        self.training = SampleStore(Purpose.Training, self.species, self.dtype)
+        self.testing = SampleStore(Purpose.Testing, self.species, self._testing_dtype)
+        self._index = None
+        self._grid = None
+        self._changes.clear()
+        self.version += 1
+        
+    def load(self, raw_data_iter: Iterable[dict[str, str]]) -> LoadReport:
+        """행마다 읽어 들인다. load_csv처럼 받아들인 행 다섯에 하나를 테스트 쪽에 둔다."""
+        self._reset()
+        report = LoadReport()
+        with metrics.timer(metrics.LOAD_SECONDS, "rows"):
+            for n, row in enumerate(raw_data_iter):
+                try:
+                    if report.rows % 5 == 0:
+                        self.testing.append_dict(row)
+                    else:
+                        self.training.append_dict(row)
+                    report.rows += 1
+                except InvalidSampleError as ex:
+                    report.reject(n + 1, str(ex))
+        metrics.observe_sizes(self.training.live, self.testing.live)
+        report.tick()
         self.uploaded = datetime.datetime.now(tz=datetime.timezone.utc)
+        return report
+    
+    def load_csv(
+        self,
+        source: Path,
+        chunk_bytes: int = 1 << 24,
+        progress: Optional[Callable[[LoadReport], None]] = None,
+    ) -> LoadReport:
+        """CSV 파일을 덩어리 단위로 특성 배열에 바로 읽어 들인다."""
+        self._reset()
+        report = LoadReport(total_bytes=source.stat().st_size)
+        with metrics.timer(metrics.LOAD_SECONDS, "csv"):
+            for features, names in SampleReader(source).chunks(report, chunk_bytes):
+                unique, inverse = np.unique(names, return_inverse=True)
+                codes = np.array([self.species.code(str(name)) for name in unique], dtype=np.int16)
+                testing = (report.rows + np.arange(len(names))) % 5 == 0
+                self.testing.extend_arrays(features[testing], codes[inverse][testing])
+                self.training.extend_arrays(features[~testing], codes[inverse][~testing])
+                report.rows += len(names)
+                report.tick()
+                if progress:
+                    progress(report)
+        metrics.observe_sizes(self.training.live, self.testing.live)
+        self.uploaded = datetime.datetime.now(tz=datetime.timezone.utc)
+        return report
+        
+    def statistics(self, purpose: Optional[Purpose] = None) -> SpeciesAggregates:
+        """품종별 특성 집계, purpose가 없으면 학습과 테스트를 합친다.
+        
+        처음 물을 때 세어 두고, 이후에는 더하거나 지운 샘플만 반영한다.
+        mmap으로 연 큰 데이터셋도 여는 데는 전체를 읽지 않는다.
+        """
+        if purpose == Purpose.Training:
+            return self.training.aggregates()
+        if purpose == Purpose.Testing:
+            return self.testing.aggregates()
+        return self.training.aggregates().merged(self.testing.aggregates())
+        
+    def training_arrays(self) -> tuple[np.ndarray, np.ndarray, list[str]]:
+        """학습 특성 행렬, 품종 코드, 품종 이름"""
+        return self.training.features, self.training.codes, self.species.names
+    
+    def index(self) -> DynamicIndex:
+        """학습 특성 위의 KD-트리 색인 (로드 후 한 번만 만들고, 이후에는 갱신한다)"""
+        if self._index is None:
+            rows = self.training.live_rows()
+            self._index = DynamicIndex(self.training.features[rows], rows)
+        return self._index
+    
+    def grid_index(self) -> DynamicGridIndex:
+        """근사 탐색용 격자 색인 (로드 후 한 번만 만들고, 이후에는 갱신한다)"""
+        if self._grid is None:
+            rows = self.training.live_rows()
+            self._grid = DynamicGridIndex(self.training.features[rows], rows)
+        return self._grid
+    
+    def add(self, row: SampleDict, purpose: Purpose) -> None:
+        """샘플 하나를 학습 또는 테스트 쪽에 추가하고 색인을 갱신한다."""
+        store = self.training if purpose == Purpose.Training else self.testing
+        store.append_dict(cast(dict[str, str], row))
+        added = len(store) - 1 if store is self.training else -1
+        for index in (self._index, self._grid):
+            if added >= 0 and index is not None:
+                index.insert(added, store.features[-1])
+                self._maintain_index(index)
+        self._changed(added, True)
+        
+    def remove(self, row: int) -> None:
+        """학습 샘플 하나를 지우고 색인을 갱신한다. 이미 지운 행이면 아무것도 하지 않는다."""
+        if not self.training.remove(row):
+            return
+        for index in (self._index, self._grid):
+            if index is not None:
+                index.delete(row)
+                self._maintain_index(index)
+        self._changed(row, False)
+        
+    def _changed(self, row: int, added: bool) -> None:
+        self.version += 1
+        self._changes.append((self.version, row, added))
+        metrics.observe_sizes(self.training.live, self.testing.live)
+        
+    def changes_since(self, version: int) -> Optional[list[tuple[int, bool]]]:
+        """version 이후 학습 쪽에 더하거나 지운 (행, 더했는지) 목록
+        
+        그 사이에 다시 로드했거나 기록이 journal_size개를 넘어 모자라면 None이다.
+        그때는 처음부터 다시 만들어야 한다.
+        """
+        if version == self.version:
+            return []
+        if not self._changes or self._changes[0][0] > version + 1:
+            return None
+        return [(row, added) for seen, row, added in self._changes if seen > version and row >= 0]
+        
+    def _maintain_index(self, index: DynamicIndex) -> None:
+        if index.needs_compaction():
+            rows = self.training.live_rows()
+            index.compact(self.training.features[rows], rows)
+    
+    def testing_arrays(self) -> np.ndarray:
+        """테스트 특성 행렬"""
+        return self.testing.features
+        
+    def test(self, parameter: Hyperparameter) -> None:
+        """이 하이퍼파라미터 값으로 테스트한다."""
+        parameter.test()
+        self.tuning.append(parameter)
+        self.tested = datetime.datetime.now(tz=datetime.timezone.utc)
+        
+    def sweep(
+        self, algorithms: Iterable["Distance"], k_max: int
+    ) -> list[Hyperparameter]:
+        """거리 알고리듬마다 한 번의 이웃 탐색으로 k = 1..k_max를 모두 테스트한다."""
+        from tuning import sweep_k
+        
+        parameters: list[Hyperparameter] = []
+        for algorithm in algorithms:
+            parameters.extend(sweep_k(self, algorithm, k_max))
+        self.tuning.extend(parameters)
+        self.tested = datetime.datetime.now(tz=datetime.timezone.utc)
+        return parameters
+        
+    def grid_search(
+        self,
+        k_values: Iterable[int],
+        algorithms: Iterable[type["Distance"]],
+        max_workers: Optional[int] = None,
+    ) -> list[Hyperparameter]:
+        """k와 거리 알고리듬의 모든 조합을 프로세스 풀에서 테스트한다."""
+        from tuning import grid_search
+        
+        parameters = grid_search(self, k_values, algorithms, max_workers)
+        self.tuning.extend(parameters)
+        self.tested = datetime.datetime.now(tz=datetime.timezone.utc)
+        return parameters
+        
+    def classify(self, parameter: Hyperparameter, sample: Sample) -> Sample:
+        """샘플을 분류한다."""
+        classification = parameter.classify(sample)
+        sample.classify(classification)
+        return sample
         
 
 class SampleReader:
@@ -314,7 +840,7 @@ class SampleReader:
         "petal_length", "petal_width", "class"
     ]
     
-    def __init__(self, source: path) -> None:
+    def __init__(self, source: Path) -> None:
         self.source = source
         
     def Sample_iter(self) -> Iterator[Sample]:
@@ -333,11 +859,71 @@ class SampleReader:
                     raise BadSampleRow(f"Invalid {row!r}") from ex
                 yield sample
                 
+    def chunks(
+        self, report: "LoadReport", chunk_bytes: int = 1 << 24
+    ) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """큰 덩어리 단위로 읽어 (n, 4) 특성 행렬과 품종 이름 배열을 만든다.
+        
+        잘못된 행은 행 번호와 함께 report에 기록하고 건너뛴다.
+        """
+        with self.source.open("rb") as source_file:
+            for first_row, data in line_chunks(source_file, chunk_bytes, skip_header=True):
+                report.bytes_read = source_file.tell()
+                text = data.decode()
+                features, species, _, errors = parse_csv(text, first_row, labelled=True)
+                if errors:
+                    lines = text.split("\n")
+                    for n, reason in errors.items():
+                        report.reject(n, f"{lines[n - first_row]!r}: {reason}")
+                yield features, cast(np.ndarray, species)
+        
+
+class LoadReport:
+    """로드한 행 수, 거부된 행과 그 이유, 처리 속도"""
+    
+    def __init__(self, total_bytes: Optional[int] = None) -> None:
+        self.rows = 0
+        self.rejected: list[tuple[int, str]] = []
+        self.bytes_read = 0
+        self.total_bytes = total_bytes
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        
+    def reject(self, row: int, reason: str) -> None:
+        self.rejected.append((row, reason))
+        
+    def tick(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+    
+    @property
+    def progress(self) -> Optional[float]:
+        if not self.total_bytes:
+            return None
+        return self.bytes_read / self.total_bytes
+    
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}("
+            f"rows={self.rows},"
+            f"rejected={len(self.rejected)},"
+            f"elapsed={self.elapsed:.3f},"
+            f"rows_per_second={self.rows_per_second:.0f}"
+            f")"
+        )
+        
 
 class BadSampleRow(ValueError):
     pass
 
 
+class InvalidSampleError(ValueError):
+    """소스 데이터 파일이 유효하지 않은 데이터 표현을 가지고 있다."""
+
+
 class Purpose(enum.IntEnum):
     Classification = 0
     Testing = 1
@@ -360,15 +946,15 @@ class KnownSample(Sample):
             raise ValueError(
                 f"Invalid purpose: {purpose!r}: {Purpose_enum}"
             )
+        self.purpose = Purpose_enum
+        self._Classification: Optional[str] = None
         super().__init__(
             sepal_length=sepal_length, 
             sepal_width=sepal_width, 
             petal_length=petal_length,
             petal_width=petal_width, 
+            species=species,
            )
-        self.purpose = Purpose_enum
-        self.species = species
-        self._Classification: Optional[str] = None
         
     def matches(self) -> bool:
         return self.species == self.classification
@@ -381,19 +967,122 @@ class KnownSample(Sample):
             raise AttributeError(f"Training sample have no classification")
         
     @classification.setter
-    def classification(self, value: str) -> None:
+    def classification(self, value: Optional[str]) -> None:
         if self.purpose == Purpose.Testing:
-            self._classification - value
-        else:
+            self._Classification = value
+        elif value is not None:
             raise AttributeError(
                  f"Training sample cannot be classified"
                 
             )
             
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}("
+            f"sepal_length={self.sepal_length},"
+            f"sepal_width={self.sepal_width},"
+            f"petal_length={self.petal_length},"
+            f"petal_width={self.petal_width},"
+            f"species={self.species!r},"
+            f"purpose={self.purpose.name}"
+            f")"
+        )
+        
+        
+class TrainingKnownSample(KnownSample):
+    """학습 샘플, 분류할 수 없음."""
+    
+    def __init__(
+        self,
+        sepal_length: float,
+        sepal_width: float,
+        petal_length: float,
+        petal_width: float,
+        species: str,
+    ) -> None:
+        super().__init__(
+            sepal_length, sepal_width, petal_length, petal_width, Purpose.Training, species
+        )
+        
+        
+class TestingKnownSample(KnownSample):
+    """테스트 샘플, 분류 결과를 담는다."""
+    
+    def __init__(
+        self,
+        sepal_length: float,
+        sepal_width: float,
+        petal_length: float,
+        petal_width: float,
+        species: str,
+    ) -> None:
+        super().__init__(
+            sepal_length, sepal_width, petal_length, petal_width, Purpose.Testing, species
+        )
+        
+        
+class SampleDict(TypedDict):
+    sepal_length: float
+    sepal_width: float
+    petal_length: float
+    petal_width: float
+    species: str
+
+
+class PartitionView(Sequence[Any]):
+    """분할의 한쪽을 행 번호로만 가리키는 읽기 전용 뷰
+    
+    행을 복사하지 않고, 샘플 객체는 꺼낼 때마다 factory로 만든다.
+    """
+    
+    __slots__ = ("_rows", "_index", "_factory")
+    
+    def __init__(
+        self, rows: list[SampleDict], index: np.ndarray, factory: Callable[..., Any]
+    ) -> None:
+        self._rows = rows
+        self._index = index
+        self._index.flags.writeable = False
+        self._factory = factory
+        
+    @property
+    def index(self) -> np.ndarray:
+        """원래 행 목록에서의 행 번호"""
+        return self._index
+        
+    def __len__(self) -> int:
+        return len(self._index)
+    
+    @overload
+    def __getitem__(self, position: int) -> Any:
+        ...
+        
+    @overload
+    def __getitem__(self, position: slice) -> "PartitionView":
+        ...
+    
+    def __getitem__(self, position: Union[int, slice]) -> Any:
+        if isinstance(position, slice):
+            return PartitionView(self._rows, self._index[position], self._factory)
+        return self._factory(**self._rows[self._index[position]])
+    
+    def __iter__(self) -> Iterator[Any]:
+        rows, factory = self._rows, self._factory
+        for n in self._index.tolist():
+            yield factory(**rows[n])
+            
+    def dicts(self) -> Iterator[SampleDict]:
+        """샘플 객체를 만들지 않고 원래 행을 그대로 내놓는다."""
+        rows = self._rows
+        for n in self._index.tolist():
+            yield rows[n]
             
-class SamplePartition(list[SampleDict], abc.ABC ):
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({len(self)} rows)"
+
 
-       
+class SamplePartition(list[SampleDict], abc.ABC):
+    
     def __init__(
         self,
         iterable: Optional[Iterable[SampleDict]] = None,
@@ -406,80 +1095,123 @@ class SamplePartition(list[SampleDict], abc.ABC ):
         else:
             super().__init__()
             
-        @abc.abstractproperty
-        @property
-        def training(self) -> list[TrainingKnownSample]:
-            
-        @abc.abstractproperty
-        @property
-        def testing(self) -> list[TestingKnownSample]:
-            
-      
+    @property
+    @abc.abstractmethod
+    def training(self) -> Sequence[TrainingKnownSample]:
+        ...
+        
+    @property
+    @abc.abstractmethod
+    def testing(self) -> Sequence[TestingKnownSample]:
+        ...
+        
+        
 class ShufflingSamplePartition(SamplePartition):
+    """행 순서를 섞어 앞쪽 training_subset 비율을 학습에 쓰는 분할
+    
+    행 목록은 그대로 두고 섞은 행 번호만 만든다. training과 testing은 행 수가
+    바뀌지 않는 한 같은 뷰를 돌려주므로 몇 번을 읽어도 복사가 없다.
+    seed를 주면 항상 같은 순서로 섞고, stratify이면 품종마다 같은 비율로 나눈다.
+    """
+    
     def __init__(
         self, 
         iterable: Optional[Iterable[SampleDict]] = None,
         *, 
         training_subset: float = 0.8,
+        seed: Optional[int] = None,
+        stratify: bool = False,
         ) -> None:
         super().__init__(iterable, training_subset=training_subset)
+        self.seed = seed
+        self.stratify = stratify
         self.split: Optional[int] = None
+        self._views: Optional[tuple[int, PartitionView, PartitionView]] = None
         
-        def shuffle(self) -> None:
-            if not self.split:
-                random.shuffle(self)
-                self.split = int(len(self) * self.training_subset)
+    def shuffle(self) -> tuple[PartitionView, PartitionView]:
+        """(학습 뷰, 테스트 뷰), 행이 더해졌을 때만 다시 나눈다."""
+        if self._views is None or self._views[0] != len(self):
+            order = np.random.default_rng(self.seed).permutation(len(self))
+            if self.stratify:
+                is_training = self._stratified(order)
+            else:
+                is_training = np.arange(len(self)) < int(len(self) * self.training_subset)
+            self.split = int(is_training.sum())
+            self._views = (
+                len(self),
+                PartitionView(self, order[is_training], TrainingKnownSample),
+                PartitionView(self, order[~is_training], TestingKnownSample),
+            )
+        return self._views[1], self._views[2]
+    
+    def _stratified(self, order: np.ndarray) -> np.ndarray:
+        """섞은 순서에서 품종마다 앞쪽 training_subset 비율을 고른 표시"""
+        species = np.array([self[n]["species"] for n in order.tolist()])
+        is_training = np.zeros(len(order), dtype=bool)
+        for name in np.unique(species):
+            positions = np.flatnonzero(species == name)
+            is_training[positions[: int(round(len(positions) * self.training_subset))]] = True
+        return is_training
                 
     @property
-    def training(self) -> list[TrainingKnownSample]:
-        self.shuffle()
-        return[TrainingKnownSample(**sd) for sd in self[:self.split]]
+    def training(self) -> PartitionView:
+        return self.shuffle()[0]
     
     @property
-    def testing(self) -> list[TestingKnownSample]:
-        self.shuffle()
-        return[TestingKnownSample(**sd) for sd in self[self.split :]]
+    def testing(self) -> PartitionView:
+        return self.shuffle()[1]
     
 
-class SampleDict(TypeDict):
-    sepal_length: float
-    sepal_width: float
-    petal_length: float
-    petal_width: float
-    species: str
-    
+class KFoldSamplePartition(SamplePartition):
+    """k-겹 교차 검증용 분할, fold 번째 조각이 테스트 쪽이다."""
     
-class shufflingPartition(SamplePartition):
     def __init__(
-        self, 
-        iterable: Optional[Iterable[SampleDict]] = None, 
-        *, 
-        training_subset: float = 0.8
+        self,
+        iterable: Optional[Iterable[SampleDict]] = None,
+        *,
+        folds: int = 5,
+        seed: Optional[int] = None,
     ) -> None:
-        super().__init__(iterable, training_subset=training_subset)
-        self.split: Optional[int] =None
+        super().__init__(iterable, training_subset=1 - 1 / folds)
+        self.folds = folds
+        self.seed = seed
+        self.fold = 0
+        self._views: dict[int, tuple[PartitionView, PartitionView]] = {}
+        self._size = 0
         
-    def shuffle(self) -> None:
-        if not self.split:
-            random.shuffle(self)
-            self.split = int(len(self) *self.training_subset)
-            
-        @property
-        def training(self) -> list[TrainingKnownSample]:
-            self.shuffle()
-            return [TrainingKnownSample(**sd) for sd in self[:self.split]]
-        
-        @property
-        def testing(self) -> list[TesitngKnownSample]:
-            self.shuffling()
-            return [TestingKnownSample(**sd) for sd in self[self.split :]]
-        
-        ssp= ShufflingSamplePartition(training_subset=0.67)
-        for row in data:
-            ssp.append(row)
-            
-
-class DealingPartition(abc,ABC):
+    def fold_rows(self, fold: int) -> tuple[np.ndarray, np.ndarray]:
+        """fold 번째 분할의 학습 행 번호와 테스트 행 번호"""
+        order = np.arange(len(self))
+        if self.seed is not None:
+            order = np.random.default_rng(self.seed).permutation(len(self))
+        testing = np.zeros(len(self), dtype=bool)
+        testing[order[fold :: self.folds]] = True
+        return np.flatnonzero(~testing), np.flatnonzero(testing)
+    
+    def views(self, fold: int) -> tuple[PartitionView, PartitionView]:
+        """fold 번째 분할의 (학습 뷰, 테스트 뷰), 행 수가 바뀔 때까지 다시 쓴다."""
+        if self._size != len(self):
+            self._views.clear()
+            self._size = len(self)
+        views = self._views.get(fold)
+        if views is None:
+            training, testing = self.fold_rows(fold)
+            views = self._views[fold] = (
+                PartitionView(self, training, TrainingKnownSample),
+                PartitionView(self, testing, TestingKnownSample),
+            )
+        return views
+    
+    @property
+    def training(self) -> PartitionView:
+        return self.views(self.fold)[0]
+    
+    @property
+    def testing(self) -> PartitionView:
+        return self.views(self.fold)[1]
+    
+    
+class DealingPartition(abc.ABC):
     @abc.abstractmethod
     def __init__(
         self,
@@ -487,25 +1219,37 @@ class DealingPartition(abc,ABC):
         *,
         training_subset: tuple[int, int] = (8,10)
     ) -> None:
+        ...
         
     @abc.abstractmethod
     def extend(self, items: Iterable[SampleDict]) -> None:
+        ...
         
     @abc.abstractmethod
     def append(self, item: SampleDict) -> None:
+        ...
         
+    @property
+    @abc.abstractmethod
+    def training(self) -> list[TrainingKnownSample]:
+        ...
+        
+    @property
     @abc.abstractmethod
     def testing(self) -> list[TestingKnownSample]:
+        ...
+        
         
-          
 class CountingDealingPartition(DealingPartition):
     def __init__(
         self, 
         items: Any | None, 
         *, 
         training_subset: tuple[int, int] = (8, 10),
+        target: Optional[TrainingData] = None,
         ) -> None:
         self.training_subset = training_subset
+        self.target = target
         self.counter = 0
         self._training: list[TrainingKnownSample] = []
         self._testing: list[TestingKnownSample] = []
@@ -520,9 +1264,13 @@ class CountingDealingPartition(DealingPartition):
         n, d = self.training_subset
         if self.counter % d < n:
             self._training.append(TrainingKnownSample(**item))
+            purpose = Purpose.Training
         else:
             self._testing.append(TestingKnownSample(**item))
-            self.counter +=1
+            purpose = Purpose.Testing
+        self.counter +=1
+        if self.target is not None:
+            self.target.add(item, purpose)
     @property
     def training(self) -> list[TrainingKnownSample]:
         return self._training
@@ -532,21 +1280,422 @@ class CountingDealingPartition(DealingPartition):
         return self._testing
 
 
-class TestingKnownSample:
+class PredictionCache:
+    """특성 튜플을 키로 하는 크기 제한 LRU 분류 결과 캐시
+    
+    키는 digits 자리로 반올림한 측정값이고, 분류도 반올림한 값으로 한다.
+    Hyperparameter가 바뀌거나 TrainingData가 다시 로드되면 모두 비운다.
+    여러 스레드가 함께 쓸 수 있다. 표는 잠그고 고치지만 분류는 잠그지 않고 한다.
+    """
+    
+    def __init__(self, maxsize: int = 65_536, digits: Optional[int] = 1) -> None:
+        self.maxsize = maxsize
+        self.digits = digits
+        self._entries: collections.OrderedDict[tuple[float, ...], str] = (
+            collections.OrderedDict()
+        )
+        self._parameter: Optional[weakref.ReferenceType[Hyperparameter]] = None
+        self._token: tuple[Any, ...] = ()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        
+    def _validate(self, parameter: Hyperparameter) -> tuple[Any, ...]:
+        """잠근 채로 부른다. 지금 쓰는 캐시 토큰을 돌려준다."""
+        training_data = parameter._training_data()
+        token = (
+            parameter.k,
+            type(parameter.algorithm),
+            parameter.probes,
+            id(training_data),
+            training_data.version,
+        )
+        if self._parameter is None or self._parameter() is not parameter or self._token != token:
+            self._entries.clear()
+            self._parameter = weakref.ref(parameter)
+            self._token = token
+        return token
+            
+    def _keys(self, queries: np.ndarray) -> np.ndarray:
+        if self.digits is None:
+            return np.asarray(queries, dtype=np.float64)
+        return np.round(np.asarray(queries, dtype=np.float64), self.digits)
+    
+    def classify(self, parameter: Hyperparameter, sample: Sample) -> str:
+        return self.classify_many(parameter, as_array([sample]))[0]
+    
+    def classify_many(self, parameter: Hyperparameter, queries: np.ndarray) -> list[str]:
+        """캐시에 없는 키만 모아 한 번에 분류한다.
+        
+        한 블록 안에서 같은 키가 또 나오면 처음 것만 miss이고 나머지는 hit으로 센다.
+        """
+        keys = [tuple(row) for row in self._keys(queries).tolist()]
+        results: list[Optional[str]] = []
+        missing: dict[tuple[float, ...], list[int]] = {}
+        hits = 0
+        with self._lock:
+            token = self._validate(parameter)
+            for n, key in enumerate(keys):
+                species = self._entries.get(key)
+                if species is not None:
+                    self._entries.move_to_end(key)
+                    hits += 1
+                elif key in missing:
+                    missing[key].append(n)
+                    hits += 1
+                else:
+                    missing[key] = [n]
+                results.append(species)
+            self.hits += hits
+            self.misses += len(missing)
+        evictions = 0
+        if missing:
+            names = parameter._training_data().training_arrays()[2]
+            codes = parameter.classify_codes(np.array(list(missing)))
+            with self._lock:
+                # 분류하는 사이에 모델이나 데이터가 바뀌었으면 결과를 캐시에 넣지 않는다.
+                keep = self._validate(parameter) == token
+                for (key, rows), code in zip(missing.items(), codes):
+                    for n in rows:
+                        results[n] = names[code]
+                    if keep:
+                        self._entries[key] = names[code]
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    evictions += 1
+                self.evictions += evictions
+        metrics.count(metrics.CACHE, hits, "hit")
+        metrics.count(metrics.CACHE, len(missing), "miss")
+        metrics.count(metrics.CACHE, evictions, "eviction")
+        return cast(list[str], results)
+    
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+    
+    
+class SpeciesTable:
+    """품종 이름과 정수 코드의 양방향 표"""
+    
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self.names: list[str] = []
+        self._codes: dict[str, int] = {}
+        for name in names:
+            self.code(name)
+            
+    def find(self, name: str) -> Optional[int]:
+        """이름의 코드, 없으면 None"""
+        return self._codes.get(name)
+    
+    def code(self, name: str) -> int:
+        """이름의 코드, 처음 보는 이름이면 새 코드를 붙인다."""
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    
+class SampleStore:
+    """(n, 4) 특성 행렬과 정수 품종 코드 열로 샘플을 저장한다.
+    
+    정수 dtype이면 측정값에 fixed_point_scale을 곱해 반올림한 고정 소수점으로
+    저장한다. 붓꽃 측정값은 소수 둘째 자리까지라 손실이 없다. features는 저장
+    단위 그대로이고, 측정값 단위로는 measurements()나 decode()로 읽는다.
+    """
+    
+    fixed_point_scale = 100
+    
     def __init__(
-        self, sample: KnownSample, Classification: Optional[str] = None
-        ) -> None:
-        self.sample = sample
-        self.classification = Classification
-
+        self,
+        purpose: Purpose,
+        species: SpeciesTable,
+        dtype: type = np.float64,
+        capacity: int = 1024,
+    ) -> None:
+        self.purpose = purpose
+        self.species = species
+        self.scale = self.fixed_point_scale if np.issubdtype(dtype, np.integer) else None
+        self._features = np.empty((capacity, len(FEATURES)), dtype=dtype)
+        self._codes = np.empty(capacity, dtype=np.int16)
+        self._classification = np.full(capacity, -1, dtype=np.int16)
+        self._removed: Optional[np.ndarray] = None
+        self._live = 0
+        self._size = 0
+        self._aggregates = SpeciesAggregates(len(FEATURES))
+        self._aggregated = 0
+        self._stale: set[int] = set()
+        self._aggregate_lock = threading.Lock()
+        
+    @classmethod
+    def from_arrays(
+        cls,
+        purpose: Purpose,
+        species: SpeciesTable,
+        features: np.ndarray,
+        codes: np.ndarray,
+    ) -> "SampleStore":
+        """기존 배열을 복사 없이 감싼다. append하면 그때 새 배열로 옮긴다."""
+        store = cls(purpose, species, features.dtype.type, capacity=0)
+        store._features = features
+        store._codes = codes
+        store._classification = np.full(len(codes), -1, dtype=np.int16)
+        store._size = store._live = len(codes)
+        return store
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __getitem__(self, row: int) -> "SampleView":
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        return SampleView(self, row)
+    
+    def __iter__(self) -> Iterator["SampleView"]:
+        for row in self.live_rows():
+            yield SampleView(self, int(row))
+            
+    @property
+    def live(self) -> int:
+        """지워지지 않은 행 수"""
+        return self._live
+    
+    @property
+    def removed(self) -> Optional[np.ndarray]:
+        """지워진 행 표시, 지운 적이 없으면 None"""
+        return None if self._removed is None else self._removed[: self._size]
+    
+    def live_rows(self) -> np.ndarray:
+        if self._removed is None:
+            return np.arange(self._size)
+        return np.flatnonzero(~self._removed[: self._size])
+    
+    def live_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """지워진 행을 뺀 특성 행렬과 품종 코드"""
+        if self._removed is None:
+            return self.features, self.codes
+        rows = self.live_rows()
+        return self.features[rows], self.codes[rows]
+    
+    def remove(self, row: int) -> bool:
+        """행을 지운 것으로 표시한다. 행 번호는 바뀌지 않는다. 이미 지운 행이면 False"""
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        if self._removed is None:
+            self._removed = np.zeros(len(self._codes), dtype=bool)
+        if self._removed[row]:
+            return False
+        self._removed[row] = True
+        self._live -= 1
+        code = int(self._codes[row])
+        with self._aggregate_lock:
+            if row < self._aggregated and not self._aggregates.discard(
+                self.decode(self._features[row]), code
+            ):
+                self._stale.add(code)
+        return True
+                
+    def aggregates(self) -> SpeciesAggregates:
+        """품종별 특성 집계
+        
+        처음 부를 때 모든 행을 세고, 이후에는 지난번 이후 덧붙은 행만 더하며
+        최솟값이나 최댓값이던 행이 지워진 품종만 처음부터 다시 센다.
+        """
+        with self._aggregate_lock:
+            if self._aggregated < self._size:
+                rows = slice(self._aggregated, self._size)
+                features, codes = self.features[rows], self.codes[rows]
+                if self._removed is not None:
+                    kept = ~self._removed[rows]
+                    features, codes = features[kept], codes[kept]
+                self._aggregates.add(self.decode(features), codes)
+                self._aggregated = self._size
+            for code in self._stale:
+                self._aggregates.reset(code)
+                rows = self.live_rows()
+                rows = rows[self.codes[rows] == code]
+                self._aggregates.add(self.decode(self.features[rows]), self.codes[rows])
+            self._stale.clear()
+            return self._aggregates
+            
+    @property
+    def features(self) -> np.ndarray:
+        """저장 단위의 특성 행렬"""
+        return self._features[: self._size]
+    
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        """측정값을 이 저장소의 저장 단위와 형식으로 바꾼다.
+        
+        유한하지 않거나 저장 형식에 담을 수 없는 값이 있으면 InvalidSampleError
+        """
+        dtype = self._features.dtype
+        if self.scale is None:
+            encoded = np.asarray(values, dtype=dtype)
+            if not np.isfinite(encoded).all():
+                raise InvalidSampleError(f"non-finite measurement for {dtype}")
+            return encoded
+        scaled = np.rint(np.asarray(values, dtype=np.float64) * self.scale)
+        if not np.isfinite(scaled).all():
+            raise InvalidSampleError("non-finite measurement")
+        limits = np.iinfo(dtype)
+        if scaled.size and (scaled.min() < limits.min or scaled.max() > limits.max):
+            raise InvalidSampleError(f"measurement out of range for {dtype} fixed point")
+        return scaled.astype(dtype)
+    
+    def decode(self, values: np.ndarray) -> np.ndarray:
+        """저장 단위의 값을 float64 측정값으로 바꾼다."""
+        if self.scale is None:
+            return np.asarray(values, dtype=np.float64)
+        return values / self.scale
+    
+    def measurements(self) -> np.ndarray:
+        return self.decode(self.features)
+    
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[: self._size]
+    
+    @property
+    def classification(self) -> np.ndarray:
+        if self.purpose != Purpose.Testing:
+            raise AttributeError("Training sample have no classification")
+        return self._classification[: self._size]
+    
+    def matches(self) -> np.ndarray:
+        if self._removed is None:
+            return self.classification == self.codes
+        rows = self.live_rows()
+        return self.classification[rows] == self.codes[rows]
+    
+    def reserve(self, size: int) -> None:
+        """size개 행이 들어갈 자리를 미리 확보한다."""
+        capacity = len(self._codes)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        features = np.empty((capacity, len(FEATURES)), dtype=self._features.dtype)
+        features[: self._size] = self.features
+        codes = np.empty(capacity, dtype=np.int16)
+        codes[: self._size] = self.codes
+        classification = np.full(capacity, -1, dtype=np.int16)
+        classification[: self._size] = self._classification[: self._size]
+        self._features, self._codes, self._classification = features, codes, classification
+        if self._removed is not None:
+            removed = np.zeros(capacity, dtype=bool)
+            removed[: self._size] = self._removed[: self._size]
+            self._removed = removed
+        
+    def extend_arrays(self, features: np.ndarray, codes: np.ndarray) -> None:
+        """특성 행렬과 품종 코드를 한꺼번에 덧붙인다."""
+        self.reserve(self._size + len(codes))
+        self._features[self._size : self._size + len(codes)] = self.encode(features)
+        self._codes[self._size : self._size + len(codes)] = codes
+        self._size += len(codes)
+        self._live += len(codes)
+        
+    def append(self, sample: Sample) -> None:
+        self.reserve(self._size + 1)
+        self._features[self._size] = self.encode([getattr(sample, name) for name in FEATURES])
+        self._codes[self._size] = self.species.code(sample.species)
+        self._size += 1
+        self._live += 1
+        
+    def append_dict(self, row: dict[str, str]) -> None:
+        try:
+            values = self.encode([float(row[name]) for name in FEATURES])
+            species = row["species"]
+        except (KeyError, ValueError) as ex:
+            raise InvalidSampleError(f"invalid {row!r}") from ex
+        self.reserve(self._size + 1)
+        self._features[self._size] = values
+        self._codes[self._size] = self.species.code(species)
+        self._size += 1
+        self._live += 1
+        
+        
+class SampleView:
+    """SampleStore의 한 행을 KnownSample처럼 보여주는 가벼운 뷰"""
+    
+    __slots__ = ("_store", "_row")
+    
+    def __init__(self, store: SampleStore, row: int) -> None:
+        self._store = store
+        self._row = row
+        
+    def _value(self, column: int) -> float:
+        value = float(self._store._features[self._row, column])
+        scale = self._store.scale
+        return value if scale is None else value / scale
+    
+    @property
+    def sepal_length(self) -> float:
+        return self._value(0)
+    
+    @property
+    def sepal_width(self) -> float:
+        return self._value(1)
+    
+    @property
+    def petal_length(self) -> float:
+        return self._value(2)
+    
+    @property
+    def petal_width(self) -> float:
+        return self._value(3)
+    
+    @property
+    def species(self) -> str:
+        return self._store.species.names[self._store._codes[self._row]]
+    
+    @property
+    def purpose(self) -> Purpose:
+        return self._store.purpose
+    
+    @property
+    def classification(self) -> Optional[str]:
+        if self.purpose != Purpose.Testing:
+            raise AttributeError("Training sample have no classification")
+        code = self._store._classification[self._row]
+        return None if code < 0 else self._store.species.names[code]
+    
+    @classification.setter
+    def classification(self, value: str) -> None:
+        if self.purpose != Purpose.Testing:
+            raise AttributeError("Training sample cannot be classified")
+        self._store._classification[self._row] = self._store.species.code(value)
+        
+    def classify(self, classification: str) -> None:
+        self.classification = classification
+        
+    def matches(self) -> bool:
+        return self.species == self.classification
+    
     def __repr__(self) -> str:
         return (
-            f"{self.__class__.__name__}(sample={self.sample!r}),"
-            f"classification={self.classification!r}"
+            f"{self.__class__.__name__}("
+            f"sepal_length={self.sepal_length},"
+            f"sepal_width={self.sepal_width},"
+            f"petal_length={self.petal_length},"
+            f"petal_width={self.petal_width},"
+            f"species={self.species!r},"
+            f"purpose={self.purpose.name}"
+            f")"
         )
         
 
-class TrainingKnownSample(NamedTuple):
-    sample: KnownSample
-    
 __test__ = {name: case for name, case in globals().items() if name.startswith("test")}
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""부모 프로세스에서 모델을 한 번 올리고 작업 프로세스를 fork하는 서버
+
+    python prefork.py serve model.irismdl --workers 4 --port 8000
+    python prefork.py memory --parent 12345
+
+학습 데이터는 mmap된 파일이나 넘파이 버퍼에 있어 참조 카운트를 쓰지 않으므로
+fork한 뒤에도 페이지가 공유된 채로 남는다. fork 전에 gc.freeze()로 부모의
+객체를 가비지 수집 대상에서 빼서, 수집기가 객체 헤더를 건드려 페이지를
+복사하는 일도 막는다.
+"""
+from __future__ import annotations
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+from pathlib import Path
+from typing import (
+    Optional,
+)
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import classifier
+from model import Hyperparameter
+
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class _Server(WSGIServer):
+    """부모가 열어 둔 소켓에서 accept하는 WSGI 서버"""
+
+    def __init__(self, listener: socket.socket, app: object) -> None:
+        super().__init__(listener.getsockname(), _QuietHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        host, port = listener.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+
+
+def load(source: Path, k: int = 5) -> Hyperparameter:
+    """스냅숏이나 이진 데이터셋을 열고, 지연 생성되는 색인까지 미리 만든다."""
+    parameter = classifier.load(source, k)
+    # 색인을 작업 프로세스마다 따로 만들지 않도록 fork 전에 한 번 분류해 둔다.
+    training = classifier.app.config["IRIS_DATA"].training
+    if training.live:
+        parameter.classify_codes(training.decode(training.features[:1]))
+    return parameter
+
+
+def serve(
+    source: Path, host: str = "127.0.0.1", port: int = 8000, workers: int = 4, k: int = 5
+) -> None:
+    load(source, k)
+    listener = socket.create_server((host, port), backlog=1024)
+    gc.collect()
+    gc.freeze()
+    children: dict[int, int] = {}
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                _Server(listener, classifier.app).serve_forever()
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    stopping = False
+
+    def stop(signum: int, frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        spawn(slot)
+    print(
+        f"parent {os.getpid()} serving on {host}:{listener.getsockname()[1]}, "
+        f"workers {' '.join(map(str, children))}",
+        flush=True,
+    )
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            spawn(slot)
+    listener.close()
+
+
+def smaps(pid: int) -> dict[str, int]:
+    """/proc/<pid>/smaps_rollup의 메모리 항목 (kB)"""
+    values: dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as rollup:
+        for line in rollup:
+            name, _, rest = line.partition(":")
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0])
+    return values
+
+
+def children_of(pid: int) -> list[int]:
+    found: list[int] = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        found.extend(int(child) for child in (task / "children").read_text().split())
+    return found
+
+
+def report(pids: list[int]) -> str:
+    lines = [f"{'pid':>8} {'rss':>10} {'pss':>10} {'shared':>10} {'private':>10}"]
+    for pid in pids:
+        values = smaps(pid)
+        shared = values["Shared_Clean"] + values["Shared_Dirty"]
+        private = values["Private_Clean"] + values["Private_Dirty"]
+        lines.append(
+            f"{pid:>8} {values['Rss']:>8}kB {values['Pss']:>8}kB {shared:>8}kB {private:>8}kB"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serving = commands.add_parser("serve", help="모델을 올리고 작업 프로세스를 fork한다")
+    serving.add_argument("source", type=Path, help="모델 스냅숏 또는 이진 데이터셋")
+    serving.add_argument("--host", default="127.0.0.1")
+    serving.add_argument("--port", type=int, default=8000)
+    serving.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serving.add_argument("-k", type=int, default=5, help="데이터셋으로 시작할 때의 k")
+    memory = commands.add_parser("memory", help="프로세스별 공유/개별 메모리")
+    memory.add_argument("pids", type=int, nargs="*")
+    memory.add_argument("--parent", type=int, help="이 부모의 작업 프로세스를 모두 본다")
+    options = parser.parse_args(argv)
+    if options.command == "serve":
+        serve(options.source, options.host, options.port, options.workers, options.k)
+        return 0
+    pids = list(options.pids)
+    if options.parent:
+        pids = [options.parent, *children_of(options.parent), *pids]
+    if not pids:
+        parser.error("pid or --parent is required")
+    print(report(pids))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
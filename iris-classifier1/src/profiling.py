@@ -0,0 +1,201 @@
+"""요청 하나나 TrainingData.test 한 번을 프로파일러 아래에서 돌리고 결과를 파일로 남긴다.
+
+    python profiling.py test data.irisds -k 5 --algorithm ED --mode sample -o test.folded
+
+sample 모드는 따로 도는 스레드가 interval마다 대상 스레드의 스택을 떠서 접힌 스택
+(flamegraph.pl, speedscope가 읽는 "바깥;...;안쪽 횟수" 줄) 파일(.folded)을 쓴다.
+cprofile 모드는 모든 호출을 세는 결정적 프로파일러로, pstats 파일(.prof)을 쓴다.
+"""
+from __future__ import annotations
+import argparse
+import cProfile
+import collections
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Optional,
+)
+
+
+MODES = ("sample", "cprofile")
+SUFFIXES = {"sample": ".folded", "cprofile": ".prof"}
+
+
+def _frame_name(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """대상 스레드의 스택을 interval초마다 떠서 접힌 스택별로 센다."""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.001) -> None:
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names: list[str] = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def write(self, target: Path) -> None:
+        with target.open("w") as target_file:
+            for stack, count in self.stacks.most_common():
+                target_file.write(f"{stack} {count}\n")
+
+
+class Session:
+    """시작한 프로파일러 하나, finish()하면 멈추고 파일을 쓴다. 두 번 불러도 한 번만 쓴다."""
+
+    def __init__(self, mode: str, target: Path, interval: float = 0.001, on_finish: Optional[Callable[[], None]] = None) -> None:
+        if mode not in MODES:
+            raise ValueError(f"unknown profiling mode {mode!r}")
+        self.mode = mode
+        self.target = target
+        self._on_finish = on_finish
+        self._finished = False
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[Sampler] = None
+        if mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = Sampler(interval=interval)
+            self._sampler.start()
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            self.target.parent.mkdir(parents=True, exist_ok=True)
+            if self._profile is not None:
+                self._profile.disable()
+                self._profile.dump_stats(str(self.target))
+            if self._sampler is not None:
+                self._sampler.stop()
+                self._sampler.write(self.target)
+        finally:
+            if self._on_finish is not None:
+                self._on_finish()
+
+
+class RequestProfiler:
+    """요청별 프로파일을 directory에 요청 id 이름으로 남긴다.
+
+    한 번에 하나만 돌고, 앞 프로파일을 시작한 뒤 min_interval초가 지나야 다음을
+    시작한다. 파일은 가장 최근 keep개만 남긴다.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        min_interval: float = 10.0,
+        keep: int = 100,
+        interval: float = 0.001,
+    ) -> None:
+        self.directory = Path(directory)
+        self.min_interval = min_interval
+        self.keep = keep
+        self.interval = interval
+        self.started = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._active = False
+        self._last = -float("inf")
+
+    def start(self, request_id: str, mode: str) -> Optional[Session]:
+        """허용되면 프로파일을 시작한 Session, 한도에 걸리면 None"""
+        if mode not in MODES:
+            raise ValueError(f"unknown profiling mode {mode!r}")
+        now = time.monotonic()
+        with self._lock:
+            if self._active or now - self._last < self.min_interval:
+                self.skipped += 1
+                return None
+            self._active = True
+            self._last = now
+            self.started += 1
+        name = "".join(c for c in request_id if c.isalnum() or c in "-_") or "request"
+        try:
+            return Session(
+                mode, self.directory / f"{name}{SUFFIXES[mode]}", self.interval, self._finished
+            )
+        except BaseException:
+            self._finished()
+            raise
+
+    def _finished(self) -> None:
+        with self._lock:
+            self._active = False
+        self._prune()
+
+    def _prune(self) -> None:
+        files = sorted(
+            (path for path in self.directory.glob("*") if path.suffix in SUFFIXES.values()),
+            key=lambda path: path.stat().st_mtime,
+        )
+        for path in files[: max(0, len(files) - self.keep)]:
+            path.unlink(missing_ok=True)
+
+
+def profile_call(mode: str, target: Path, function: Callable[[], Any], interval: float = 0.001) -> Any:
+    """function()을 프로파일러 아래에서 한 번 부르고 결과를 target에 쓴다."""
+    session = Session(mode, target, interval)
+    try:
+        return function()
+    finally:
+        session.finish()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    testing = commands.add_parser("test", help="TrainingData.test 한 번을 프로파일한다")
+    testing.add_argument("source", type=Path, help="이진 데이터셋 또는 모델 스냅숏")
+    testing.add_argument("-k", type=int, default=5)
+    testing.add_argument("--algorithm", default="ED")
+    testing.add_argument("--mode", choices=MODES, default="sample")
+    testing.add_argument("--interval", type=float, default=0.001, help="sample 모드의 표본 간격(초)")
+    testing.add_argument("-o", "--output", type=Path)
+    options = parser.parse_args(argv)
+
+    from model import Hyperparameter, TrainingData
+    import snapshot
+
+    training_data = TrainingData.open_source(options.source)[0]
+    distance = snapshot.DISTANCES.get(options.algorithm)
+    if distance is None:
+        parser.error(f"unknown distance {options.algorithm!r}")
+    parameter = Hyperparameter(options.k, distance(), training_data)
+    target = options.output or Path(f"test-{options.algorithm}-k{options.k}{SUFFIXES[options.mode]}")
+    profile_call(options.mode, target, lambda: training_data.test(parameter), options.interval)
+    print(
+        f"k={options.k} {options.algorithm}: quality {parameter.quality:.4f} "
+        f"in {parameter.elapsed:.3f}s, profile written to {target}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
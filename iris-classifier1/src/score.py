@@ -0,0 +1,191 @@
+"""저장한 모델 스냅숏으로 측정값 파일을 일괄 분류한다.
+
+    python score.py model.irismdl measurements.csv > species.csv
+    zcat rows.ndjson.gz | python score.py model.irismdl - --format ndjson --workers 8
+
+입력은 CSV(앞 네 열이 측정값, 뒤의 열과 측정값 이름으로 된 머리글은 무시)나 NDJSON(객체 또는 값 4개짜리
+배열)이다. 결과는 입력 순서대로 줄 번호와 함께 CSV(line,species,error)나 NDJSON으로
+stdout에 흘려보낸다. 줄 번호는 입력 파일의 줄(1부터)이다.
+
+덩어리는 작업 프로세스들이 나눠 분류하고, 부모는 끝난 순서가 아니라 보낸 순서대로 쓴다.
+Flask는 물론 numpy와 모델 모듈도 인자를 다 읽은 다음에야 가져온다.
+"""
+from __future__ import annotations
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Iterator,
+    Optional,
+)
+
+
+Task = tuple[int, bytes]
+
+_parameter: Any = None
+_training_data: Any = None
+_options: dict[str, Any] = {}
+
+
+def _load(source: Path, verify: bool, cascade: bool) -> None:
+    """스냅숏을 열고 색인까지 데워 둔다. fork로 띄운 작업 프로세스는 이것을 그대로 물려받는다."""
+    global _parameter, _training_data
+    from model import TrainingData
+
+    _training_data, _parameter = TrainingData.open_model(source, verify)
+    if cascade:
+        from cascade import CascadeHyperparameter
+
+        _parameter = CascadeHyperparameter(_parameter.k, _parameter.algorithm, _training_data)
+    training = _training_data.training
+    if training.live:
+        _parameter.classify_codes(training.decode(training.features[:1]))
+
+
+def _initialize(source: Path, cascade: bool, options: dict[str, Any]) -> None:
+    _options.update(options)
+    if _parameter is None:
+        _load(source, False, cascade)
+
+
+def _parse_ndjson(first_line: int, data: bytes) -> tuple[Any, list[int], dict[int, str]]:
+    """(n, 4) 측정값, 각 행의 줄 번호, 줄 번호별 거부 이유"""
+    import numpy as np
+    from model import parse_measurements
+
+    rows: list[list[float]] = []
+    numbers: list[int] = []
+    errors: dict[int, str] = {}
+    for number, line in enumerate(data.split(b"\n"), start=first_line):
+        if not line.strip():
+            continue
+        try:
+            rows.append(parse_measurements(json.loads(line)))
+            numbers.append(number)
+        except ValueError as ex:
+            errors[number] = str(ex)
+    return np.array(rows, dtype=np.float64).reshape(-1, 4), numbers, errors
+
+
+def _classify(features: Any) -> list[str]:
+    """같은 측정값은 한 번만 분류한다. 붓꽃 측정값은 0.1cm 단위라 겹치는 행이 많다."""
+    import numpy as np
+
+    if not len(features):
+        return []
+    unique, inverse = np.unique(features, axis=0, return_inverse=True)
+    names = _training_data.species.names
+    codes = _parameter.classify_codes(unique)[inverse.reshape(-1)]
+    return [names[code] for code in codes.tolist()]
+
+
+def score(task: Task) -> tuple[bytes, int, int]:
+    """덩어리 하나를 분류해 (출력 바이트, 분류한 행 수, 거부한 행 수)를 돌려준다."""
+    first_line, data = task
+    if _options["input"] == "ndjson":
+        features, numbers, errors = _parse_ndjson(first_line, data)
+    else:
+        from model import parse_csv
+
+        features, _, rows, errors = parse_csv(data.decode(), first_line, labelled=False)
+        numbers = rows.tolist()
+    # 분류 결과는 파서가 준 줄 번호로 붙인다. 순서에 기대면 빠진 줄 하나에 전부 밀린다.
+    species = dict(zip(numbers, _classify(features)))
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    for number in sorted(species.keys() | errors.keys()):
+        if _options["output"] == "ndjson":
+            if number in errors:
+                output.write(json.dumps({"line": number, "error": errors[number]}) + "\n")
+            else:
+                output.write(json.dumps({"line": number, "species": species[number]}) + "\n")
+        elif number in errors:
+            writer.writerow((number, "", errors[number]))
+        else:
+            writer.writerow((number, species[number], ""))
+    return output.getvalue().encode(), len(species), len(errors)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", type=Path, help="Hyperparameter.save()로 저장한 모델 스냅숏")
+    parser.add_argument("source", nargs="?", default="-", help="입력 파일, -이면 stdin")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="입력 형식 (기본: 확장자, stdin은 csv)")
+    parser.add_argument("--output", choices=("csv", "ndjson"), help="출력 형식 (기본: 입력 형식)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-bytes", type=int, default=1 << 22)
+    parser.add_argument("--cascade", action="store_true", help="격자 칸 캐스케이드를 앞에 둔다")
+    parser.add_argument("--no-verify", action="store_true", help="스냅숏 배열 CRC를 확인하지 않는다")
+    options = parser.parse_args(argv)
+    input_format = options.format or (
+        "ndjson" if Path(options.source).suffix in (".ndjson", ".jsonl") else "csv"
+    )
+    settings = {"input": input_format, "output": options.output or input_format}
+
+    from model import line_chunks
+    from snapshot import SnapshotError
+
+    try:
+        _load(options.model, not options.no_verify, options.cascade)
+    except (OSError, SnapshotError) as ex:
+        print(ex, file=sys.stderr)
+        return 1
+    _options.update(settings)
+    stream = sys.stdin.buffer if options.source == "-" else open(options.source, "rb")
+    out = sys.stdout.buffer
+    if settings["output"] == "csv":
+        out.write(b"line,species,error\n")
+    tasks: Iterator[Task] = line_chunks(stream, options.chunk_bytes, input_format == "csv")
+    start = time.perf_counter()
+    scored = rejected = 0
+    try:
+        if options.workers <= 1:
+            results: Iterator[tuple[bytes, int, int]] = map(score, tasks)
+            for data, good, bad in results:
+                out.write(data)
+                scored, rejected = scored + good, rejected + bad
+        else:
+            import multiprocessing
+
+            with multiprocessing.Pool(
+                options.workers,
+                initializer=_initialize,
+                initargs=(options.model, options.cascade, settings),
+            ) as pool:
+                # imap은 입력을 끝까지 미리 읽어 버리므로, 보낸 덩어리 수를 직접 제한한다.
+                pending: collections.deque[Any] = collections.deque()
+                for task in tasks:
+                    pending.append(pool.apply_async(score, (task,)))
+                    while len(pending) >= 2 * options.workers or (pending and pending[0].ready()):
+                        data, good, bad = pending.popleft().get()
+                        out.write(data)
+                        scored, rejected = scored + good, rejected + bad
+                while pending:
+                    data, good, bad = pending.popleft().get()
+                    out.write(data)
+                    scored, rejected = scored + good, rejected + bad
+        out.flush()
+    except BrokenPipeError:
+        # head 같은 명령이 출력을 일찍 닫았다.
+        return 0
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"scored {scored} rows, rejected {rejected} in {elapsed:.2f}s "
+        f"({(scored + rejected) / elapsed if elapsed else 0:.0f} rows/s)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""학습 데이터를 여러 프로세스(또는 노드)에 나눠 두고 k-NN을 나눠 푸는 모드
+
+    python shards.py serve data.irisds --shard 0 --of 4 --port 9100
+    python shards.py test data.irisds 10.0.0.1:9100 10.0.0.2:9100 ...
+    python shards.py test data.irisds --local 4
+
+샤드는 자기 몫의 학습 샘플에서 질의 배치마다 지역 top-k (거리, 전역 행, 품종 코드)를
+돌려주고, 조정자는 답한 샤드들의 결과를 합쳐 전역 k개를 고른 뒤 투표한다.
+샤드와 조정자는 multiprocessing.connection 소켓으로 이야기하므로 한 기계에서도,
+여러 노드에서도 같은 코드로 돈다.
+
+연결은 pickle을 주고받으므로 serve와 주소를 주는 test는 IRIS_SHARD_KEY 환경 변수의
+공유 키로만 인증한다. --local은 실행마다 무작위 키를 만든다.
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener, wait
+from pathlib import Path
+from typing import (
+    Any,
+    Iterable,
+    Optional,
+)
+
+import numpy as np
+
+import metrics
+from model import Distance, Hyperparameter, TrainingData, vote
+import snapshot
+
+
+Address = tuple[str, int]
+TopK = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+KEY_VARIABLE = "IRIS_SHARD_KEY"
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+def shard_key() -> bytes:
+    """IRIS_SHARD_KEY 환경 변수의 공유 키, 없으면 ShardError"""
+    key = os.environ.get(KEY_VARIABLE)
+    if not key:
+        raise ShardError(f"set {KEY_VARIABLE} to a shared secret key for the shards")
+    return key.encode()
+
+
+def bounds(count: int, shards: int) -> list[tuple[int, int]]:
+    """count개 행을 shards개의 연속 구간으로 나눈 (시작, 끝)"""
+    edges = np.linspace(0, count, shards + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def merge(answers: Iterable[TopK], k: int) -> TopK:
+    """샤드별 (m, k) 결과를 합쳐 질의마다 전역 k개, 거리가 같으면 행 번호가 작은 쪽"""
+    distances, rows, codes = (np.concatenate(part, axis=1) for part in zip(*answers))
+    order = np.lexsort((rows, distances))[:, :k]
+    return (
+        np.take_along_axis(distances, order, axis=1),
+        np.take_along_axis(rows, order, axis=1),
+        np.take_along_axis(codes, order, axis=1),
+    )
+
+
+def parse_address(text: str) -> Address:
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class Shard:
+    """학습 샘플 한 조각과 그 위의 지역 k-NN, offset은 첫 행의 전역 번호"""
+
+    def __init__(self, training_data: TrainingData, offset: int = 0) -> None:
+        self.training_data = training_data
+        self.offset = offset
+        self._parameters: dict[tuple[int, str], Hyperparameter] = {}
+
+    @classmethod
+    def from_slice(cls, training_data: TrainingData, shard: int, shards: int) -> "Shard":
+        """학습 데이터의 살아 있는 행 가운데 shard번째 구간을 복사 없이 떼어 낸다."""
+        features, codes = training_data.training.live_arrays()
+        start, end = bounds(len(codes), shards)[shard]
+        part = TrainingData.from_arrays(
+            training_data.name,
+            training_data.species.names,
+            (features[start:end], codes[start:end]),
+            (features[:0], codes[:0]),
+        )
+        return cls(part, start)
+
+    def _parameter(self, k: int, algorithm: str) -> Hyperparameter:
+        parameter = self._parameters.get((k, algorithm))
+        if parameter is None:
+            distance = snapshot.DISTANCES.get(algorithm)
+            if distance is None:
+                raise ValueError(f"unknown distance {algorithm!r}")
+            parameter = Hyperparameter(k, distance(), self.training_data)
+            self._parameters[k, algorithm] = parameter
+        return parameter
+
+    def top_k(self, queries: np.ndarray, k: int, algorithm: str) -> TopK:
+        """질의마다 이 조각에서 가장 가까운 k개의 (거리, 전역 행, 품종 코드)"""
+        training = self.training_data.training
+        if training.live == 0:
+            empty = np.empty((len(queries), 0))
+            return empty, empty.astype(np.intp), empty.astype(np.int16)
+        parameter = self._parameter(k, algorithm)
+        rows = parameter.neighbors(queries)
+        distances = parameter.algorithm.paired_distances(
+            training.encode(queries), training.features[rows]
+        )
+        return distances, rows + self.offset, training.codes[rows]
+
+    def serve(self, listener: Listener) -> None:
+        """연결마다 스레드 하나로 요청을 받는다. 조정자는 보통 연결 하나를 계속 쓴다."""
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                continue
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    kind, *arguments = connection.recv()
+                except (EOFError, OSError):
+                    return
+                start = time.perf_counter()
+                try:
+                    if kind == "top_k":
+                        result: Any = self.top_k(*arguments)
+                    elif kind == "info":
+                        result = (self.offset, self.training_data.training.live)
+                    else:
+                        raise ValueError(f"unknown request {kind!r}")
+                except Exception as ex:
+                    reply = ("error", f"{type(ex).__name__}: {ex}", 0.0)
+                else:
+                    reply = ("ok", result, time.perf_counter() - start)
+                try:
+                    connection.send(reply)
+                except OSError:
+                    # 조정자가 기다리다 지쳐 연결을 끊었다.
+                    return
+
+
+class ShardPool:
+    """샤드들에 질의 배치를 한꺼번에 보내고 제한 시간 안에 온 답을 합치는 조정자
+
+    timeout 안에 답하지 않은 샤드는 그 배치에서 빼고, 늦은 답이 다음 배치에
+    섞이지 않도록 연결을 끊었다가 다음 배치에서 다시 잇는다.
+    latency에는 샤드별 마지막 배치의 왕복 시간(답하지 않았으면 None)이 남는다.
+    """
+
+    def __init__(
+        self,
+        addresses: Iterable[Address],
+        authkey: Optional[bytes] = None,
+        timeout: float = 5.0,
+    ) -> None:
+        self.addresses = list(addresses)
+        self.authkey = shard_key() if authkey is None else authkey
+        self.timeout = timeout
+        self._connections: list[Optional[Connection]] = [None] * len(self.addresses)
+        self.latency: list[Optional[float]] = [None] * len(self.addresses)
+        self.compute: list[Optional[float]] = [None] * len(self.addresses)
+        self.timeouts = [0] * len(self.addresses)
+        self.failures = [0] * len(self.addresses)
+        self.missing: list[int] = []
+
+    def __enter__(self) -> "ShardPool":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for shard in range(len(self.addresses)):
+            self._drop(shard)
+
+    def _connection(self, shard: int) -> Connection:
+        connection = self._connections[shard]
+        if connection is None:
+            connection = Client(self.addresses[shard], authkey=self.authkey)
+            self._connections[shard] = connection
+        return connection
+
+    def _drop(self, shard: int) -> None:
+        connection, self._connections[shard] = self._connections[shard], None
+        if connection is not None:
+            connection.close()
+
+    def _miss(self, shard: int, timed_out: bool) -> None:
+        self._drop(shard)
+        self.latency[shard] = self.compute[shard] = None
+        self.missing.append(shard)
+        if timed_out:
+            self.timeouts[shard] += 1
+            metrics.count(metrics.SHARD_TIMEOUTS, 1, str(shard))
+        else:
+            self.failures[shard] += 1
+
+    def top_k(self, queries: np.ndarray, k: int, algorithm: str) -> TopK:
+        """답한 샤드들의 결과를 합친 질의마다 전역 k개의 (거리, 행, 품종 코드)
+
+        한 샤드도 답하지 않으면 ShardError, 빠진 샤드 번호는 missing에 남는다.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float64)
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        self.missing = []
+        errors: list[str] = []
+        pending: dict[Connection, int] = {}
+        for shard in range(len(self.addresses)):
+            try:
+                connection = self._connection(shard)
+                connection.send(("top_k", queries, k, algorithm))
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as ex:
+                errors.append(f"shard {shard}: {ex}")
+                self._miss(shard, timed_out=False)
+                continue
+            pending[connection] = shard
+        answers: list[TopK] = []
+        while pending:
+            remaining = deadline - time.perf_counter()
+            ready = wait(list(pending), remaining) if remaining > 0 else []
+            if not ready:
+                break
+            for connection in ready:
+                shard = pending.pop(connection)
+                try:
+                    status, result, compute = connection.recv()
+                except (OSError, EOFError) as ex:
+                    errors.append(f"shard {shard}: {ex}")
+                    self._miss(shard, timed_out=False)
+                    continue
+                if status != "ok":
+                    errors.append(f"shard {shard}: {result}")
+                    self._miss(shard, timed_out=False)
+                    continue
+                self.latency[shard] = time.perf_counter() - start
+                self.compute[shard] = compute
+                metrics.observe(metrics.SHARD_SECONDS, self.latency[shard], str(shard))
+                answers.append(result)
+        for shard in pending.values():
+            errors.append(f"shard {shard}: no answer in {self.timeout}s")
+            self._miss(shard, timed_out=True)
+        if not answers:
+            raise ShardError("; ".join(errors) or "no shards")
+        return merge(answers, k)
+
+    def report(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "shard": shard,
+                "address": f"{host}:{port}",
+                "latency": self.latency[shard],
+                "compute": self.compute[shard],
+                "timeouts": self.timeouts[shard],
+                "failures": self.failures[shard],
+            }
+            for shard, (host, port) in enumerate(self.addresses)
+        ]
+
+
+class ShardedHyperparameter(Hyperparameter):
+    """이웃 탐색을 ShardPool에 맡기는 Hyperparameter
+
+    training에는 품종 표와 테스트 샘플만 있으면 되고, 학습 샘플은 샤드에 있다.
+    test()는 테스트 샘플을 batch_size개씩 보내므로 timeout은 배치 하나에 대한 제한이다.
+    """
+
+    batch_size = 1_024
+
+    def __init__(
+        self, k: int, algorithm: Distance, training: TrainingData, pool: ShardPool
+    ) -> None:
+        super().__init__(k, algorithm, training)
+        self.pool = pool
+
+    def classify_codes(self, queries: np.ndarray) -> np.ndarray:
+        metrics.count(metrics.QUERIES, len(queries))
+        codes = self.pool.top_k(queries, self.k, type(self.algorithm).__name__)[2]
+        return vote(codes, len(self._training_data().species))
+
+    def test(self) -> None:
+        start = time.perf_counter()
+        testing = self._training_data().testing
+        measurements = testing.measurements()
+        for row in range(0, len(measurements), self.batch_size):
+            block = slice(row, row + self.batch_size)
+            testing.classification[block] = self.classify_codes(measurements[block])
+        self.quality = float(np.mean(testing.matches()))
+        self.elapsed = time.perf_counter() - start
+
+
+def _serve_slice(
+    name: str,
+    species: list[str],
+    features: np.ndarray,
+    codes: np.ndarray,
+    offset: int,
+    authkey: bytes,
+    ready: Connection,
+) -> None:
+    part = TrainingData.from_arrays(name, species, (features, codes), (features[:0], codes[:0]))
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    ready.send(listener.address)
+    ready.close()
+    Shard(part, offset).serve(listener)
+
+
+class LocalShards:
+    """한 기계에서 학습 데이터를 shards개 프로세스로 나눠 띄운다.
+
+        with LocalShards(training_data, 4) as shards, ShardPool(shards.addresses, shards.authkey) as pool:
+            ...
+
+    authkey를 주지 않으면 이 샤드들만 쓰는 무작위 키를 만든다.
+    """
+
+    def __init__(
+        self, training_data: TrainingData, shards: int, authkey: Optional[bytes] = None
+    ) -> None:
+        self.authkey = os.urandom(32) if authkey is None else authkey
+        self.addresses: list[Address] = []
+        self.processes: list[multiprocessing.process.BaseProcess] = []
+        features, codes = training_data.training.live_arrays()
+        try:
+            for start, end in bounds(len(codes), shards):
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_serve_slice,
+                    args=(
+                        training_data.name,
+                        training_data.species.names,
+                        features[start:end],
+                        codes[start:end],
+                        start,
+                        self.authkey,
+                        writer,
+                    ),
+                    daemon=True,
+                )
+                process.start()
+                writer.close()
+                self.processes.append(process)
+                if not reader.poll(60):
+                    raise ShardError(f"shard {len(self.addresses)} did not start")
+                self.addresses.append(reader.recv())
+                reader.close()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> "LocalShards":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+
+def _test(
+    training_data: TrainingData, pool: ShardPool, k: int, algorithm: str
+) -> None:
+    parameter = ShardedHyperparameter(k, snapshot.DISTANCES[algorithm](), training_data, pool)
+    parameter.test()
+    print(
+        f"k={k} {algorithm}: quality {parameter.quality:.4f}, "
+        f"{training_data.testing.live} queries in {parameter.elapsed:.3f}s"
+    )
+    for entry in pool.report():
+        latency = "-" if entry["latency"] is None else f"{entry['latency'] * 1000:.1f}ms"
+        compute = "-" if entry["compute"] is None else f"{entry['compute'] * 1000:.1f}ms"
+        print(
+            f"  shard {entry['shard']} {entry['address']}: latency {latency}, "
+            f"compute {compute}, timeouts {entry['timeouts']}, failures {entry['failures']}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serving = commands.add_parser("serve", help="학습 데이터의 한 조각을 맡는 샤드를 띄운다")
+    serving.add_argument("source", type=Path, help="이진 데이터셋 또는 모델 스냅숏")
+    serving.add_argument("--shard", type=int, required=True)
+    serving.add_argument("--of", type=int, required=True, help="전체 샤드 수")
+    serving.add_argument("--host", default="127.0.0.1")
+    serving.add_argument("--port", type=int, default=9100)
+    testing = commands.add_parser("test", help="샤드들로 테스트 샘플을 분류한다")
+    testing.add_argument("source", type=Path, help="품종 표와 테스트 샘플을 읽을 파일")
+    testing.add_argument("addresses", nargs="*", type=parse_address, help="host:port")
+    testing.add_argument("--local", type=int, help="이 수만큼 샤드를 이 기계에 띄운다")
+    testing.add_argument("-k", type=int, default=5)
+    testing.add_argument("--algorithm", choices=sorted(snapshot.DISTANCES), default="ED")
+    testing.add_argument("--timeout", type=float, default=5.0)
+    options = parser.parse_args(argv)
+    if options.command == "test" and bool(options.addresses) == bool(options.local):
+        parser.error("give shard addresses or --local, not both")
+    authkey: Optional[bytes] = None
+    if not (options.command == "test" and options.local):
+        try:
+            authkey = shard_key()
+        except ShardError as ex:
+            parser.error(str(ex))
+    training_data = TrainingData.open_source(options.source)[0]
+    if options.command == "serve":
+        if not 0 <= options.shard < options.of:
+            parser.error("--shard must be in [0, --of)")
+        shard = Shard.from_slice(training_data, options.shard, options.of)
+        listener = Listener((options.host, options.port), authkey=authkey)
+        print(
+            f"shard {options.shard}/{options.of}: {shard.training_data.training.live} samples "
+            f"from row {shard.offset} on {options.host}:{options.port}",
+            flush=True,
+        )
+        shard.serve(listener)
+        return 0
+    if options.local:
+        with LocalShards(training_data, options.local) as local:
+            with ShardPool(local.addresses, local.authkey, options.timeout) as pool:
+                _test(training_data, pool, options.k, options.algorithm)
+        return 0
+    with ShardPool(options.addresses, authkey, options.timeout) as pool:
+        _test(training_data, pool, options.k, options.algorithm)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+from __future__ import annotations
+import argparse
+import datetime
+import json
+import mmap
+import struct
+import sys
+import zlib
+from pathlib import Path
+from typing import (
+    Any,
+    Optional,
+)
+
+import numpy as np
+
+from dataset import encode_header, write_arrays
+from index import DynamicIndex, KDTree
+from model import (
+    CD,
+    ED,
+    MD,
+    SD,
+    Distance,
+    Hyperparameter,
+    TrainingData,
+)
+
+
+MAGIC = b"IRISMDL\0"
+VERSION = 1
+PREFIX = struct.Struct("<8sIII")
+
+DISTANCES: dict[str, type[Distance]] = {cls.__name__: cls for cls in (ED, MD, CD, SD)}
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _timestamp(value: Optional[datetime.datetime]) -> Optional[str]:
+    return None if value is None else value.isoformat()
+
+
+def _parameter(parameter: Hyperparameter) -> dict[str, Any]:
+    return {
+        "k": parameter.k,
+        "algorithm": type(parameter.algorithm).__name__,
+        "probes": parameter.probes,
+        "quality": getattr(parameter, "quality", None),
+        "recall": parameter.recall,
+        "elapsed": getattr(parameter, "elapsed", None),
+    }
+
+
+def _index(parameter: Hyperparameter) -> Optional[tuple[KDTree, np.ndarray]]:
+    """저장할 KD-트리와 id, id는 저장하는 살아 있는 행의 순서를 가리킨다.
+
+    parameter가 색인을 쓰지 않으면 None, 지우거나 더한 샘플이 있으면 새로 만든다.
+    """
+    training_data = parameter._training_data()
+    training = training_data.training
+    if not parameter.uses_index(training.live):
+        return None
+    index = training_data._index
+    if index is None or index.fragmentation > 0 or training.removed is not None:
+        tree = KDTree(training.live_arrays()[0])
+        return tree, np.arange(len(tree))
+    return index.tree, index.tree_ids
+
+
+def save_model(parameter: Hyperparameter, target: Path) -> None:
+    """학습 데이터, 고른 Hyperparameter, 튜닝 기록, KD-트리를 스냅숏 파일 하나로 저장한다.
+
+    [접두부: 매직, 버전, 헤더 길이, 헤더 CRC32][JSON 헤더][64바이트 정렬된 배열들]
+    배열마다 CRC32를 헤더에 남긴다.
+    """
+    training_data = parameter._training_data()
+    training_features, training_codes = training_data.training.live_arrays()
+    testing_features, testing_codes = training_data.testing.live_arrays()
+    arrays = {
+        "training_features": training_features,
+        "training_codes": training_codes,
+        "testing_features": testing_features,
+        "testing_codes": testing_codes,
+    }
+    index = _index(parameter)
+    if index is not None:
+        tree, ids = index
+        arrays.update({f"index_{name}": array for name, array in tree.arrays().items()})
+        arrays["index_ids"] = ids
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header: dict[str, Any] = {
+        "name": training_data.name,
+        "species": training_data.species.names,
+        "model": _parameter(parameter),
+        "uploaded": _timestamp(getattr(training_data, "uploaded", None)),
+        "tested": _timestamp(getattr(training_data, "tested", None)),
+        "tuning": [_parameter(tuned) for tuned in training_data.tuning],
+        "index": None if index is None else {"leaf_size": index[0].leaf_size},
+    }
+    encoded = encode_header(
+        header,
+        arrays,
+        PREFIX.size,
+        lambda array: {"crc32": zlib.crc32(memoryview(array).cast("B")) if array.size else 0},
+    )
+    prefix = PREFIX.pack(MAGIC, VERSION, len(encoded), zlib.crc32(encoded))
+    write_arrays(target, prefix, encoded, header, arrays)
+
+
+def _restore(
+    training_data: TrainingData, fields: dict[str, Any]
+) -> Hyperparameter:
+    algorithm = DISTANCES.get(fields["algorithm"])
+    if algorithm is None:
+        raise SnapshotError(f"unknown distance {fields['algorithm']!r}")
+    parameter = Hyperparameter(fields["k"], algorithm(), training_data, fields["probes"])
+    if fields["quality"] is not None:
+        parameter.quality = fields["quality"]
+    if fields["elapsed"] is not None:
+        parameter.elapsed = fields["elapsed"]
+    parameter.recall = fields["recall"]
+    return parameter
+
+
+def open_model(source: Path, verify: bool = True) -> tuple[TrainingData, Hyperparameter]:
+    """스냅숏을 mmap으로 열어 (TrainingData, Hyperparameter)를 되살린다.
+
+    배열은 복사하지 않고 파일을 그대로 가리키므로 페이지는 처음 쓸 때 읽힌다.
+    헤더 CRC는 항상 확인하고, verify이면 배열 CRC도 확인한다(파일 전체를 한 번 읽는다).
+    Hyperparameter는 약한 참조만 가지므로 TrainingData를 붙잡아 두어야 한다.
+    """
+    with source.open("rb") as source_file:
+        mapping = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapping) < PREFIX.size:
+        raise SnapshotError(f"{source}: truncated model snapshot")
+    magic, version, size, checksum = PREFIX.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise SnapshotError(f"{source}: not an iris model snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"{source}: unsupported snapshot version {version}")
+    encoded = mapping[PREFIX.size : PREFIX.size + size]
+    if zlib.crc32(encoded) != checksum:
+        raise SnapshotError(f"{source}: header checksum mismatch")
+    header = json.loads(encoded)
+    arrays: dict[str, np.ndarray] = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        count = int(np.prod(shape))
+        if spec["offset"] + count * dtype.itemsize > len(mapping):
+            raise SnapshotError(f"{source}: truncated array {name}")
+        array = np.frombuffer(mapping, dtype=dtype, count=count, offset=spec["offset"])
+        if verify and count and zlib.crc32(memoryview(array).cast("B")) != spec["crc32"]:
+            raise SnapshotError(f"{source}: checksum mismatch in {name}")
+        arrays[name] = array.reshape(shape)
+    training_data = TrainingData.from_arrays(
+        header["name"],
+        header["species"],
+        (arrays["training_features"], arrays["training_codes"]),
+        (arrays["testing_features"], arrays["testing_codes"]),
+    )
+    for field in ("uploaded", "tested"):
+        if header[field] is not None:
+            setattr(training_data, field, datetime.datetime.fromisoformat(header[field]))
+    training_data.tuning = [_restore(training_data, fields) for fields in header["tuning"]]
+    if header["index"] is not None:
+        tree = KDTree.from_arrays(
+            header["index"]["leaf_size"],
+            {name: arrays[f"index_{name}"] for name in KDTree.ARRAYS},
+        )
+        training_data._index = DynamicIndex.from_tree(tree, arrays["index_ids"])
+    return training_data, _restore(training_data, header["model"])
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="모델 스냅숏을 검사한다.")
+    parser.add_argument("source", type=Path)
+    options = parser.parse_args(argv)
+    try:
+        training_data, parameter = open_model(options.source)
+    except SnapshotError as ex:
+        print(ex, file=sys.stderr)
+        return 1
+    print(
+        f"{training_data.name}: {training_data.training.live} training, "
+        f"{training_data.testing.live} testing, k={parameter.k} "
+        f"{type(parameter.algorithm).__name__}, {len(training_data.tuning)} tuning results, "
+        f"index={'yes' if training_data._index is not None else 'no'}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+from __future__ import annotations
+import concurrent.futures
+import itertools
+import time
+from multiprocessing import shared_memory
+from typing import (
+    Iterable,
+    Optional,
+)
+
+import numpy as np
+
+from model import (
+    FEATURES,
+    Distance,
+    Hyperparameter,
+    KFoldSamplePartition,
+    SpeciesTable,
+    TrainingData,
+)
+
+
+ArraySpec = tuple[str, tuple[int, ...], str]
+
+
+class SharedArrays:
+    """넘파이 배열들을 공유 메모리에 올려 작업 프로세스가 복사 없이 붙도록 한다."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        self._blocks: list[shared_memory.SharedMemory] = []
+        self.specs: dict[str, ArraySpec] = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks.clear()
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    @staticmethod
+    def attach(
+        specs: dict[str, ArraySpec]
+    ) -> tuple[dict[str, np.ndarray], list[shared_memory.SharedMemory]]:
+        """다른 프로세스에서 만든 공유 배열에 붙는다. 블록은 배열보다 오래 살아 있어야 한다."""
+        arrays: dict[str, np.ndarray] = {}
+        blocks: list[shared_memory.SharedMemory] = []
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+            blocks.append(block)
+        return arrays, blocks
+
+
+_worker_blocks: list[shared_memory.SharedMemory] = []
+_worker_data: Optional[TrainingData] = None
+
+
+def _attach(specs: dict[str, ArraySpec], species: list[str]) -> None:
+    global _worker_data
+    arrays, blocks = SharedArrays.attach(specs)
+    _worker_blocks.extend(blocks)
+    _worker_data = TrainingData.from_arrays(
+        "worker",
+        species,
+        (arrays["training_features"], arrays["training_codes"]),
+        (arrays["testing_features"], arrays["testing_codes"]),
+    )
+
+
+def _evaluate(k: int, algorithm: type[Distance]) -> tuple[float, float]:
+    start = time.perf_counter()
+    assert _worker_data is not None
+    parameter = Hyperparameter(k, algorithm(), _worker_data)
+    testing = _worker_data.testing
+    quality = float(np.mean(parameter.classify_codes(testing.features) == testing.codes))
+    return quality, time.perf_counter() - start
+
+
+def grid_search(
+    training_data: TrainingData,
+    k_values: Iterable[int],
+    algorithms: Iterable[type[Distance]],
+    max_workers: Optional[int] = None,
+) -> list[Hyperparameter]:
+    """k와 거리 알고리듬의 각 조합을 작업 프로세스에서 평가한 Hyperparameter 목록"""
+    training_features, training_codes = training_data.training.live_arrays()
+    testing_features, testing_codes = training_data.testing.live_arrays()
+    if len(testing_codes) == 0:
+        raise ValueError("No testing samples")
+    grid = list(itertools.product(k_values, algorithms))
+    with SharedArrays(
+        {
+            "training_features": training_features,
+            "training_codes": training_codes,
+            "testing_features": testing_features,
+            "testing_codes": testing_codes,
+        }
+    ) as shared:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_attach,
+            initargs=(shared.specs, training_data.species.names),
+        ) as pool:
+            futures = [pool.submit(_evaluate, k, algorithm) for k, algorithm in grid]
+            results = [future.result() for future in futures]
+    parameters: list[Hyperparameter] = []
+    for (k, algorithm), (quality, elapsed) in zip(grid, results):
+        parameter = Hyperparameter(k, algorithm(), training_data)
+        parameter.quality = quality
+        parameter.elapsed = elapsed
+        parameters.append(parameter)
+    return parameters
+
+
+def k_qualities(
+    training_data: TrainingData, algorithm: Distance, k_max: int, block_size: int = 4_096
+) -> np.ndarray:
+    """k = 1..k_max 각각의 품질, 이웃 목록은 테스트 샘플마다 한 번만 구한다."""
+    testing = training_data.testing
+    n_species = len(training_data.species)
+    parameter = Hyperparameter(k_max, algorithm, training_data)
+    passes = np.zeros(k_max)
+    features, expected = testing.live_arrays()
+    if len(expected) == 0:
+        raise ValueError("No testing samples")
+    for start in range(0, len(expected), block_size):
+        nearest = parameter.neighbors(features[start : start + block_size], ordered=True)
+        codes = training_data.training.codes[nearest]
+        counts = np.cumsum(codes[..., np.newaxis] == np.arange(n_species), axis=1)
+        predictions = counts.argmax(axis=2)
+        truth = expected[start : start + block_size, np.newaxis]
+        passes[: predictions.shape[1]] += (predictions == truth).sum(axis=0)
+    # 학습 샘플이 k_max보다 적으면 큰 k는 모든 학습 샘플을 쓰는 경우와 같다.
+    reached = min(k_max, training_data.training.live)
+    passes[reached:] = passes[reached - 1]
+    return passes / len(expected)
+
+
+def sweep_k(
+    training_data: TrainingData, algorithm: Distance, k_max: int
+) -> list[Hyperparameter]:
+    """한 번의 탐색으로 k = 1..k_max 각각의 Hyperparameter와 품질을 만든다."""
+    start = time.perf_counter()
+    qualities = k_qualities(training_data, algorithm, k_max)
+    elapsed = time.perf_counter() - start
+    parameters: list[Hyperparameter] = []
+    for k, quality in enumerate(qualities, start=1):
+        parameter = Hyperparameter(k, algorithm, training_data)
+        parameter.quality = float(quality)
+        parameter.elapsed = elapsed
+        parameters.append(parameter)
+    return parameters
+
+
+def compare_precision(
+    training_data: TrainingData,
+    parameter: Hyperparameter,
+    dtypes: Iterable[type] = (np.float32, np.int16),
+) -> dict[str, dict[str, float]]:
+    """학습 특성을 dtype마다 줄여 저장했을 때의 품질을 전체 정밀도와 비교한다.
+
+    {dtype 이름: {"quality", "difference", "elapsed", "bytes"}}, 첫 항목이 기준이다.
+    """
+    results: dict[str, dict[str, float]] = {}
+    baseline: Optional[float] = None
+    source = np.dtype(training_data.dtype)
+    for dtype in dict.fromkeys(np.dtype(dtype) for dtype in (source, *dtypes)):
+        compact = training_data if dtype == source else training_data.with_dtype(dtype.type)
+        candidate = Hyperparameter(parameter.k, parameter.algorithm, compact, parameter.probes)
+        candidate.test()
+        if baseline is None:
+            baseline = candidate.quality
+        results[dtype.name] = {
+            "quality": candidate.quality,
+            "difference": candidate.quality - baseline,
+            "elapsed": candidate.elapsed,
+            "bytes": compact.training.features.nbytes,
+        }
+    return results
+
+
+def cross_validate(
+    partition: KFoldSamplePartition, algorithm: Distance, k_max: int
+) -> np.ndarray:
+    """분할의 모든 겹에 대해 k = 1..k_max 품질을 구해 평균한다."""
+    species = SpeciesTable()
+    features = np.array([[row[name] for name in FEATURES] for row in partition], dtype=np.float64)
+    codes = np.array([species.code(row["species"]) for row in partition], dtype=np.int16)
+    qualities = np.zeros(k_max)
+    for fold in range(partition.folds):
+        training, testing = partition.fold_rows(fold)
+        training_data = TrainingData.from_arrays(
+            f"fold {fold}",
+            species.names,
+            (features[training], codes[training]),
+            (features[testing], codes[testing]),
+        )
+        qualities += k_qualities(training_data, algorithm, k_max)
+    return qualities / partition.folds
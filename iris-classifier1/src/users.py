@@ -0,0 +1,152 @@
+from __future__ import annotations
+import contextlib
+import hashlib
+import hmac
+import os
+import queue
+import sqlite3
+from pathlib import Path
+from typing import (
+    Iterator,
+    Optional,
+    Union,
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    email TEXT NOT NULL,
+    role TEXT NOT NULL,
+    interest TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS users_name_key ON users (name_key, username);
+"""
+
+FIELDS = ("username", "name", "email", "role", "interest")
+# 인증하지 않은 요청에도 보여 주는 필드
+PUBLIC_FIELDS = ("username", "name")
+
+ITERATIONS = 100_000
+
+
+class DuplicateUserError(ValueError):
+    pass
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    """salt$hash 형태의 PBKDF2-SHA256 해시"""
+    salt = os.urandom(16) if salt is None else salt
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, ITERATIONS)
+    return f"{salt.hex()}${digest.hex()}"
+
+
+def check_password(password: str, stored: str) -> bool:
+    salt, _, _ = stored.partition("$")
+    return hmac.compare_digest(hash_password(password, bytes.fromhex(salt)), stored)
+
+
+class UserStore:
+    """SQLite에 저장하는 사용자 목록, 사용자 이름의 기본 키 색인으로 찾는다.
+
+    연결은 pool_size개를 미리 열어 두고 빌려 쓴다. 같은 파일을 여러 프로세스가
+    열어도 되도록 WAL 모드를 쓴다.
+    """
+
+    def __init__(self, path: Union[Path, str] = ":memory:", pool_size: int = 4) -> None:
+        self.path = str(path)
+        # ":memory:"는 연결마다 다른 데이터베이스가 되므로 이름 붙은 공유 캐시를 쓴다.
+        if self.path == ":memory:":
+            self._target, uri = f"file:users-{id(self)}?mode=memory&cache=shared", True
+        else:
+            self._target, uri = self.path, False
+        self._pool: queue.Queue[sqlite3.Connection] = queue.Queue()
+        for _ in range(pool_size):
+            connection = sqlite3.connect(self._target, uri=uri, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            self._pool.put(connection)
+        with self.connection() as connection:
+            if not uri:
+                connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """풀에서 연결 하나를 빌려 트랜잭션 안에서 쓰고 돌려준다."""
+        connection = self._pool.get()
+        try:
+            with connection:
+                yield connection
+        finally:
+            self._pool.put(connection)
+
+    def close(self) -> None:
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+    def add(
+        self,
+        username: str,
+        password: str,
+        name: str,
+        email: str,
+        role: str,
+        interest: str,
+    ) -> None:
+        if not username:
+            raise ValueError(f"Invalid username {username!r}")
+        if not password:
+            raise ValueError("Invalid password")
+        try:
+            with self.connection() as connection:
+                connection.execute(
+                    "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (username, hash_password(password), name, name.lower(), email, role, interest),
+                )
+        except sqlite3.IntegrityError as ex:
+            raise DuplicateUserError(f"User {username!r} already exists") from ex
+
+    def get(self, username: str) -> Optional[dict[str, str]]:
+        """비밀번호 해시를 뺀 사용자 정보"""
+        with self.connection() as connection:
+            row = connection.execute(
+                f"SELECT {', '.join(FIELDS)} FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        return None if row is None else dict(row)
+
+    def authenticate(self, username: str, password: str) -> bool:
+        with self.connection() as connection:
+            row = connection.execute(
+                "SELECT password FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            # 없는 사용자도 같은 시간이 걸리도록 해시를 한 번 계산한다.
+            check_password(password, hash_password(""))
+            return False
+        return check_password(password, row["password"])
+
+    def search(
+        self, prefix: str, after: Optional[tuple[str, str]] = None, limit: int = 20
+    ) -> list[dict[str, str]]:
+        """이름이 prefix로 시작하는 사용자 한 쪽, after는 앞 쪽 마지막의 (이름 키, 사용자 이름)
+
+        (name_key, username) 색인의 범위 탐색이라 쪽마다 드는 시간이 사용자 수와 무관하다.
+        """
+        low = prefix.lower()
+        high = low + "\U0010ffff"
+        query = f"SELECT {', '.join(FIELDS)}, name_key FROM users WHERE name_key >= ? AND name_key < ?"
+        parameters: list[object] = [low, high]
+        if after is not None:
+            query += " AND (name_key, username) > (?, ?)"
+            parameters.extend(after)
+        query += " ORDER BY name_key, username LIMIT ?"
+        parameters.append(limit)
+        with self.connection() as connection:
+            return [dict(row) for row in connection.execute(query, parameters)]
+
+    def __len__(self) -> int:
+        with self.connection() as connection:
+            return int(connection.execute("SELECT COUNT(*) FROM users").fetchone()[0])
@@ -0,0 +1,31 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 모듈은 src와 bench에 평평하게 놓여 있고 `from model import ...`로 가져온다.
+ROOT = Path(__file__).resolve().parent.parent
+for directory in ("src", "bench"):
+    sys.path.insert(0, str(ROOT / directory))
+
+import synthetic  # noqa: E402
+from model import TrainingData  # noqa: E402
+
+
+@pytest.fixture
+def make_data():
+    """synthetic 데이터를 다섯 행마다 하나씩 테스트 쪽으로 나눈 TrainingData를 만든다."""
+
+    def make(rows: int = 2_000, seed: int = 7) -> TrainingData:
+        features, codes = synthetic.generate(rows, seed)
+        codes = codes.astype(np.int16)
+        testing = np.arange(rows) % 5 == 0
+        return TrainingData.from_arrays(
+            "synthetic",
+            list(synthetic.SPECIES),
+            (features[~testing], codes[~testing]),
+            (features[testing], codes[testing]),
+        )
+
+    return make
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from batching import BatchingApp, MicroBatcher
+from model import ED, Hyperparameter, InvalidSampleError
+
+
+def test_batches_and_restarts(make_data):
+    training_data = make_data()
+    batcher = MicroBatcher(Hyperparameter(5, ED(), training_data))
+
+    async def run() -> list[str]:
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.classify([5.1, 3.5, 1.4, 0.2]) for _ in range(10)))
+        await batcher.stop()
+        await batcher.start()
+        results.append(await batcher.classify([6.6, 3.0, 5.5, 2.0]))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == ["Iris-setosa"] * 10 + ["Iris-virginica"]
+
+
+def test_stop_fails_pending_requests(make_data):
+    training_data = make_data()
+    parameter = Hyperparameter(5, ED(), training_data)
+    release = threading.Event()
+    classify_many = parameter.classify_many
+
+    def slow(queries):
+        release.wait(5)
+        return classify_many(queries)
+
+    parameter.classify_many = slow
+    batcher = MicroBatcher(parameter, max_batch=4)
+
+    async def run() -> list[object]:
+        await batcher.start()
+        requests = [asyncio.ensure_future(batcher.classify([5.1, 3.5, 1.4, 0.2])) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(batcher.stop(), 1)
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert len(results) == 10
+    assert all(isinstance(result, RuntimeError) for result in results)
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.classify([5.1, 3.5, 1.4, 0.2]))
+
+
+def rejecting(training_data):
+    """측정값이 100을 넘는 행이 섞이면 배치 전체가 실패하는 Hyperparameter"""
+    parameter = Hyperparameter(5, ED(), training_data)
+    classify_many = parameter.classify_many
+
+    def checked(queries):
+        if (queries > 100).any():
+            raise InvalidSampleError("measurement out of range")
+        return classify_many(queries)
+
+    parameter.classify_many = checked
+    return parameter
+
+
+def test_bad_request_fails_alone(make_data):
+    training_data = make_data()
+    batcher = MicroBatcher(rejecting(training_data), window=0.05)
+
+    async def run() -> list[object]:
+        await batcher.start()
+        results = await asyncio.gather(
+            batcher.classify([5.1, 3.5, 1.4, 0.2]),
+            batcher.classify([1e9, 1, 1, 1]),
+            batcher.classify([6.6, 3.0, 5.5, 2.0]),
+            return_exceptions=True,
+        )
+        await batcher.stop()
+        return results
+
+    setosa, bad, virginica = asyncio.run(run())
+    assert (setosa, virginica) == ("Iris-setosa", "Iris-virginica")
+    assert isinstance(bad, InvalidSampleError)
+    assert batcher.batches == 1
+
+
+def test_app_answers_errors_with_json(make_data):
+    training_data = make_data()
+    app = BatchingApp(MicroBatcher(rejecting(training_data)), training_data)
+
+    async def call(body: bytes) -> tuple[int, dict]:
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "path": app.path, "method": "POST"}
+        await app(scope, receive, send)
+        return messages[0]["status"], json.loads(messages[1]["body"])
+
+    async def run() -> list[tuple[int, dict]]:
+        await app.batcher.start()
+        answers = [await call(b"[5.1, 3.5, 1.4, 0.2]"), await call(b"[1e9, 1, 1, 1]")]
+        await app.batcher.stop()
+        answers.append(await call(b"[5.1, 3.5, 1.4, 0.2]"))
+        return answers
+
+    ok, invalid, stopped = asyncio.run(run())
+    assert ok == (200, {"species": "Iris-setosa"})
+    assert invalid[0] == 400 and "out of range" in invalid[1]["error"]
+    assert stopped == (500, {"error": "classification failed"})
@@ -0,0 +1,24 @@
+import numpy as np
+
+import benchmark
+from model import CD, ED, MD, SD
+
+
+def test_blocked_distances_match_full_matrix(monkeypatch):
+    monkeypatch.setattr(benchmark.Hyperparameter, "block_budget", 1_000)
+    rng = np.random.default_rng(1)
+    queries, training = rng.random((64, 4)) + 0.1, rng.random((500, 4)) + 0.1
+    for algorithm in (ED(), MD(), CD(), SD()):
+        np.testing.assert_allclose(
+            benchmark.blocked_distances(algorithm, queries, training),
+            algorithm.distances(queries, training).min(axis=1),
+        )
+
+
+def test_failing_case_fails_the_run(monkeypatch):
+    def cases(rows, workdir, seed):
+        return [("fine", 1, lambda: None), ("broken", 1, lambda: 1 / 0)]
+
+    monkeypatch.setattr(benchmark, "cases", cases)
+    assert benchmark.main(["--rows", "150", "--repeat", "1"]) == 1
+    assert benchmark.main(["--rows", "150", "--repeat", "1", "--only", "fine"]) == 0
@@ -0,0 +1,42 @@
+import threading
+
+import numpy as np
+
+from model import ED, Hyperparameter, PredictionCache
+
+
+def test_duplicate_keys_count_as_hits(make_data):
+    training_data = make_data()
+    parameter = Hyperparameter(5, ED(), training_data)
+    cache = parameter.cache = PredictionCache()
+    queries = np.array([[5.1, 3.5, 1.4, 0.2], [5.1, 3.5, 1.4, 0.2], [6.6, 3.0, 5.5, 2.0]])
+    assert parameter.classify_many(queries) == ["Iris-setosa", "Iris-setosa", "Iris-virginica"]
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 2, "evictions": 0}
+    parameter.classify_many(queries)
+    assert cache.stats()["hits"] == 4
+
+
+def test_concurrent_eviction(make_data):
+    training_data = make_data()
+    parameter = Hyperparameter(5, ED(), training_data)
+    cache = parameter.cache = PredictionCache(maxsize=8)
+    expected = Hyperparameter(5, ED(), training_data)
+    queries = training_data.testing.features
+    failures: list[BaseException] = []
+
+    def classify(offset: int) -> None:
+        try:
+            for start in range(offset, len(queries), 16):
+                block = queries[start : start + 16]
+                assert parameter.classify_many(block) == expected.classify_many(block)
+        except BaseException as ex:
+            failures.append(ex)
+
+    threads = [threading.Thread(target=classify, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+    stats = cache.stats()
+    assert stats["size"] <= 8 and stats["evictions"] > 0
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import synthetic
+from cascade import CascadeHyperparameter
+from model import CD, ED, FEATURES, MD, Hyperparameter, Purpose
+
+
+def test_cascade_table_follows_updates(make_data):
+    training_data = make_data(5_000)
+    cascade = CascadeHyperparameter(5, ED(), training_data)
+    exact = Hyperparameter(5, ED(), training_data)
+    table = cascade.cells()
+    certified = table.certified
+    rng = np.random.default_rng(5)
+    features, codes = synthetic.generate(200, seed=9)
+    queries = np.concatenate([training_data.testing.features, features])
+    for row, code in zip(features.tolist(), codes.tolist()):
+        training_data.add(dict(zip(FEATURES, row), species=synthetic.SPECIES[code]), Purpose.Training)
+    for row in rng.integers(0, len(training_data.training), 100).tolist():
+        training_data.remove(row)
+    np.testing.assert_array_equal(cascade.classify_codes(queries), exact.classify_codes(queries))
+    assert cascade.cells() is table
+    assert table.certified < certified
+    for row in rng.integers(0, len(training_data.training), 200).tolist():
+        training_data.remove(row)
+    assert cascade.cells() is not table
+
+
+@pytest.mark.parametrize("algorithm", [ED(), MD(), CD()], ids=lambda a: type(a).__name__)
+def test_cascade_agrees_with_knn(make_data, algorithm):
+    training_data = make_data(5_000)
+    cascade = CascadeHyperparameter(5, algorithm, training_data)
+    cascade.test()
+    assert cascade.stages["cell"] > 0
+    assert cascade.agreement == 1.0
+    assert cascade.quality == cascade.baseline
@@ -0,0 +1,50 @@
+import pytest
+
+from catalog import PrefixIndex, words
+
+NAMES = ["Iris-setosa", "Iris-versicolor", "Iris-virginica", "Setaria viridis", "Viola"]
+
+
+def pages(index, prefix, limit):
+    found, offset = [], 0
+    while offset is not None:
+        page, offset = index.search(prefix, offset, limit)
+        assert len(page) <= limit
+        found.extend(name for name, _ in page)
+    return found
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+@pytest.mark.parametrize("prefix", ["", "i", "v", "se", "VIR", "x"])
+def test_pages_cover_matches_once(prefix, limit):
+    index = PrefixIndex((name, n) for n, name in enumerate(NAMES))
+    expected = [name for name in NAMES if any(word.startswith(prefix.lower()) for word in words(name))]
+    found = pages(index, prefix, limit)
+    assert sorted(found) == sorted(expected)
+
+
+def test_add_keeps_order():
+    index = PrefixIndex((name, n) for n, name in enumerate(NAMES[:3]))
+    index.add("Iris-pumila", 3)
+    assert len(index) == 4
+    assert sorted(pages(index, "iris", 2)) == sorted(NAMES[:3] + ["Iris-pumila"])
+    assert index.search("pum") == ([("Iris-pumila", 3)], None)
+
+
+def test_search_endpoint_pages(make_data):
+    import classifier
+    from model import ED, Hyperparameter
+
+    training_data = make_data(rows=100)
+    classifier._register(training_data, Hyperparameter(3, ED(), training_data))
+    try:
+        client = classifier.app.test_client()
+        found, offset = [], 0
+        while offset is not None:
+            body = client.get(f"/iris/search?q=&limit=1&offset={offset}").get_json()
+            found.extend(result["species"] for result in body["results"])
+            offset = body["next"]
+    finally:
+        for key in ("IRIS_DATA", "IRIS_MODEL", "SPECIES_INDEX"):
+            classifier.app.config.pop(key, None)
+    assert sorted(found) == sorted(training_data.species.names)
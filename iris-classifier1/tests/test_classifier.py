@@ -0,0 +1,113 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+
+import classifier
+from model import ED, Hyperparameter, TrainingData
+import users
+from users import UserStore
+
+
+@pytest.fixture
+def client(make_data):
+    training_data = make_data()
+    classifier.app.config["IRIS_DATA"] = training_data
+    classifier.app.config["IRIS_MODEL"] = Hyperparameter(5, ED(), training_data)
+    yield classifier.app.test_client()
+    for key in ("IRIS_DATA", "IRIS_MODEL"):
+        classifier.app.config.pop(key, None)
+
+
+def classify(client, body):
+    response = client.post("/iris/classify", data=body, content_type="application/json")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_classify_rejects_non_finite_rows(client):
+    results = classify(client, "[[NaN, 1, 1, 1], [5.1, 3.5, 1.4, 0.2], [1, Infinity, 1, 1]]")
+    assert [result["row"] for result in results] == [0, 1, 2]
+    assert "error" in results[0] and "error" in results[2]
+    assert results[1]["species"] == "Iris-setosa"
+
+
+@pytest.mark.parametrize("body, content_type", [
+    ("[[5.1, 3.5", "application/json"),
+    ("[[5.1, 3.5, 1.4, 0.2]]", "text/plain"),
+])
+def test_classify_rejects_malformed_body(client, body, content_type):
+    response = client.post("/iris/classify", data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("invalid batch:")
+
+
+def test_classify_out_of_range_with_int16_model(make_data):
+    training_data = make_data()
+    features, codes = training_data.training.live_arrays()
+    fixed = TrainingData.from_arrays(
+        "fixed",
+        training_data.species.names,
+        (np.rint(features * 100).astype(np.int16), codes),
+        training_data.testing.live_arrays(),
+    )
+    assert fixed.training.scale is not None
+    classifier._register(fixed, Hyperparameter(5, ED(), fixed))
+    try:
+        results = classify(classifier.app.test_client(), "[[5.1, 3.5, 1.4, 0.2], [1e9, 1, 1, 1]]")
+    finally:
+        for key in ("IRIS_DATA", "IRIS_MODEL", "SPECIES_INDEX"):
+            classifier.app.config.pop(key, None)
+    assert results[0]["species"] == "Iris-setosa"
+    assert results[1] == {"row": 1, "error": "measurement out of range for int16 fixed point"}
+
+
+def test_classify_failure_becomes_row_error(client, monkeypatch):
+    parameter = classifier.app.config["IRIS_MODEL"]
+    classify_many = parameter.classify_many
+
+    def failing(queries):
+        if (queries > 100).any():
+            raise ValueError("out of range")
+        return classify_many(queries)
+
+    monkeypatch.setattr(parameter, "classify_many", failing)
+    results = classify(client, "[[5.1, 3.5, 1.4, 0.2], [1e9, 1, 1, 1], [6.6, 3.0, 5.5, 2.0]]")
+    assert results[0]["species"] == "Iris-setosa"
+    assert results[1] == {"row": 1, "error": "out of range"}
+    assert results[2]["species"] == "Iris-virginica"
+
+
+@pytest.fixture
+def user_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(users, "ITERATIONS", 1)
+    classifier.app.config["USER_STORE"] = UserStore(tmp_path / "users.sqlite3", 1)
+    yield classifier.app.test_client()
+    classifier.app.config.pop("USER_STORE").close()
+
+
+def test_add_user_rejects_non_strings(user_client):
+    response = user_client.post("/user", json={"username": "alice", "password": None, "name": "Alice"})
+    assert response.status_code == 400
+    assert user_client.get("/user/alice").status_code == 404
+
+
+def test_search_users_rejects_bad_cursor(user_client):
+    assert user_client.get("/users/search?cursor=zzz").status_code == 400
+    assert user_client.get('/users/search?cursor=[1,2]').status_code == 400
+
+
+def test_user_details_need_authentication(user_client):
+    body = {"username": "alice", "password": "secret", "name": "Alice", "email": "a@example.com"}
+    assert user_client.post("/user", json=body).status_code == 201
+    assert user_client.get("/user/alice").get_json() == {"username": "alice", "name": "Alice"}
+    assert user_client.get("/users/search?q=al").get_json()["results"] == [{"username": "alice", "name": "Alice"}]
+    own = user_client.get("/user/alice", headers={"Authorization": basic("alice", "secret")})
+    assert own.get_json()["email"] == "a@example.com"
+    wrong = user_client.get("/user/alice", headers={"Authorization": basic("alice", "guess")})
+    assert "email" not in wrong.get_json()
+
+
+def basic(username, password):
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
@@ -0,0 +1,26 @@
+import importlib
+from pathlib import Path
+
+import pytest
+
+import model
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULES = sorted(path.stem for directory in ("src", "bench") for path in (ROOT / directory).glob("*.py"))
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_import(name):
+    importlib.import_module(name)
+
+
+def test_known_samples():
+    training = model.TrainingKnownSample(5.1, 3.5, 1.4, 0.2, "Iris-setosa")
+    assert training.purpose == model.Purpose.Training
+    with pytest.raises(AttributeError):
+        training.classify("Iris-setosa")
+    testing = model.TestingKnownSample(5.1, 3.5, 1.4, 0.2, "Iris-setosa")
+    assert testing.classification is None
+    testing.classify("Iris-setosa")
+    assert testing.matches()
+    assert "purpose=Testing" in repr(model.KnownSample(1, 2, 3, 4, model.Purpose.Testing, "x"))
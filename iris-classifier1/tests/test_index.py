@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from model import CD, ED, FEATURES, MD, CountingDealingPartition, Hyperparameter, Purpose
+
+
+def neighbor_distances(parameter, queries):
+    features = parameter._training_data().training_arrays()[0]
+    nearest = parameter.neighbors(queries)
+    distances = parameter.algorithm.distances(queries, features)
+    return np.sort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+
+
+@pytest.mark.parametrize("algorithm", [ED(), MD(), CD()], ids=lambda a: type(a).__name__)
+def test_tree_matches_scan(make_data, algorithm):
+    training_data = make_data()
+    queries = training_data.testing_arrays()
+    tree = Hyperparameter(5, algorithm, training_data)
+    tree.index_thresholds = {algorithm.metric: 0}
+    scan = Hyperparameter(5, algorithm, training_data)
+    scan.index_thresholds = {}
+    assert tree.uses_index(1) and not scan.uses_index(10**9)
+    np.testing.assert_allclose(neighbor_distances(tree, queries), neighbor_distances(scan, queries))
+
+
+def test_incremental_index_matches_scan(make_data):
+    training_data = make_data(3_000)
+    tree = Hyperparameter(5, ED(), training_data)
+    tree.index_thresholds = {"euclidean": 0}
+    scan = Hyperparameter(5, ED(), training_data)
+    scan.index_thresholds = {}
+    index = training_data.index()
+    index.max_pending = 64
+    queries = training_data.testing.features[:100]
+    rng = np.random.default_rng(3)
+    extra = make_data(1_000, seed=11).training
+    for step in range(6):
+        for n in range(100):
+            row = extra[step * 100 + n]
+            training_data.add(
+                {name: getattr(row, name) for name in ("sepal_length", "sepal_width", "petal_length", "petal_width", "species")},
+                Purpose.Training,
+            )
+        # 이미 지운 행을 다시 지우는 경우도 섞는다.
+        for row in rng.integers(0, len(training_data.training), 150).tolist():
+            training_data.remove(row)
+        assert len(index) == training_data.training.live
+        np.testing.assert_allclose(neighbor_distances(tree, queries), neighbor_distances(scan, queries))
+    assert index.compactions > 0
+
+
+def test_counting_dealing_partition_feeds_training_data(make_data):
+    source = make_data(100)
+    rows = [
+        {name: getattr(row, name) for name in (*FEATURES, "species")}
+        for row in (*source.training, *source.testing)
+    ]
+    training_data = make_data(500)
+    before = training_data.training.live, training_data.testing.live
+    partition = CountingDealingPartition(rows, target=training_data)
+    assert len(partition.training) == 80 and len(partition.testing) == 20
+    assert partition.training[0].purpose == Purpose.Training
+    assert training_data.training.live == before[0] + 80
+    assert training_data.testing.live == before[1] + 20
+
+
+def test_grid_index_follows_updates(make_data):
+    training_data = make_data(3_000)
+    parameter = Hyperparameter(5, ED(), training_data, probes=2)
+    queries = training_data.testing.features
+    parameter.neighbors(queries)
+    grid = training_data.grid_index()
+    removed = list(range(0, 500, 3))
+    for row in removed:
+        training_data.remove(row)
+    training_data.add(dict(zip(FEATURES, queries[0].tolist()), species="Iris-setosa"), Purpose.Training)
+    nearest = parameter.neighbors(queries)
+    assert training_data.grid_index() is grid
+    assert not np.isin(nearest, removed).any()
+    assert len(training_data.training) - 1 in nearest[0]
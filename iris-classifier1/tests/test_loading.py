@@ -0,0 +1,61 @@
+import csv
+
+import numpy as np
+
+from model import FEATURES, TrainingData
+
+SPECIES = ("Iris-setosa", "Iris-versicolor", "Iris-virginica")
+
+
+def write_csv(path, rows):
+    with path.open("w", newline="") as target:
+        csv.writer(target, lineterminator="\n").writerows(rows)
+
+
+def sample_rows(count):
+    features = np.random.default_rng(5).uniform(0.1, 8.0, (count, len(FEATURES))).round(1)
+    return [[*row, SPECIES[n % len(SPECIES)]] for n, row in enumerate(features.tolist())]
+
+
+def test_load_csv_reports_rejected_rows(tmp_path):
+    rows = sample_rows(20)
+    rows[3] = ["x", 1, 1, 1, "Iris-setosa"]
+    rows[7] = [1, 2, 3]
+    write_csv(tmp_path / "rows.csv", rows)
+    training_data = TrainingData("rows")
+    report = training_data.load_csv(tmp_path / "rows.csv")
+    assert report.rows == 18
+    assert [row for row, _ in report.rejected] == [4, 8]
+    assert "'x,1,1,1,Iris-setosa'" in report.rejected[0][1]
+    assert len(training_data.training) + len(training_data.testing) == 18
+
+
+def test_load_csv_progress(tmp_path):
+    write_csv(tmp_path / "rows.csv", sample_rows(2_000))
+    seen = []
+    report = TrainingData("rows").load_csv(
+        tmp_path / "rows.csv", chunk_bytes=4_096, progress=lambda report: seen.append(report.progress)
+    )
+    assert len(seen) > 1
+    assert seen == sorted(seen) and seen[-1] == 1.0
+    assert report.rows == 2_000 and report.rows_per_second > 0
+
+
+def test_load_and_load_csv_split_alike(tmp_path):
+    rows = sample_rows(50)
+    rows[2] = ["bad", 1, 1, 1, "Iris-setosa"]
+    write_csv(tmp_path / "rows.csv", rows)
+    from_csv = TrainingData("csv")
+    from_csv.load_csv(tmp_path / "rows.csv")
+    from_rows = TrainingData("rows")
+    report = from_rows.load(dict(zip((*FEATURES, "species"), map(str, row))) for row in rows)
+    assert [row for row, _ in report.rejected] == [3]
+    for side in ("training", "testing"):
+        np.testing.assert_array_equal(
+            getattr(from_rows, side).features, getattr(from_csv, side).features
+        )
+        assert names(from_rows, side) == names(from_csv, side)
+
+
+def names(training_data, side):
+    return [training_data.species.names[code] for code in getattr(training_data, side).codes.tolist()]
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import classifier
+import metrics
+from model import ED, Hyperparameter
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def sample(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+@pytest.fixture
+def client(make_data):
+    training_data = make_data()
+    classifier.app.config["IRIS_DATA"] = training_data
+    classifier.app.config["IRIS_MODEL"] = Hyperparameter(5, ED(), training_data)
+    yield classifier.app.test_client()
+    for key in ("IRIS_DATA", "IRIS_MODEL"):
+        classifier.app.config.pop(key, None)
+
+
+@pytest.mark.parametrize("value, expected", [(None, False), ("0", False), ("1", True)])
+def test_enabled_from_environment(value, expected):
+    env = {key: item for key, item in os.environ.items() if key != "IRIS_METRICS"}
+    if value is not None:
+        env["IRIS_METRICS"] = value
+    output = subprocess.run(
+        [sys.executable, "-c", "import metrics; print(metrics.enabled)"],
+        cwd=ROOT / "src", env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.strip() == str(expected)
+
+
+def test_counters_move_when_enabled(client, monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    before = client.get("/metrics").get_data(as_text=True)
+    response = client.post("/iris/classify", json=[[5.1, 3.5, 1.4, 0.2], [6.6, 3.0, 5.5, 2.0]])
+    response.get_data()
+    after = client.get("/metrics")
+    assert after.mimetype == "text/plain"
+    text = after.get_data(as_text=True)
+    assert "# TYPE iris_queries_total counter" in text
+    assert sample(text, "iris_queries_total") == sample(before, "iris_queries_total") + 2
+    requests = 'iris_request_seconds_count{endpoint="classify_irises"}'
+    assert sample(text, requests) == sample(before, requests) + 1
+
+
+def test_nothing_recorded_when_disabled(client, monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", False)
+    before = metrics.REGISTRY.render()
+    client.post("/iris/classify", json=[[5.1, 3.5, 1.4, 0.2]]).get_data()
+    assert metrics.REGISTRY.render() == before
@@ -0,0 +1,179 @@
+import io
+
+import numpy as np
+import pytest
+
+from model import (
+    ED,
+    InvalidSampleError,
+    Hyperparameter,
+    KFoldSamplePartition,
+    Purpose,
+    Sample,
+    ShufflingSamplePartition,
+    TrainingData,
+    TrainingKnownSample,
+    line_chunks,
+    parse_csv,
+)
+import model
+import synthetic
+import tuning
+
+
+def test_nearest_without_training_rows(make_data):
+    training_data = make_data(rows=50)
+    for row in training_data.training.live_rows().tolist():
+        training_data.remove(row)
+    parameter = Hyperparameter(3, ED(), training_data)
+    with pytest.raises(ValueError, match="No training samples"):
+        parameter.nearest(Sample(5.1, 3.5, 1.4, 0.2))
+    with pytest.raises(ValueError, match="No training samples"):
+        parameter.classify_scalar(Sample(5.1, 3.5, 1.4, 0.2))
+
+
+def test_nearest_matches_neighbors(make_data):
+    training_data = make_data(rows=500)
+    parameter = Hyperparameter(5, ED(), training_data)
+    query = training_data.testing.features[0]
+    rows = [row for _, row in parameter.nearest(Sample(*query.tolist()))]
+    assert sorted(rows) == sorted(parameter.neighbors(query[np.newaxis])[0].tolist())
+
+
+@pytest.mark.parametrize("partition", [
+    lambda dicts: ShufflingSamplePartition(dicts, seed=1),
+    lambda dicts: KFoldSamplePartition(dicts, folds=4, seed=1),
+])
+def test_partition_views_read_back(partition):
+    dicts = synthetic.sample_dicts(40, seed=3)
+    partition = partition(dicts)
+    training, testing = partition.training, partition.testing
+    assert len(training) + len(testing) == len(dicts)
+    assert sorted(training.index.tolist() + testing.index.tolist()) == list(range(len(dicts)))
+    first = training[0]
+    assert isinstance(first, TrainingKnownSample) and first.purpose == Purpose.Training
+    row = dicts[training.index[0]]
+    assert (first.sepal_length, first.species) == (row["sepal_length"], row["species"])
+    samples = list(testing)
+    assert all(isinstance(sample, model.TestingKnownSample) for sample in samples)
+    assert [sample.petal_width for sample in samples] == [row["petal_width"] for row in testing.dicts()]
+    assert len(training[1:3]) == 2
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.int16])
+@pytest.mark.parametrize("row", [[np.nan, 1, 1, 1], [1, np.inf, 1, 1]])
+def test_encode_rejects_non_finite(dtype, row):
+    store = model.TrainingData("store", dtype).training
+    with pytest.raises(InvalidSampleError):
+        store.encode(np.array([row]))
+
+
+def test_encode_rejects_out_of_range():
+    store = model.TrainingData("store", np.int16).training
+    with pytest.raises(InvalidSampleError):
+        store.encode(np.array([[1e9, 1, 1, 1]]))
+    assert store.encode(np.array([[5.1, 3.5, 1.4, 0.2]])).tolist() == [[510, 350, 140, 20]]
+
+
+def test_int16_quality_close_to_float64(make_data):
+    # synthetic 값은 0.1 단위라 그대로면 0.01 고정 소수점에 딱 맞으므로 잡음을 더한다.
+    source = make_data(rows=3_000)
+    rng = np.random.default_rng(11)
+    features, codes = source.training.live_arrays()
+    features = features + rng.normal(0, 0.02, features.shape)
+    testing = source.testing.live_arrays()
+    training_data = TrainingData.from_arrays(
+        "float", source.species.names, (features, codes), testing
+    )
+    fixed = TrainingData.from_arrays(
+        "fixed",
+        source.species.names,
+        (np.rint(features * 100).astype(np.int16), codes),
+        testing,
+    )
+    exact = Hyperparameter(5, ED(), training_data)
+    exact.test()
+    quantized = Hyperparameter(5, ED(), fixed)
+    quantized.test()
+    assert abs(quantized.quality - exact.quality) <= 0.01
+
+
+def test_line_chunks_and_parse_csv():
+    source = (
+        b"sepal_length,sepal_width,petal_length,petal_width,species\n"
+        b"5.1,3.5,1.4,0.2,Iris-setosa\n"
+        b"x,1,1,1,Iris-setosa\n"
+        b"\n"
+        b"5.9,3.0,4.2,1.5,Iris-versicolor,extra\n"
+        b"1,2,3\n"
+        b"6.6,3.0,5.5,2.0,Iris-virginica"
+    )
+    for chunk_bytes in (16, 1 << 20):
+        rows: list[list[float]] = []
+        names: list[str] = []
+        lines: list[int] = []
+        errors: dict[int, str] = {}
+        for first_line, data in line_chunks(io.BytesIO(source), chunk_bytes, skip_header=True):
+            features, species, numbers, rejected = parse_csv(data.decode(), first_line, labelled=True)
+            rows.extend(features.tolist())
+            names.extend(species.tolist())
+            lines.extend(numbers.tolist())
+            errors.update(rejected)
+        assert names == ["Iris-setosa", "Iris-versicolor", "Iris-virginica"]
+        assert rows[1] == [5.9, 3.0, 4.2, 1.5]
+        assert lines == [2, 5, 7]
+        assert sorted(errors) == [3, 6]
+    features, species, numbers, errors = parse_csv("1,2,3,4\n5,6,7\n", 10, labelled=False)
+    assert species is None and features.tolist() == [[1, 2, 3, 4]] and list(errors) == [11]
+    assert numbers.tolist() == [10]
+
+
+def test_parse_csv_rejects_comment_lines():
+    text = "5.1,3.5,1.4,0.2, Iris-setosa \n#5.0,3.4,1.5,0.2,Iris-setosa\n6.6,3.0,5.5,2.0,Iris-virginica\n"
+    features, species, numbers, errors = parse_csv(text, 1, labelled=True)
+    assert species.tolist() == ["Iris-setosa", "Iris-virginica"]
+    assert numbers.tolist() == [1, 3] and list(errors) == [2]
+    # 빠른 경로도 품종 이름의 공백을 뗀다.
+    _, species, _, errors = parse_csv("5.1,3.5,1.4,0.2, Iris-setosa \n", 1, labelled=True)
+    assert species.tolist() == ["Iris-setosa"] and not errors
+
+
+def test_only_named_first_line_is_header():
+    def first_lines(source):
+        return [first for first, _ in line_chunks(io.BytesIO(source), 1 << 20, skip_header=True)]
+
+    assert first_lines(b"sepal_length,sepal_width,petal_length,petal_width,species\n1,2,3,4,a\n") == [2]
+    assert first_lines(b'"Sepal.Length","Sepal.Width","Petal.Length","Petal.Width"\n1,2,3,4\n') == [2]
+    assert first_lines(b"5.1;3.5;1.4;0.2;Iris-setosa\n1,2,3,4,a\n") == [1]
+    assert first_lines(b"x,1,1,1,Iris-setosa\n1,2,3,4,a\n") == [1]
+
+
+def test_with_dtype_round_trip(make_data):
+    training_data = make_data(rows=2_000)
+    fixed = training_data.with_dtype(np.int16)
+    single = fixed.with_dtype(np.float32)
+    assert fixed.training.features.dtype == np.int16
+    assert single.training.features.dtype == np.float32
+    np.testing.assert_allclose(
+        single.training.measurements(), training_data.training.measurements(), atol=1e-5
+    )
+    qualities = []
+    for data in (training_data, fixed, single):
+        parameter = Hyperparameter(5, ED(), data)
+        parameter.test()
+        qualities.append(parameter.quality)
+    assert qualities[1] == pytest.approx(qualities[0], abs=0.005)
+    assert qualities[2] == pytest.approx(qualities[0], abs=0.005)
+
+
+def test_compare_precision(make_data):
+    training_data = make_data(rows=2_000)
+    parameter = Hyperparameter(5, ED(), training_data)
+    results = tuning.compare_precision(training_data, parameter, (np.float64, np.int16, np.float32))
+    assert list(results) == ["float64", "int16", "float32"]
+    assert results["float64"]["difference"] == 0
+    assert results["int16"]["bytes"] < results["float32"]["bytes"] < results["float64"]["bytes"]
+    fixed = training_data.with_dtype(np.int16)
+    results = tuning.compare_precision(fixed, Hyperparameter(5, ED(), fixed), (np.float32,))
+    assert list(results) == ["int16", "float32"]
+    assert abs(results["float32"]["difference"]) <= 0.005
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+import classifier
+from model import TrainingData
+import prefork
+
+
+@pytest.fixture(autouse=True)
+def unregister():
+    yield
+    for key in ("IRIS_DATA", "IRIS_MODEL", "SPECIES_INDEX"):
+        classifier.app.config.pop(key, None)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.int16])
+def test_load_warms_up_any_storage(make_data, tmp_path, dtype):
+    source = make_data(rows=600)
+    features, codes = source.training.live_arrays()
+    if dtype is np.int16:
+        features = np.rint(features * 100).astype(np.int16)
+    training_data = TrainingData.from_arrays(
+        "stored", source.species.names, (features, codes), source.testing.live_arrays()
+    )
+    training_data.save(tmp_path / "data.irisds")
+    parameter = prefork.load(tmp_path / "data.irisds", k=3)
+    assert parameter.k == 3
+    assert parameter.classify_many(np.array([[5.1, 3.5, 1.4, 0.2]])) == ["Iris-setosa"]
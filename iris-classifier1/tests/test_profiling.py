@@ -0,0 +1,73 @@
+import pstats
+
+import pytest
+
+import classifier
+from profiling import RequestProfiler
+
+
+def busy() -> int:
+    return sum(i * i for i in range(200_000))
+
+
+def test_sample_mode_writes_folded_stacks(tmp_path):
+    profiler = RequestProfiler(tmp_path, min_interval=0, interval=0.0005)
+    session = profiler.start("req-1/../x", "sample")
+    busy()
+    session.finish()
+    assert session.target == tmp_path / "req-1x.folded"
+    lines = session.target.read_text().splitlines()
+    assert lines and all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+    assert any("busy (test_profiling.py" in line for line in lines)
+
+
+def test_cprofile_mode_writes_pstats(tmp_path):
+    profiler = RequestProfiler(tmp_path, min_interval=0)
+    session = profiler.start("abc", "cprofile")
+    busy()
+    session.finish()
+    session.finish()
+    assert session.target == tmp_path / "abc.prof"
+    functions = {name for _, _, name in pstats.Stats(str(session.target)).stats}
+    assert "busy" in functions
+    with pytest.raises(ValueError):
+        profiler.start("abc", "perf")
+
+
+def test_one_profile_at_a_time_and_min_interval(tmp_path):
+    profiler = RequestProfiler(tmp_path, min_interval=60)
+    session = profiler.start("first", "cprofile")
+    assert session is not None
+    assert profiler.start("second", "cprofile") is None
+    session.finish()
+    assert profiler.start("third", "cprofile") is None
+    assert (profiler.started, profiler.skipped) == (1, 2)
+    assert [path.name for path in tmp_path.iterdir()] == ["first.prof"]
+
+
+def test_keeps_newest_profiles(tmp_path):
+    profiler = RequestProfiler(tmp_path, min_interval=0, keep=2)
+    for name in ("a", "b", "c"):
+        profiler.start(name, "cprofile").finish()
+    names = {path.name for path in tmp_path.iterdir()}
+    assert len(names) == 2 and "c.prof" in names
+
+
+def test_profiles_requests_by_request_id(tmp_path, monkeypatch):
+    for key, value in (
+        ("PROFILING", "header"),
+        ("PROFILE_DIRECTORY", str(tmp_path)),
+        ("PROFILE_MIN_INTERVAL", 0),
+    ):
+        monkeypatch.setitem(classifier.app.config, key, value)
+    monkeypatch.delitem(classifier.app.config, "PROFILER", raising=False)
+    client = classifier.app.test_client()
+
+    response = client.get("/metrics")
+    assert "X-Profile-Id" not in response.headers
+    response = client.get("/metrics", headers={"X-Profile": "cprofile", "X-Request-Id": "req-42"})
+    response.close()
+    assert response.headers["X-Profile-Id"] == "req-42.prof"
+    assert (tmp_path / "req-42.prof").exists()
+    assert classifier.app.config["PROFILER"].started == 1
+    classifier.app.config.pop("PROFILER")
@@ -0,0 +1,49 @@
+import csv
+import io
+
+import pytest
+
+import score
+import snapshot
+from model import ED, Hyperparameter
+
+
+@pytest.fixture
+def model_path(make_data, tmp_path):
+    training_data = make_data(rows=500)
+    target = tmp_path / "data.irismdl"
+    snapshot.save_model(Hyperparameter(5, ED(), training_data), target)
+    yield target
+    score._parameter = score._training_data = None
+    score._options.clear()
+
+
+def run(model_path, tmp_path, capsysbinary, source, *options):
+    path = tmp_path / "measurements.csv"
+    path.write_bytes(source)
+    assert score.main([str(model_path), str(path), "--workers", "1", *options]) == 0
+    return list(csv.DictReader(io.StringIO(capsysbinary.readouterr().out.decode())))
+
+
+def test_score_keeps_lines_after_comment(model_path, tmp_path, capsysbinary):
+    source = (
+        b"sepal_length,sepal_width,petal_length,petal_width\n"
+        b"5.1,3.5,1.4,0.2\n"
+        b"# measured 2024-05-01\n"
+        b"\n"
+        b"6.6,3.0,5.5,2.0\n"
+        b"5.0,3.4,1.5,0.2\n"
+    )
+    rows = run(model_path, tmp_path, capsysbinary, source)
+    assert [int(row["line"]) for row in rows] == [2, 3, 5, 6]
+    assert [bool(row["error"]) for row in rows] == [False, True, False, False]
+    assert [row["species"] for row in rows] == ["Iris-setosa", "", "Iris-virginica", "Iris-setosa"]
+
+
+def test_score_rejects_bad_lines(model_path, tmp_path, capsysbinary):
+    source = b"5.1;3.5;1.4;0.2\n5.1,3.5,1.4,0.2\n1,2,x,4\n6.6,3.0,5.5,2.0\n"
+    rows = run(model_path, tmp_path, capsysbinary, source, "--output", "csv")
+    assert [(int(row["line"]), bool(row["error"])) for row in rows] == [
+        (1, True), (2, False), (3, True), (4, False)
+    ]
+    assert rows[3]["species"] == "Iris-virginica"
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from model import ED, MD, Hyperparameter
+import shards
+
+
+METRICS = {
+    ED: lambda difference: np.sqrt((difference**2).sum(axis=-1)),
+    MD: lambda difference: np.abs(difference).sum(axis=-1),
+}
+
+
+@pytest.mark.parametrize("algorithm", [ED, MD])
+def test_sharded_matches_single_process(make_data, algorithm):
+    training_data = make_data(rows=1_500)
+    queries = training_data.testing.measurements()
+    single = Hyperparameter(5, algorithm(), training_data)
+    with shards.LocalShards(training_data, 3) as local:
+        with shards.ShardPool(local.addresses, local.authkey, timeout=30) as pool:
+            sharded = shards.ShardedHyperparameter(5, algorithm(), training_data, pool)
+            distances, rows, codes = pool.top_k(queries, 5, algorithm.__name__)
+            assert not pool.missing
+            np.testing.assert_array_equal(
+                sharded.classify_codes(queries), single.classify_codes(queries)
+            )
+    # 거리가 같은 행은 어느 쪽을 골라도 되므로 행 대신 거리를 비교한다.
+    training = training_data.training.measurements()
+    expected = single.neighbors(queries, ordered=True)
+    found = METRICS[algorithm](training[rows] - queries[:, np.newaxis])
+    np.testing.assert_allclose(found, METRICS[algorithm](training[expected] - queries[:, np.newaxis]))
+    np.testing.assert_allclose(distances, found)
+
+
+def test_pool_requires_shared_key(monkeypatch):
+    monkeypatch.delenv(shards.KEY_VARIABLE, raising=False)
+    with pytest.raises(shards.ShardError):
+        shards.ShardPool([("127.0.0.1", 9100)])
+    with pytest.raises(SystemExit):
+        shards.main(["serve", "missing.irisds", "--shard", "0", "--of", "1"])
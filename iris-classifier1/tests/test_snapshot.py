@@ -0,0 +1,41 @@
+import json
+
+import numpy as np
+import pytest
+
+import dataset
+from model import ED, Hyperparameter, TrainingData
+import snapshot
+
+
+def test_open_source_dispatches_on_magic(make_data, tmp_path):
+    training_data = make_data(rows=500)
+    parameter = Hyperparameter(3, ED(), training_data)
+    dataset.save(training_data, tmp_path / "data.irisds")
+    snapshot.save_model(parameter, tmp_path / "data.irismdl")
+
+    opened, restored = TrainingData.open_source(tmp_path / "data.irisds")
+    assert restored is None
+    np.testing.assert_array_equal(opened.training.features, training_data.training.features)
+
+    opened, restored = TrainingData.open_source(tmp_path / "data.irismdl")
+    assert restored is not None and restored.k == 3
+    np.testing.assert_array_equal(opened.testing.codes, training_data.testing.codes)
+
+
+@pytest.mark.parametrize("where", ["header", "array"])
+def test_snapshot_rejects_corruption(make_data, tmp_path, where):
+    training_data = make_data(rows=500)
+    target = tmp_path / "data.irismdl"
+    snapshot.save_model(Hyperparameter(3, ED(), training_data), target)
+    data = bytearray(target.read_bytes())
+    size = snapshot.PREFIX.unpack_from(data)[2]
+    if where == "header":
+        position = snapshot.PREFIX.size + size // 2
+    else:
+        header = json.loads(data[snapshot.PREFIX.size : snapshot.PREFIX.size + size])
+        position = header["arrays"]["training_features"]["offset"] + 3
+    data[position] ^= 0xFF
+    target.write_bytes(bytes(data))
+    with pytest.raises(snapshot.SnapshotError, match="checksum"):
+        snapshot.open_model(target)
@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+import pytest
+
+import classifier
+from model import ED, FEATURES, Hyperparameter, Purpose
+
+
+@pytest.fixture
+def training_data(make_data):
+    training_data = make_data(rows=600)
+    classifier._register(training_data, Hyperparameter(5, ED(), training_data))
+    yield training_data
+    for key in ("IRIS_DATA", "IRIS_MODEL", "SPECIES_INDEX"):
+        classifier.app.config.pop(key, None)
+
+
+@pytest.fixture
+def client(training_data):
+    return classifier.app.test_client()
+
+
+def expected(store, names):
+    """live 행에서 바로 다시 센 품종별 개수, 평균, 최솟값, 최댓값"""
+    features, codes = store.live_arrays()
+    features = store.decode(features)
+    result = {}
+    for code, name in enumerate(names):
+        rows = features[codes == code]
+        if len(rows):
+            result[name] = (len(rows), rows.mean(axis=0), rows.min(axis=0), rows.max(axis=0))
+    return result
+
+
+def assert_matches(summary, store, names):
+    recount = expected(store, names)
+    assert set(summary) == set(recount)
+    for name, (count, mean, minimum, maximum) in recount.items():
+        assert summary[name]["count"] == count
+        for column, feature in enumerate(FEATURES):
+            values = summary[name]["features"][feature]
+            assert values["mean"] == pytest.approx(mean[column])
+            assert values["min"] == pytest.approx(minimum[column])
+            assert values["max"] == pytest.approx(maximum[column])
+
+
+def test_open_does_not_aggregate(make_data):
+    training_data = make_data(rows=600)
+    assert training_data.training._aggregated == 0
+    assert training_data.testing._aggregated == 0
+    training_data.statistics(Purpose.Training)
+    assert training_data.training._aggregated == len(training_data.training)
+    assert training_data.testing._aggregated == 0
+
+
+def test_stats_by_purpose(client, training_data):
+    names = training_data.species.names
+    for purpose, store in (("training", training_data.training), ("testing", training_data.testing)):
+        response = client.get(f"/iris/stats?purpose={purpose}")
+        assert response.status_code == 200
+        assert_matches(response.get_json(), store, names)
+    total = client.get("/iris/stats").get_json()
+    assert sum(species["count"] for species in total.values()) == (
+        training_data.training.live + training_data.testing.live
+    )
+    assert client.get("/iris/stats?purpose=other").status_code == 400
+
+
+def test_stats_follow_add_and_remove(client, training_data):
+    store = training_data.training
+    names = training_data.species.names
+    client.get("/iris/stats?purpose=training")
+    # 어느 품종의 최솟값이던 행을 지우면 그 품종만 다시 센다.
+    features, codes = store.decode(store.features), store.codes
+    smallest = int(np.flatnonzero(codes == codes[0])[np.argmin(features[codes == codes[0], 0])])
+    training_data.remove(smallest)
+    training_data.remove(1)
+    training_data.add(dict(zip(FEATURES, ("9.9", "0.1", "0.1", "0.1")), species=names[0]), Purpose.Training)
+    training_data.add(dict(zip(FEATURES, ("1.0", "1.0", "1.0", "1.0")), species="Iris-new"), Purpose.Training)
+    summary = client.get("/iris/stats?purpose=training").get_json()
+    assert_matches(summary, store, training_data.species.names)
+    assert summary[names[0]]["features"][FEATURES[0]]["max"] == pytest.approx(9.9)
+    assert summary["Iris-new"]["count"] == 1
+
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_list_pages_through_live_rows(client, training_data):
+    store = training_data.training
+    training_data.remove(3)
+    seen, offset = [], 0
+    while True:
+        response = client.get(f"/iris/list?limit=128&offset={offset}")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        seen.extend(lines(response))
+        if "X-Next-Offset" not in response.headers:
+            break
+        offset = int(response.headers["X-Next-Offset"])
+    assert [sample["row"] for sample in seen] == store.live_rows().tolist()
+    features = store.decode(store.features[store.live_rows()])
+    np.testing.assert_allclose([[sample[feature] for feature in FEATURES] for sample in seen], features)
+
+
+def test_list_filters(client, training_data):
+    name = training_data.species.names[1]
+    samples = lines(client.get(f"/iris/list?purpose=testing&species={name}&limit=100000"))
+    store = training_data.testing
+    assert [sample["row"] for sample in samples] == np.flatnonzero(store.codes == 1).tolist()
+    assert {sample["species"] for sample in samples} == {name}
+    assert client.get("/iris/list?species=Iris-unknown").status_code == 404
+    assert client.get("/iris/list?purpose=other").status_code == 400
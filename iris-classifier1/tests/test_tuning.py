@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from model import CD, ED, FEATURES, MD, Hyperparameter, KFoldSamplePartition, TrainingData
+import tuning
+
+
+def sample_dicts(training_data):
+    return [
+        {name: getattr(row, name) for name in (*FEATURES, "species")}
+        for row in (*training_data.training, *training_data.testing)
+    ]
+
+
+def test_grid_search_matches_serial_test(make_data):
+    training_data = make_data(rows=1_000)
+    found = tuning.grid_search(training_data, [1, 3, 5], [ED, MD, CD], max_workers=2)
+    assert [(parameter.k, type(parameter.algorithm)) for parameter in found] == [
+        (k, algorithm) for k in (1, 3, 5) for algorithm in (ED, MD, CD)
+    ]
+    for parameter in found:
+        serial = Hyperparameter(parameter.k, type(parameter.algorithm)(), training_data)
+        serial.test()
+        assert parameter.quality == serial.quality
+        assert parameter.elapsed > 0
+
+
+def test_sweep_matches_per_k_test(make_data):
+    training_data = make_data(rows=1_000)
+    swept = training_data.sweep([ED(), MD(), CD()], 7)
+    assert len(swept) == 21
+    for parameter in swept:
+        single = Hyperparameter(parameter.k, type(parameter.algorithm)(), training_data)
+        single.test()
+        assert parameter.quality == single.quality, (parameter.k, type(parameter.algorithm))
+
+
+@pytest.mark.parametrize("seed", [None, 3])
+def test_folds_are_disjoint_and_cover(make_data, seed):
+    partition = KFoldSamplePartition(sample_dicts(make_data(103, seed=2)), folds=4, seed=seed)
+    tested = []
+    for fold in range(partition.folds):
+        training, testing = partition.fold_rows(fold)
+        assert not set(training.tolist()) & set(testing.tolist())
+        assert sorted(training.tolist() + testing.tolist()) == list(range(len(partition)))
+        tested.extend(testing.tolist())
+    assert sorted(tested) == list(range(len(partition)))
+
+
+def test_cross_validate_matches_per_fold_test(make_data):
+    partition = KFoldSamplePartition(sample_dicts(make_data(400, seed=4)), folds=4, seed=1)
+    k_max = 5
+    qualities = tuning.cross_validate(partition, MD(), k_max)
+    # 동점 투표는 작은 코드가 이기므로 cross_validate처럼 처음 나온 순서로 코드를 붙인다.
+    species = list(dict.fromkeys(row["species"] for row in partition))
+    expected = np.zeros(k_max)
+    for fold in range(partition.folds):
+        sides = []
+        for rows in partition.fold_rows(fold):
+            sides.append((
+                np.array([[partition[n][name] for name in FEATURES] for n in rows]),
+                np.array([species.index(partition[n]["species"]) for n in rows], dtype=np.int16),
+            ))
+        training_data = TrainingData.from_arrays(f"fold {fold}", species, *sides)
+        for k in range(1, k_max + 1):
+            parameter = Hyperparameter(k, MD(), training_data)
+            parameter.test()
+            expected[k - 1] += parameter.quality
+    np.testing.assert_allclose(qualities, expected / partition.folds)